@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# BUILTIN modules
+from typing import List
+
+# Third party modules
+from fastapi import APIRouter, Query, Response, status
+
+# Local modules
+from .models import QueryStats
+from ..core import query_stats
+from ..core.responses import FastJSONResponse
+from ..core.database import async_engine, async_read_engine
+from ..core.metrics import CONTENT_TYPE, render, update_pool_gauges
+
+# Constants
+ROUTER = APIRouter(prefix="/tracking", tags=["Admin"])
+""" Admin endpoint router. """
+
+
+# ---------------------------------------------------------
+#
+@ROUTER.get(
+    "/metrics",
+    response_class=Response,
+    responses={200: {"content": {CONTENT_TYPE: {}}}},
+)
+async def read_metrics() -> Response:
+    """**Return the service metrics in the Prometheus text format.**
+
+    The metrics are request latency histograms, status code counts and
+    in-flight requests per route, changed rows per table, write
+    transaction commits and rollbacks, DB connection acquire wait
+    histograms and checked out pool connections.
+
+    Returns:
+        Prometheus text exposition.
+    """
+    engines = {'writer': async_engine}
+
+    if async_read_engine is not async_engine:
+        engines['reader'] = async_read_engine
+
+    update_pool_gauges(engines)
+    return Response(render(), media_type=CONTENT_TYPE)
+
+
+# ---------------------------------------------------------
+#
+@ROUTER.get(
+    "/admin/queries",
+    response_model=List[QueryStats],
+)
+async def read_query_stats(
+        limit: int = Query(50, ge=1, description="Max number of statement fingerprints.")
+) -> FastJSONResponse:
+    """**Return the SQL statement statistics, with the largest total time first.**
+
+    The statements are grouped by fingerprint, where literals, IN lists
+    and multi-row VALUES lists are normalized. The query plan is included
+    for statements that have been slower than the slow-query threshold.
+
+    Args:
+        limit: Max number of statement fingerprints.
+
+    Returns:
+        Statistics per statement fingerprint.
+    """
+    return FastJSONResponse(query_stats.snapshot(limit))
+
+
+# ---------------------------------------------------------
+#
+@ROUTER.delete(
+    "/admin/queries",
+    status_code=204,
+)
+async def delete_query_stats() -> Response:
+    """**Remove all collected SQL statement statistics.**
+
+    Returns:
+        Response with status code 204.
+    """
+    query_stats.reset()
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+query_stats_documentation = {
+    "fingerprint": 'UPDATE sms_documents SET state=? WHERE sms_documents."UBID" = ?',
+    "count": 42,
+    "total_ms": 1251.233,
+    "mean_ms": 29.791,
+    "p50_ms": 27.514,
+    "p95_ms": 41.022,
+    "p99_ms": 57.318,
+    "max_ms": 57.318,
+    "plan": ["SEARCH sms_documents USING INDEX sqlite_autoindex_sms_documents_1 (UBID=?)"],
+    "slow_request_id": "6f1c0a9e3b2d4c5e8f7a6b5c4d3e2f1a"
+}
+""" OpenAPI QueryStats example documentation. """
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# BUILTIN modules
+from typing import List, Optional
+
+# Third party modules
+from sqlmodel import SQLModel
+from pydantic import ConfigDict
+
+# Local modules
+from .documentation import query_stats_documentation
+
+
+# -----------------------------------------------------------------------------
+#
+class QueryStats(SQLModel):
+    """ Aggregated executions of one statement fingerprint.
+
+    The percentiles are calculated from the most recent executions.
+
+    Attributes:
+        fingerprint: Statement with literals and value lists normalized.
+        count: Number of executions.
+        total_ms: Total execution time in milliseconds.
+        mean_ms: Mean execution time in milliseconds.
+        p50_ms: Median execution time in milliseconds.
+        p95_ms: 95th percentile execution time in milliseconds.
+        p99_ms: 99th percentile execution time in milliseconds.
+        max_ms: Longest execution time in milliseconds.
+        plan: Query plan, when the statement has been slow.
+        slow_request_id: X-Request-ID of the last request where it was slow.
+    """
+    model_config = ConfigDict(json_schema_extra={"example": query_stats_documentation})
+
+    fingerprint: str
+    count: int
+    total_ms: float
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    plan: Optional[List[str]] = None
+    slow_request_id: Optional[str] = None
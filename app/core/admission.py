@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+
+Admission control of the bulk document upserts.
+
+The request body of a bulk upsert is parsed (and kept in memory) before
+the route runs, and then it waits for the single DB writer. Without a
+limit, a few aggressive loaders can pile up any number of parsed
+payloads. The middleware decides before the body is received:
+
+  - At most ``max_concurrent`` bulk upserts run at the same time, the
+    rest wait in FIFO order (the body stays in the socket buffers while
+    waiting, since the server only reads as much as the app receives).
+  - The request body bytes of the running and waiting upserts are capped
+    by ``max_queued_bytes``. A request that doesn't fit is rejected at
+    once with 503 and a Retry-After header, like a request that waits
+    longer than ``max_wait``.
+  - A request without a Content-Length is rejected with 411, and one that
+    could never fit with 413. The streaming upload route is meant for
+    bodies of unknown size, it takes a concurrency slot (from the same
+    controller) without adding to the queued bytes.
+
+The wait is short by default (see ``AdmissionLimits``), so a saturated
+service rejects at once rather than building up a queue. The running,
+waiting and queued bytes are exported as metrics gauges.
+"""
+
+# BUILTIN modules
+import re
+import asyncio
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+# Third party modules
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# Local modules
+from .config import config, AdmissionLimits
+from .metrics import BULK_ACTIVE, BULK_QUEUED_BYTES, BULK_REJECTED, BULK_WAITING
+
+
+# -----------------------------------------------------------------------------
+#
+class AdmissionController:
+    """ A FIFO concurrency limit, with a cap on the queued request body bytes.
+
+    It's only used on the event loop thread, so no locks are needed.
+
+    Attributes:
+        limits: Admission control limits.
+        active: Number of admitted requests.
+        queued_bytes: Body bytes of the admitted and waiting requests.
+    """
+
+    def __init__(self, limits: AdmissionLimits):
+        """ The class constructor.
+
+        Args:
+            limits: Admission control limits.
+        """
+        self.limits = limits
+        self.active = 0
+        self.queued_bytes = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._update_gauges()
+
+    # ---------------------------------------------------------
+    #
+    @property
+    def waiting(self) -> int:
+        """ Return the number of requests that wait to be admitted. """
+        return len(self._waiters)
+
+    # ---------------------------------------------------------
+    #
+    def _update_gauges(self):
+        """ Export the current state as metrics. """
+        BULK_ACTIVE.set(self.active)
+        BULK_WAITING.set(len(self._waiters))
+        BULK_QUEUED_BYTES.set(self.queued_bytes)
+
+    # ---------------------------------------------------------
+    #
+    async def acquire(self, size: int) -> Optional[str]:
+        """ Wait until the request is admitted.
+
+        Call ``release`` with the same size when an admitted request is done.
+
+        Args:
+            size: Request body bytes.
+
+        Returns:
+            None when admitted, otherwise the rejection reason (*queue_full*
+            or *timeout*).
+        """
+        if self.queued_bytes + size > self.limits.max_queued_bytes:
+            return 'queue_full'
+
+        self.queued_bytes += size
+
+        if self.active < self.limits.max_concurrent and not self._waiters:
+            self.active += 1
+            self._update_gauges()
+            return None
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_gauges()
+
+        try:
+            done, _ = await asyncio.wait((waiter,), timeout=self.limits.max_wait)
+
+        except asyncio.CancelledError:
+            self._abandon(waiter, size)
+            raise
+
+        if not done:
+            self._abandon(waiter, size)
+            return 'timeout'
+
+        return None
+
+    # ---------------------------------------------------------
+    #
+    def release(self, size: int):
+        """ Hand over the slot of a done request to the next waiting request.
+
+        Args:
+            size: Request body bytes (the same as for ``acquire``).
+        """
+        self.queued_bytes -= size
+
+        while self._waiters:
+            waiter = self._waiters.popleft()
+
+            if not waiter.done():
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+
+        self.active -= 1
+        self._update_gauges()
+
+    # ---------------------------------------------------------
+    #
+    def _abandon(self, waiter: asyncio.Future, size: int):
+        """ Remove a waiting request that timed out, or was cancelled.
+
+        Args:
+            waiter: The request waiter.
+            size: Request body bytes.
+        """
+        # The slot was handed over at the same time, pass it on.
+        if waiter.done():
+            self.release(size)
+            return
+
+        waiter.cancel()
+        self._waiters.remove(waiter)
+        self.queued_bytes -= size
+        self._update_gauges()
+
+
+bulk_admission = AdmissionController(config.bulk_admission)
+""" The application bulk document upsert admission controller. """
+
+
+# -----------------------------------------------------------------------------
+#
+class AdmissionMiddleware:
+    """ ASGI middleware that admits the requests to a route through a controller.
+
+    Attributes:
+        app: The wrapped ASGI application.
+        controller: Admission controller.
+        routes: (method, path) of the controlled routes.
+        streams: (method, path pattern) of the controlled streaming routes,
+            that only take a concurrency slot.
+    """
+
+    def __init__(self, app: ASGIApp, controller: AdmissionController,
+                 routes: Tuple[Tuple[str, str], ...],
+                 streams: Tuple[Tuple[str, str], ...] = ()):
+        """ The class constructor.
+
+        Args:
+            app: The wrapped ASGI application.
+            controller: Admission controller.
+            routes: (method, path) of the controlled routes.
+            streams: (method, path regex) of the controlled streaming routes,
+                that only take a concurrency slot.
+        """
+        self.app = app
+        self.controller = controller
+        self.routes = routes
+        self.streams = tuple((method, re.compile(pattern)) for method, pattern in streams)
+
+    # ---------------------------------------------------------
+    #
+    @staticmethod
+    def _content_length(scope: Scope) -> Optional[int]:
+        """ Return the request Content-Length, None when it's missing or invalid.
+
+        Args:
+            scope: ASGI connection scope.
+        """
+        for name, value in scope['headers']:
+            if name == b'content-length':
+                return int(value) if value.isdigit() else None
+
+        return None
+
+    # ---------------------------------------------------------
+    #
+    async def _reject(self, scope: Scope, receive: Receive, send: Send,
+                      reason: str, status_code: int, detail: str):
+        """ Send a rejection response without receiving the request body.
+
+        Args:
+            scope: ASGI connection scope.
+            receive: ASGI receive channel.
+            send: ASGI send channel.
+            reason: Rejection reason (the metrics label).
+            status_code: Response status code.
+            detail: Error message.
+        """
+        BULK_REJECTED.inc(reason)
+        headers = ({'Retry-After': str(self.controller.limits.retry_after)}
+                   if status_code == 503 else None)
+        response = JSONResponse({'detail': detail}, status_code=status_code, headers=headers)
+        await response(scope, receive, send)
+
+    # ---------------------------------------------------------
+    #
+    def _is_stream(self, scope: Scope) -> bool:
+        """ Return True when the request is for a controlled streaming route.
+
+        Args:
+            scope: ASGI connection scope.
+        """
+        return any(method == scope['method'] and pattern.fullmatch(scope['path'])
+                   for method, pattern in self.streams)
+
+    # ---------------------------------------------------------
+    #
+    async def _admit(self, scope: Scope, receive: Receive, send: Send, size: int):
+        """ Run the request when it's admitted, otherwise reject it with 503.
+
+        Args:
+            scope: ASGI connection scope.
+            receive: ASGI receive channel.
+            send: ASGI send channel.
+            size: Counted request body bytes.
+        """
+        reason = await self.controller.acquire(size)
+
+        if reason is not None:
+            await self._reject(scope, receive, send, reason, 503,
+                               f'Too many bulk upserts are queued ({reason}), retry later')
+            return
+
+        try:
+            await self.app(scope, receive, send)
+
+        finally:
+            self.controller.release(size)
+
+    # ---------------------------------------------------------
+    #
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        """ Run the request when it's admitted, otherwise reject it.
+
+        Args:
+            scope: ASGI connection scope.
+            receive: ASGI receive channel.
+            send: ASGI send channel.
+        """
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        # The body size of a streaming route is unknown, it's only limited
+        # by the number of concurrent requests.
+        if self._is_stream(scope):
+            await self._admit(scope, receive, send, 0)
+            return
+
+        if (scope['method'], scope['path']) not in self.routes:
+            await self.app(scope, receive, send)
+            return
+
+        size = self._content_length(scope)
+
+        if size is None:
+            await self._reject(scope, receive, send, 'length_required', 411,
+                               'A Content-Length header is required')
+            return
+
+        if size > self.controller.limits.max_queued_bytes:
+            await self._reject(scope, receive, send, 'too_large', 413,
+                               f'The request body is larger than '
+                               f'{self.controller.limits.max_queued_bytes} bytes')
+            return
+
+        await self._admit(scope, receive, send, size)
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# BUILTIN modules
+import zlib
+from typing import Optional, Tuple
+
+# Third party modules
+import zstandard
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Constants
+ZSTD_SLICE = 4096
+""" Compressed bytes fed to the zstd decompressor per call. """
+ENCODINGS = ('gzip', 'zstd')
+""" Supported request Content-Encoding values. """
+DECOMPRESS_ERRORS = (zlib.error, zstandard.ZstdError)
+""" Exceptions raised for invalid compressed data. """
+
+
+# -----------------------------------------------------------------------------
+#
+class _Decompressor:
+    """ Incremental request body decompressor that enforces a size cap.
+
+    Attributes:
+        encoding: Content-Encoding of the request body.
+        remaining: Number of decompressed bytes that are still allowed.
+    """
+
+    def __init__(self, encoding: str, max_size: int):
+        """ The class constructor.
+
+        Args:
+            encoding: Content-Encoding of the request body (gzip or zstd).
+            max_size: Max number of decompressed bytes.
+        """
+        self.encoding = encoding
+        self.remaining = max_size
+
+        if encoding == 'gzip':
+            self._gzip = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+        else:
+            self._zstd = zstandard.ZstdDecompressor().decompressobj()
+
+    # ---------------------------------------------------------
+    #
+    def _consume(self, data: bytes) -> bytes:
+        """ Return the data after it has been counted against the cap.
+
+        Args:
+            data: Decompressed data.
+
+        Returns:
+            The same data.
+
+        Raises:
+            HTTPException(413): When the cap is exceeded.
+        """
+        self.remaining -= len(data)
+
+        if self.remaining < 0:
+            raise HTTPException(status_code=413,
+                                detail="Decompressed request body is too large")
+
+        return data
+
+    # ---------------------------------------------------------
+    #
+    def decompress(self, chunk: bytes, final: bool) -> bytes:
+        """ Return the decompressed content of the next body chunk.
+
+        The gzip output is limited to the remaining cap on every call, so a
+        decompression bomb never gets further than one byte past the cap.
+        The zstd decompressor has no output limit, it's fed in small
+        slices instead to keep the overshoot small.
+
+        Args:
+            chunk: Compressed body chunk.
+            final: True for the last chunk of the body.
+
+        Returns:
+            Decompressed body chunk.
+
+        Raises:
+            HTTPException(400): When the body isn't valid compressed data.
+            HTTPException(413): When the decompressed body exceeds the cap.
+        """
+        try:
+            if self.encoding == 'gzip':
+                data = self._consume(self._gzip.decompress(chunk, self.remaining + 1))
+
+                if final:
+                    data += self._consume(self._gzip.flush())
+
+                    if not self._gzip.eof:
+                        raise zlib.error('Truncated gzip stream')
+
+                return data
+
+            data = b''.join(
+                self._consume(self._zstd.decompress(chunk[idx:idx + ZSTD_SLICE]))
+                for idx in range(0, len(chunk), ZSTD_SLICE))
+
+            if final and not self._zstd.eof:
+                raise zstandard.ZstdError('Truncated zstd stream')
+
+            return data
+
+        except DECOMPRESS_ERRORS as why:
+            raise HTTPException(status_code=400, detail=f"Invalid {self.encoding} "
+                                                        f"request body => {why}")
+
+
+# -----------------------------------------------------------------------------
+#
+class DecompressionMiddleware:
+    """ ASGI middleware that decompresses gzip and zstd encoded request bodies.
+
+    The body is decompressed incrementally while the route reads it, so it
+    also works for streaming routes. The ``Content-Encoding`` and
+    ``Content-Length`` headers are removed from the request, and a
+    decompressed body that exceeds ``max_size`` is answered with 413, and
+    a truncated one with 400.
+
+    Attributes:
+        app: The wrapped ASGI application.
+        paths: Path prefixes where compressed request bodies are accepted.
+        max_size: Max number of decompressed bytes per request body.
+    """
+
+    def __init__(self, app: ASGIApp, paths: Tuple[str, ...], max_size: int):
+        """ The class constructor.
+
+        Args:
+            app: The wrapped ASGI application.
+            paths: Path prefixes where compressed request bodies are accepted.
+            max_size: Max number of decompressed bytes per request body.
+        """
+        self.app = app
+        self.paths = paths
+        self.max_size = max_size
+
+    # ---------------------------------------------------------
+    #
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        """ Decompress the request body when it's encoded.
+
+        Args:
+            scope: ASGI connection scope.
+            receive: ASGI receive channel.
+            send: ASGI send channel.
+        """
+        encoding = self._encoding(scope)
+
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        if encoding not in ENCODINGS or not scope['path'].startswith(self.paths):
+            errmsg = f"Unsupported Content-Encoding '{encoding}'"
+            await JSONResponse({'detail': errmsg}, status_code=415)(scope, receive, send)
+            return
+
+        decompressor = _Decompressor(encoding, self.max_size)
+        # The headers are replaced in the scope itself (and not in a copy), since
+        # the outer middlewares read what the router adds to the scope, like the
+        # matched route of the metrics.
+        scope['headers'] = [(key, value) for key, value in scope['headers']
+                            if key not in (b'content-encoding', b'content-length')]
+
+        # ---------------------------------
+
+        async def decompressed_receive() -> Message:
+            """ Return the next request message with a decompressed body. """
+            message = await receive()
+
+            if message['type'] == 'http.request':
+                final = not message.get('more_body', False)
+                message = dict(message, body=decompressor.decompress(
+                    message.get('body', b''), final))
+
+            return message
+
+        # ---------------------------------
+
+        await self.app(scope, decompressed_receive, send)
+
+    # ---------------------------------------------------------
+    #
+    @staticmethod
+    def _encoding(scope: Scope) -> Optional[str]:
+        """ Return the request Content-Encoding, or None when not encoded.
+
+        Args:
+            scope: ASGI connection scope.
+        """
+        if scope['type'] != 'http':
+            return None
+
+        for key, value in scope['headers']:
+            if key == b'content-encoding':
+                encoding = value.decode('latin-1').strip().lower()
+                return None if encoding in ('', 'identity') else encoding
+
+        return None
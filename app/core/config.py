@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# BUILTIN modules
+import random
+from os import getenv
+from sys import modules
+from typing import List, Optional
+from dataclasses import dataclass, astuple, fields
+
+
+# -----------------------------------------------------------------------------
+#
+@dataclass(frozen=True)
+class SqlitePragmas:
+    """ SQLite tuning profile that is applied on every new DB connection.
+
+    A parameter that is set to None is left at the SQLite default value.
+    Note that ``page_size`` only has an effect when the database file is
+    created, since it can't be changed on an existing database in WAL mode.
+
+    Attributes:
+        journal_mode: WAL lets readers run concurrently with the writer.
+        synchronous: NORMAL only syncs at WAL checkpoints (safe in WAL mode).
+        cache_size: Page cache size, negative values are in KiB.
+        mmap_size: Maximum number of bytes used for memory-mapped I/O.
+        temp_store: Where temporary tables and indices are kept.
+        busy_timeout: Milliseconds to wait for a lock before SQLITE_BUSY.
+        page_size: Database page size in bytes.
+    """
+    journal_mode: Optional[str] = 'WAL'
+    synchronous: Optional[str] = 'NORMAL'
+    cache_size: Optional[int] = -64000
+    mmap_size: Optional[int] = 268435456
+    temp_store: Optional[str] = 'MEMORY'
+    busy_timeout: Optional[int] = 5000
+    page_size: Optional[int] = 4096
+
+    # ---------------------------------------------------------
+    #
+    def statements(self) -> List[str]:
+        """ Return the PRAGMA statements for all configured parameters.
+
+        The ``busy_timeout`` pragma is returned first, so that it applies to
+        the lock that switching the journal mode needs (when several server
+        processes open a new database at the same time). The ``page_size``
+        pragma comes next, since it has to be set before the journal mode is
+        switched to WAL on a new database.
+
+        Returns:
+            PRAGMA statements in execution order.
+        """
+        values = dict(zip((item.name for item in fields(self)), astuple(self)))
+        first = ['busy_timeout', 'page_size']
+        order = first + [name for name in values if name not in first]
+        return [f"PRAGMA {name}={values[name]}"
+                for name in order if values[name] is not None]
+
+
+SQLITE_DEFAULTS = SqlitePragmas(*[None] * len(fields(SqlitePragmas)))
+""" A profile that leaves all SQLite parameters at their default values. """
+
+
+# -----------------------------------------------------------------------------
+#
+@dataclass(frozen=True)
+class RetryPolicy:
+    """ Retry policy for a unit of work that fails with a busy or locked DB error.
+
+    The unit is re-run after a random delay between zero and an exponential
+    backoff (*full jitter*), so that writers that failed at the same time
+    don't retry at the same time.
+
+    Attributes:
+        attempts: Max number of runs, the first one included.
+        base_delay: Max seconds before the first re-run, doubled for every re-run.
+        max_delay: Max seconds between two runs.
+        deadline: Max seconds from the start of the first run until the
+            last re-run is started.
+    """
+    attempts: int = 8
+    base_delay: float = 0.01
+    max_delay: float = 1.0
+    deadline: float = 15.0
+
+    # ---------------------------------------------------------
+    #
+    def delay(self, retry: int) -> float:
+        """ Return the jittered seconds to wait before the specified re-run.
+
+        Args:
+            retry: Re-run number, starting at 1.
+
+        Returns:
+            Seconds to wait.
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (retry - 1)))
+
+
+# -----------------------------------------------------------------------------
+#
+@dataclass(frozen=True)
+class AdmissionLimits:
+    """ Admission control limits of the bulk document upserts.
+
+    Attributes:
+        max_concurrent: Max number of bulk upserts that run at the same time,
+            set with the TRACKING_BULK_MAX_CONCURRENT env variable.
+        max_queued_bytes: Max request body bytes (Content-Length, so a compressed
+            body is counted compressed) of the running and waiting bulk upserts.
+        max_wait: Max seconds a bulk upsert waits to be admitted, before
+            it's rejected (short, so that a saturated service rejects at once).
+        retry_after: Seconds in the Retry-After header of a rejected bulk upsert.
+    """
+    max_concurrent: int = int(getenv('TRACKING_BULK_MAX_CONCURRENT', '2'))
+    max_queued_bytes: int = 64 * 1024 * 1024
+    max_wait: float = 0.5
+    retry_after: int = 2
+
+
+# -----------------------------------------------------------------------------
+#
+@dataclass(frozen=True)
+class Configuration:
+    """ Configuration parameters for the FastAPI app.
+
+    Attributes:
+        version: API version.
+        log_level: Desired log level.
+        log_profile: Logging profile, *development* (colorized text) or
+            *production* (queued JSON lines), set with the
+            TRACKING_LOG_PROFILE env variable.
+        title: API title.
+        name: Service name.
+        db_url: DB connection URL, can be set with the TRACKING_DB_URL env variable.
+            A private in-memory DB is used when running pytest, which means
+            that every pytest-xdist worker process has its own DB.
+        sqlite: SQLite tuning profile applied on every DB connection.
+        write_retry: Retry policy of the write units of work, when the DB
+            is busy or locked (by another process).
+        bulk_admission: Admission control limits of the bulk document upserts.
+        reader_pool_size: Number of read-only DB connections (file DB only).
+        write_coalescing: Group-commit small writes, set with the
+            TRACKING_WRITE_COALESCING=1 env variable.
+        coalesce_window: Max seconds a group commit waits for more writes.
+        coalesce_max_batch: Max number of writes in one group commit.
+        job_workers: Number of concurrent ingestion job workers.
+        job_lease: Seconds before a running ingestion job is considered abandoned.
+        job_poll_interval: Max seconds between looking for new ingestion jobs.
+        max_decompressed_body: Max bytes of a decompressed request body.
+        gzip_min_size: Min bytes of a response before it's gzip compressed.
+        server_timing: Add a Server-Timing header (and log) with the request
+            timing breakdown, turned off with the TRACKING_SERVER_TIMING=0
+            env variable.
+        slow_query_ms: Min milliseconds before a statement is logged as a slow
+            query (with its query plan), set with the TRACKING_SLOW_QUERY_MS
+            env variable.
+        host: Server bind address, set with the TRACKING_HOST env variable.
+        port: Server port, set with the TRACKING_PORT env variable.
+        workers: Number of server processes, set with the TRACKING_WORKERS
+            env variable.
+        loop: Event loop implementation (*auto*, *uvloop* or *asyncio*), set
+            with the TRACKING_LOOP env variable. *auto* uses uvloop when
+            it's installed.
+        http: HTTP protocol implementation (*auto*, *httptools* or *h11*),
+            set with the TRACKING_HTTP env variable. *auto* uses httptools
+            when it's installed.
+        keep_alive: Seconds an idle keep-alive connection is kept open (longer
+            than the typical 60 sec idle timeout of a load balancer, so that
+            the server doesn't close a connection that is being reused).
+        backlog: Max number of connections waiting to be accepted (limited by
+            the net.core.somaxconn kernel parameter).
+    """
+    version: str = '0.5.0'
+    log_level: str = 'info'
+    log_profile: str = getenv('TRACKING_LOG_PROFILE', 'development')
+    title: str = 'TrackingDb API'
+    name: str = 'TrackingDbService'
+    db_url: str = ('sqlite+aiosqlite:///:memory:'
+                   if "pytest" in modules
+                   else getenv('TRACKING_DB_URL', 'sqlite+aiosqlite:///tracking.db'))
+    sqlite: SqlitePragmas = SqlitePragmas()
+    write_retry: RetryPolicy = RetryPolicy()
+    bulk_admission: AdmissionLimits = AdmissionLimits()
+    reader_pool_size: int = 4
+    write_coalescing: bool = getenv('TRACKING_WRITE_COALESCING', '0') == '1'
+    coalesce_window: float = 0.002
+    coalesce_max_batch: int = 100
+    job_workers: int = 2
+    job_lease: int = 60
+    job_poll_interval: float = 5.0
+    max_decompressed_body: int = 32 * 1024 * 1024
+    gzip_min_size: int = 1024
+    server_timing: bool = getenv('TRACKING_SERVER_TIMING', '1') == '1'
+    slow_query_ms: float = float(getenv('TRACKING_SLOW_QUERY_MS', '100'))
+    host: str = getenv('TRACKING_HOST', '127.0.0.1')
+    port: int = int(getenv('TRACKING_PORT', '7000'))
+    workers: int = int(getenv('TRACKING_WORKERS', '1'))
+    loop: str = getenv('TRACKING_LOOP', 'auto')
+    http: str = getenv('TRACKING_HTTP', 'auto')
+    keep_alive: int = 75
+    backlog: int = 4096
+
+
+config = Configuration()
+""" A simplified config handling since this is a example that needs to be small. """
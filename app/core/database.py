@@ -12,36 +12,154 @@ VERSION INFO:
 """
 
 # BUILTIN modules
-from sys import modules
+from typing import Any, Tuple
+from pathlib import Path
+from dataclasses import replace
 
 # Third party modules
+from sqlalchemy import event
 from sqlmodel import SQLModel
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.engine import make_url, Connection
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
+from sqlalchemy.dialects.sqlite.aiosqlite import AsyncAdapt_aiosqlite_connection
 
-connection_url = ('sqlite+aiosqlite:///:memory:?cache=shared'
-                  if "pytest" in modules
-                  else 'sqlite+aiosqlite:///tracking.db')
+# Local modules
+from .config import config, SqlitePragmas
+
+connection_url = config.db_url
 """ DB connection URL. """
 
-# This param shows the SQL queries in the
-# log, perfect during development: echo=True,
-async_engine = create_async_engine(
-    url=connection_url, future=True,
-    connect_args={"check_same_thread": False}
-)
-""" Create the SQLModel database engine. """
+
+# ---------------------------------------------------------
+#
+def create_sqlite_engine(url: str, pragmas: SqlitePragmas, **kwargs: Any) -> AsyncEngine:
+    """ Return an async SQLite engine that applies the pragma profile.
+
+    The profile is applied through the engine connect hook, which means
+    that it's applied once on every new pooled DB connection.
+
+    Args:
+        url: DB connection URL.
+        pragmas: SQLite tuning profile.
+        kwargs: Extra engine parameters.
+
+    Returns:
+        The created async engine.
+    """
+    engine = create_async_engine(
+        url=url, future=True,
+        connect_args={"check_same_thread": False}, **kwargs
+    )
+
+    # -----------------------------------------------------
+    #
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_sqlite_pragma(dbapi_connection: AsyncAdapt_aiosqlite_connection, _: Any):
+        """ Enable foreign key usage and apply the tuning profile.
+
+        Args:
+            dbapi_connection: DB connection object.
+            _: Not used (needed by signature).
+        """
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+
+        for statement in pragmas.statements():
+            cursor.execute(statement)
+
+        cursor.close()
+
+    return engine
+
+
+# ---------------------------------------------------------
+#
+def read_only_url(url: str) -> str | None:
+    """ Return a read-only (``mode=ro``) URI variant of a file DB URL.
+
+    Args:
+        url: DB connection URL.
+
+    Returns:
+        Read-only DB connection URL, or None for an in-memory DB.
+    """
+    db_url = make_url(url)
+
+    if db_url.database in (None, '', ':memory:'):
+        return None
+
+    path = Path(db_url.database).resolve().as_posix()
+    return db_url.set(database=f'file:{path}',
+                      query={'mode': 'ro', 'uri': 'true'}).render_as_string()
 
 
 # ---------------------------------------------------------
 #
-async def create_async_db_tables():
-    """ Create the required DB and tables when they don't yet exist. """
-    async with async_engine.begin() as conn:
+def create_engines(url: str) -> Tuple[AsyncEngine, AsyncEngine]:
+    """ Return the writer and reader engines of the DB.
+
+    A file DB gets a single writer connection, that serializes all writes
+    in the process, and a read-only (``mode=ro``) reader pool, that WAL
+    mode lets run alongside it. An in-memory DB uses the same engine for
+    both, since every connection would get its own DB.
+
+    Args:
+        url: DB connection URL.
+
+    Returns:
+        Writer engine, reader engine.
+    """
+    if read_only_url(url):
+        writer = create_sqlite_engine(url, config.sqlite, pool_size=1, max_overflow=0)
+        reader = create_sqlite_engine(
+            read_only_url(url), replace(config.sqlite, journal_mode=None, page_size=None),
+            pool_size=config.reader_pool_size, max_overflow=0
+        )
+        return writer, reader
+
+    writer = create_sqlite_engine(url, config.sqlite)
+    return writer, writer
+
+
+# Create the SQLModel database writer and reader engines. This
+# param shows the SQL queries in the log, perfect during
+# development: echo=True,
+async_engine, async_read_engine = create_engines(connection_url)
+
+
+# ---------------------------------------------------------
+#
+def _create_missing_indexes(conn: Connection):
+    """ Create indexes that were added after the table was created.
+
+    ``create_all`` skips existing tables, including their indexes.
+
+    Args:
+        conn: Active DB connection.
+    """
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+# ---------------------------------------------------------
+#
+async def create_async_db_tables(engine: AsyncEngine = async_engine):
+    """ Create the required DB, tables and indexes when they don't yet exist.
+
+    Args:
+        engine: Used DB engine (the writer engine by default).
+    """
+    async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(_create_missing_indexes)
 
 
 # ---------------------------------------------------------
 #
 async def close_async_db():
-    """ Close the asynchronous database connection pool. """
+    """ Close the asynchronous database connection pools. """
+    if async_read_engine is not async_engine:
+        await async_read_engine.dispose()
+
     await async_engine.dispose()
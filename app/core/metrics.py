@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+
+Service metrics in the Prometheus text exposition format.
+
+All metrics are updated on the event loop thread (the SQLAlchemy events
+run there as well, only the SQLite calls run in the aiosqlite thread), so
+the counters are plain dict updates without any locks. They are rendered
+when the ``/tracking/metrics`` endpoint is scraped.
+"""
+
+# BUILTIN modules
+from bisect import bisect_left
+from time import perf_counter
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+
+# Third party modules
+from sqlalchemy import event
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Constants
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+""" Prometheus text exposition format media type. """
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+""" Request latency histogram bucket limits in seconds. """
+ACQUIRE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.25, 1.0, 5.0)
+""" Connection acquire histogram bucket limits in seconds. """
+
+REGISTRY: List['Metric'] = []
+""" All application metrics, in the order they are rendered. """
+
+
+# ---------------------------------------------------------
+#
+def _escape(value: Any) -> str:
+    """ Return the label value with backslash, quote and newline escaped.
+
+    Args:
+        value: Label value.
+
+    Returns:
+        Escaped label value.
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# ---------------------------------------------------------
+#
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = '') -> str:
+    """ Return the label set of a sample, like ``{method="GET",route="/"}``.
+
+    Args:
+        names: Label names.
+        values: Label values.
+        extra: Already formatted label (the histogram ``le`` label).
+
+    Returns:
+        Formatted label set, or an empty string when there are no labels.
+    """
+    items = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+
+    if extra:
+        items.append(extra)
+
+    return '{' + ','.join(items) + '}' if items else ''
+
+
+# -----------------------------------------------------------------------------
+#
+class Metric:
+    """ Base class of a metric with a fixed set of label names.
+
+    Attributes:
+        name: Metric name.
+        documentation: Metric HELP text.
+        labels: Label names.
+        values: Label values to the metric value.
+    """
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 registry: List['Metric'] = REGISTRY):
+        """ The class constructor.
+
+        Args:
+            name: Metric name.
+            documentation: Metric HELP text.
+            labels: Label names.
+            registry: Where the metric is rendered from.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values: Dict[Tuple, Any] = {}
+        registry.append(self)
+
+    # ---------------------------------------------------------
+    #
+    def samples(self) -> Iterator[str]:
+        """ Yield the sample lines of the metric. """
+        for values, value in self.values.items():
+            yield f'{self.name}{_labels(self.labels, values)} {value}'
+
+    # ---------------------------------------------------------
+    #
+    def render(self) -> str:
+        """ Return the metric in the Prometheus text format. """
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} {self.kind}', *self.samples()]
+        return '\n'.join(lines)
+
+
+# -----------------------------------------------------------------------------
+#
+class Counter(Metric):
+    """ A monotonically increasing value. """
+    kind = 'counter'
+
+    def inc(self, *labels: Any, amount: float = 1):
+        """ Increase the value of the labelled counter.
+
+        Args:
+            labels: Label values.
+            amount: Added value.
+        """
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+# -----------------------------------------------------------------------------
+#
+class Gauge(Counter):
+    """ A value that can go up and down. """
+    kind = 'gauge'
+
+    def set(self, value: float, *labels: Any):
+        """ Set the value of the labelled gauge.
+
+        Args:
+            value: New value.
+            labels: Label values.
+        """
+        self.values[labels] = value
+
+
+# -----------------------------------------------------------------------------
+#
+class Histogram(Metric):
+    """ Observed values counted in buckets, with their count and sum.
+
+    The bucket counts are stored per bucket, they are only made
+    cumulative when the histogram is rendered.
+
+    Attributes:
+        buckets: Bucket upper limits (the +Inf bucket is implicit).
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS,
+                 registry: List[Metric] = REGISTRY):
+        """ The class constructor.
+
+        Args:
+            name: Metric name.
+            documentation: Metric HELP text.
+            labels: Label names.
+            buckets: Bucket upper limits, in ascending order.
+            registry: Where the metric is rendered from.
+        """
+        super().__init__(name, documentation, labels, registry)
+        self.buckets = tuple(buckets)
+
+    # ---------------------------------------------------------
+    #
+    def observe(self, value: float, *labels: Any):
+        """ Count the value in its bucket of the labelled histogram.
+
+        Args:
+            value: Observed value.
+            labels: Label values.
+        """
+        series = self.values.get(labels)
+
+        if series is None:
+            # Bucket counts, the +Inf bucket count and the sum.
+            series = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    # ---------------------------------------------------------
+    #
+    def samples(self) -> Iterator[str]:
+        """ Yield the bucket, sum and count sample lines of the histogram. """
+        for values, series in self.values.items():
+            count = 0
+
+            for limit, observed in zip((*self.buckets, '+Inf'), series):
+                count += observed
+                labels = _labels(self.labels, values, f'le="{limit}"')
+                yield f'{self.name}_bucket{labels} {count}'
+
+            yield f'{self.name}_sum{_labels(self.labels, values)} {series[-1]}'
+            yield f'{self.name}_count{_labels(self.labels, values)} {count}'
+
+
+# ---------------------------------------------------------
+#
+def render(registry: List[Metric] = REGISTRY) -> str:
+    """ Return all metrics in the Prometheus text format.
+
+    Args:
+        registry: Rendered metrics.
+
+    Returns:
+        Prometheus text exposition.
+    """
+    return '\n'.join(metric.render() for metric in registry) + '\n'
+
+
+HTTP_LATENCY = Histogram('http_request_duration_seconds',
+                         'Request latency per route.', ('method', 'route'))
+""" Request latency per route. """
+HTTP_REQUESTS = Counter('http_requests_total',
+                        'Handled requests per route and status code.',
+                        ('method', 'route', 'status'))
+""" Handled requests per route and status code. """
+HTTP_IN_FLIGHT = Gauge('http_requests_in_flight', 'Requests that are being handled.')
+""" Requests that are being handled. """
+BULK_ACTIVE = Gauge('bulk_upserts_active', 'Admitted bulk document upserts that are running.')
+""" Admitted bulk document upserts that are running. """
+BULK_WAITING = Gauge('bulk_upserts_waiting', 'Bulk document upserts that wait to be admitted.')
+""" Bulk document upserts that wait to be admitted (the queue depth). """
+BULK_QUEUED_BYTES = Gauge('bulk_upserts_queued_bytes',
+                          'Request body bytes of the running and waiting bulk upserts.')
+""" Request body bytes of the running and waiting bulk document upserts. """
+BULK_REJECTED = Counter('bulk_upserts_rejected_total',
+                        'Rejected bulk document upserts per reason.', ('reason',))
+""" Rejected bulk document upserts per reason. """
+DB_ROWS = Counter('db_rows_total',
+                  'Rows inserted (or upserted), updated or deleted per table.',
+                  ('table', 'operation'))
+""" Rows inserted (or upserted), updated or deleted per table. """
+DB_TRANSACTIONS = Counter('db_transactions_total',
+                          'Write transaction commits and rollbacks.', ('outcome',))
+""" Write transaction commits and rollbacks. """
+DB_BUSY_RETRIES = Counter('db_busy_retries_total',
+                          'Units of work that were re-run after a busy or locked DB error.',
+                          ('unit',))
+""" Units of work that were re-run after a busy or locked DB error. """
+DB_BUSY_FAILURES = Counter('db_busy_failures_total',
+                           'Units of work that failed with a busy or locked DB error '
+                           'after the last retry.', ('unit',))
+""" Units of work that failed with a busy or locked DB error after the last retry. """
+DB_ACQUIRE = Histogram('db_connection_acquire_seconds',
+                       'Wait for a pooled DB connection.', ('engine',),
+                       buckets=ACQUIRE_BUCKETS)
+""" Wait for a pooled DB connection. """
+DB_POOL_CHECKED_OUT = Gauge('db_pool_checked_out',
+                            'DB connections that are in use.', ('engine',))
+""" DB connections that are in use (updated when the metrics are scraped). """
+
+
+# ---------------------------------------------------------
+#
+def update_pool_gauges(engines: Dict[str, AsyncEngine]):
+    """ Update the checked out connection gauge for every pool that has one.
+
+    Args:
+        engines: Engine label to DB engine.
+    """
+    for label, engine in engines.items():
+        checkedout = getattr(engine.sync_engine.pool, 'checkedout', None)
+
+        if checkedout:
+            DB_POOL_CHECKED_OUT.set(checkedout(), label)
+
+
+# ---------------------------------------------------------
+#
+def _count_rows(conn: Connection, cursor: Any, statement: str,
+                parameters: Any, context: Any, executemany: bool):
+    """ Add the affected rows of an INSERT, UPDATE or DELETE statement. """
+    if context.isinsert:
+        operation = 'insert'
+
+    elif context.isupdate:
+        operation = 'update'
+
+    elif context.isdelete:
+        operation = 'delete'
+
+    else:
+        return
+
+    if cursor.rowcount > 0:
+        DB_ROWS.inc(context.compiled.statement.table.name, operation,
+                    amount=cursor.rowcount)
+
+
+# ---------------------------------------------------------
+#
+def instrument_engine(engine: AsyncEngine):
+    """ Count the rows that are changed by the engine statements.
+
+    It's safe to call it more than once for the same engine.
+
+    Args:
+        engine: Instrumented DB engine.
+    """
+    if not event.contains(engine.sync_engine, 'after_cursor_execute', _count_rows):
+        event.listen(engine.sync_engine, 'after_cursor_execute', _count_rows)
+
+
+# -----------------------------------------------------------------------------
+#
+class MetricsMiddleware:
+    """ Measure the latency and status code of every request per route.
+
+    The route is the path template (like ``/tracking/jobs/{job_id}/``), so
+    the number of label values stays fixed. Requests that don't match a
+    route are counted as the *unmatched* route.
+    """
+
+    def __init__(self, app: ASGIApp):
+        """ The class constructor.
+
+        Args:
+            app: Wrapped ASGI application.
+        """
+        self.app = app
+
+    # ---------------------------------------------------------
+    #
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        """ Measure the request.
+
+        Args:
+            scope: ASGI connection scope.
+            receive: ASGI receive channel.
+            send: ASGI send channel.
+        """
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message):
+            """ Remember the response status code. """
+            nonlocal status
+
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        start = perf_counter()
+
+        try:
+            await self.app(scope, receive, send_with_status)
+
+        finally:
+            route = scope.get('route')
+            path = route.path if route else 'unmatched'
+            HTTP_LATENCY.observe(perf_counter() - start, scope['method'], path)
+            HTTP_REQUESTS.inc(scope['method'], path, status)
+            HTTP_IN_FLIGHT.inc(amount=-1)
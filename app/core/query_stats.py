@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+
+Per-statement query statistics and a slow-query log.
+
+Every executed statement is reduced to a fingerprint, where the literals,
+IN lists, multi-row VALUES lists and SAVEPOINT names are normalized, so
+that all the executions of the same query (like the chunks of a bulk
+upsert) are counted together. The count, total time and the percentiles of the most
+recent executions are kept per fingerprint.
+
+A statement that runs longer than the slow-query threshold (see
+``config.slow_query_ms``) is logged as a warning, together with its
+``EXPLAIN QUERY PLAN``. The plan is only fetched the first time a
+fingerprint is slow, after that the stored plan is logged. The ID of the
+last slow request is kept per fingerprint.
+
+The statistics are updated on the event loop thread (like the service
+metrics), so no locks are needed.
+"""
+
+# BUILTIN modules
+import re
+import statistics
+from time import perf_counter
+from functools import lru_cache
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+# Third party modules
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Local modules
+from .config import config
+from .request_context import request_id
+
+# Constants
+SAMPLES = 1000
+""" Number of recent durations per fingerprint used for the percentiles. """
+MAX_FINGERPRINTS = 1000
+""" Max number of fingerprints, the statements after that are counted as *other*. """
+EXPLAINED = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+""" Statement types that have a query plan. """
+
+slow_query_threshold = config.slow_query_ms / 1000
+""" Min seconds before a statement is logged as a slow query. """
+
+_WHITESPACE = re.compile(r'\s+')
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SAVEPOINTS = re.compile(r'\bsa_savepoint_\d+\b')
+_IN_LISTS = re.compile(r'\bIN \((?:\?, )*\?\)', re.IGNORECASE)
+_VALUES_LISTS = re.compile(
+    r'\bVALUES ?(\((?:[^()]|\([^()]*\))*\))(?:, ?\((?:[^()]|\([^()]*\))*\))+',
+    re.IGNORECASE
+)
+
+
+# -----------------------------------------------------------------------------
+#
+class _Stats:
+    """ Aggregated executions of one fingerprint.
+
+    Attributes:
+        count: Number of executions.
+        total: Total seconds.
+        max: Longest execution in seconds.
+        samples: The most recent execution seconds.
+        plan: Query plan, when the fingerprint has been slow.
+        slow_request_id: ID of the last request where it was slow.
+    """
+    __slots__ = ('count', 'total', 'max', 'samples', 'plan', 'slow_request_id')
+
+    def __init__(self):
+        """ The class constructor. """
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=SAMPLES)
+        self.plan: Optional[List[str]] = None
+        self.slow_request_id: Optional[str] = None
+
+
+_stats: Dict[str, _Stats] = {}
+""" Fingerprint to aggregated executions. """
+
+
+# ---------------------------------------------------------
+#
+@lru_cache(maxsize=1024)
+def fingerprint(statement: str) -> str:
+    """ Return the statement with literals and value lists normalized.
+
+    SQLAlchemy reuses the same statement strings, so the result is cached.
+
+    Args:
+        statement: SQL statement.
+
+    Returns:
+        Statement fingerprint.
+    """
+    result = _WHITESPACE.sub(' ', statement).strip()
+    result = _STRINGS.sub('?', result)
+    result = _NUMBERS.sub('?', result)
+    result = _SAVEPOINTS.sub('sa_savepoint_?', result)
+    result = _IN_LISTS.sub('IN (...)', result)
+    return _VALUES_LISTS.sub(r'VALUES \1, ...', result)
+
+
+# ---------------------------------------------------------
+#
+def _explain(conn: Connection, statement: str, parameters: Any,
+             executemany: bool) -> List[str]:
+    """ Return the query plan of the statement, indented like a tree.
+
+    Args:
+        conn: DB connection that executed the statement.
+        statement: SQL statement.
+        parameters: Statement parameters.
+        executemany: When True, parameters is a list of parameter sets.
+
+    Returns:
+        Query plan lines.
+    """
+    if executemany:
+        parameters = parameters[0]
+
+    cursor = conn.connection.cursor()
+
+    try:
+        cursor.execute(f'EXPLAIN QUERY PLAN {statement}', parameters)
+        rows = cursor.fetchall()
+
+    finally:
+        cursor.close()
+
+    depth, plan = {0: -1}, []
+
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        plan.append(f"{'  ' * depth[node]}{detail}")
+
+    return plan
+
+
+# ---------------------------------------------------------
+#
+def _before_cursor_execute(conn: Connection, cursor: Any, statement: str,
+                           parameters: Any, context: Any, executemany: bool):
+    """ Store the statement start time in the execution context. """
+    context.query_stats_start = perf_counter()
+
+
+# ---------------------------------------------------------
+#
+def _after_cursor_execute(conn: Connection, cursor: Any, statement: str,
+                          parameters: Any, context: Any, executemany: bool):
+    """ Add the execution to its fingerprint, and log it when it's slow. """
+    elapsed = perf_counter() - context.query_stats_start
+    key = fingerprint(statement)
+    stats = _stats.get(key)
+
+    if stats is None:
+        key = key if len(_stats) < MAX_FINGERPRINTS else 'other'
+        stats = _stats.setdefault(key, _Stats())
+
+    stats.count += 1
+    stats.total += elapsed
+    stats.max = max(stats.max, elapsed)
+    stats.samples.append(elapsed)
+
+    if elapsed < slow_query_threshold:
+        return
+
+    stats.slow_request_id = request_id()
+
+    if stats.plan is None and key.split(' ', 1)[0].upper() in EXPLAINED:
+        try:
+            stats.plan = _explain(conn, statement, parameters, executemany)
+
+        except Exception as why:
+            stats.plan = [f'EXPLAIN QUERY PLAN failed: {why}']
+
+    message = '\n'.join([f"Slow query ({elapsed * 1000:.1f} ms): {key}", *(stats.plan or [])])
+    logger.bind(fingerprint=key, duration_ms=round(elapsed * 1000, 3),
+                plan=stats.plan).warning(message)
+
+
+# ---------------------------------------------------------
+#
+def instrument_engine(engine: AsyncEngine):
+    """ Collect query statistics for every statement executed by the engine.
+
+    It's safe to call it more than once for the same engine.
+
+    Args:
+        engine: Instrumented DB engine.
+    """
+    for name, listener in (('before_cursor_execute', _before_cursor_execute),
+                           ('after_cursor_execute', _after_cursor_execute)):
+        if not event.contains(engine.sync_engine, name, listener):
+            event.listen(engine.sync_engine, name, listener)
+
+
+# ---------------------------------------------------------
+#
+def _percentile(samples: List[float], pct: int) -> float:
+    """ Return the specified percentile of the samples.
+
+    Args:
+        samples: Measured values (at least one).
+        pct: Wanted percentile (1-99).
+
+    Returns:
+        The percentile value.
+    """
+    if len(samples) < 2:
+        return samples[0]
+
+    return statistics.quantiles(samples, n=100, method='inclusive')[pct - 1]
+
+
+# ---------------------------------------------------------
+#
+def snapshot(limit: Optional[int] = None) -> List[dict]:
+    """ Return the query statistics, with the largest total time first.
+
+    Args:
+        limit: Max number of fingerprints, all when not specified.
+
+    Returns:
+        Statistics per fingerprint, in milliseconds.
+    """
+    result = []
+
+    for key, stats in sorted(_stats.items(), key=lambda item: -item[1].total)[:limit]:
+        samples = list(stats.samples)
+        result.append({
+            'fingerprint': key,
+            'count': stats.count,
+            'total_ms': round(stats.total * 1000, 3),
+            'mean_ms': round(stats.total / stats.count * 1000, 3),
+            'p50_ms': round(_percentile(samples, 50) * 1000, 3),
+            'p95_ms': round(_percentile(samples, 95) * 1000, 3),
+            'p99_ms': round(_percentile(samples, 99) * 1000, 3),
+            'max_ms': round(stats.max * 1000, 3),
+            'plan': stats.plan,
+            'slow_request_id': stats.slow_request_id,
+        })
+
+    return result
+
+
+# ---------------------------------------------------------
+#
+def reset():
+    """ Remove all collected query statistics. """
+    _stats.clear()
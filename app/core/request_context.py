@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+
+Request-ID correlation of logs, SQL statistics and responses.
+
+The middleware takes the request ID from the ``X-Request-ID`` header, or
+generates one, and stores it (and the HTTP method) in a context variable
+for the duration of the request. The ID is returned in the
+``X-Request-ID`` response header.
+
+Everything that runs in the request context reads the same variable:
+
+  - Every log record (through the Loguru patcher that is installed by
+    ``create_unified_logger``), including the ``UnitOfWork``, server
+    timing, slow-query and Python logging module records.
+  - The slow-query statistics (the last slow request per statement).
+  - The write coalescer, that runs each queued operation with the
+    request ID of the request that queued it.
+"""
+
+# BUILTIN modules
+import re
+import os
+from contextvars import ContextVar, Token
+from typing import Optional, Tuple
+
+# Third party modules
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Constants
+HEADER = 'X-Request-ID'
+""" Request and response header name. """
+VALID_ID = re.compile(r'[A-Za-z0-9._:/+=-]{1,128}')
+""" Accepted request ID, otherwise a new ID is generated. """
+
+_current: ContextVar[Tuple[Optional[str], Optional[str]]] = ContextVar(
+    'request_context', default=(None, None))
+""" (request ID, HTTP method) of the current request, Nones outside a request. """
+
+
+# ---------------------------------------------------------
+#
+def request_id() -> Optional[str]:
+    """ Return the ID of the current request, None outside a request. """
+    return _current.get()[0]
+
+
+# ---------------------------------------------------------
+#
+def current() -> Tuple[Optional[str], Optional[str]]:
+    """ Return the (request ID, HTTP method) of the current request. """
+    return _current.get()
+
+
+# ---------------------------------------------------------
+#
+def set_current(context: Tuple[Optional[str], Optional[str]]) -> Token:
+    """ Make the (request ID, HTTP method) current, until the token is reset.
+
+    Used to run code outside the request task in the request context.
+
+    Args:
+        context: Request ID and HTTP method (see ``current``).
+
+    Returns:
+        Token that restores the previous context.
+    """
+    return _current.set(context)
+
+
+# ---------------------------------------------------------
+#
+def reset_current(token: Token):
+    """ Restore the context that was current before ``set_current``.
+
+    Args:
+        token: Token returned by ``set_current``.
+    """
+    _current.reset(token)
+
+
+# ---------------------------------------------------------
+#
+def add_to_record(record: dict):
+    """ Add the current request ID and HTTP method to a Loguru record.
+
+    Fields that are bound explicitly (not None) are kept.
+
+    Args:
+        record: Loguru record.
+    """
+    extra = record['extra']
+
+    if extra.get('request_id') is None:
+        rid, method = _current.get()
+
+        if rid is not None:
+            extra['request_id'] = rid
+            extra['method'] = method
+
+
+# -----------------------------------------------------------------------------
+#
+class RequestIdMiddleware:
+    """ Assign or propagate the X-Request-ID header of every request. """
+
+    def __init__(self, app: ASGIApp):
+        """ The class constructor.
+
+        Args:
+            app: Wrapped ASGI application.
+        """
+        self.app = app
+
+    # ---------------------------------------------------------
+    #
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        """ Run the request in its request context and echo the ID in the response.
+
+        Args:
+            scope: ASGI connection scope.
+            receive: ASGI receive channel.
+            send: ASGI send channel.
+        """
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        rid = None
+
+        for name, value in scope['headers']:
+            if name == b'x-request-id':
+                rid = value.decode('latin-1')
+                break
+
+        # 128 random bits, like a UUID4 hex (without the version bits,
+        # which makes it several times faster to generate).
+        if rid is None or not VALID_ID.fullmatch(rid):
+            rid = os.urandom(16).hex()
+
+        token = _current.set((rid, scope['method']))
+
+        async def send_with_id(message: Message):
+            """ Add the header when the response is started. """
+            if message['type'] == 'http.response.start':
+                MutableHeaders(scope=message).append(HEADER, rid)
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+
+        finally:
+            _current.reset(token)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# BUILTIN modules
+from typing import Any
+
+# Third party modules
+from pydantic_core import to_json
+from fastapi.responses import JSONResponse
+
+# Local modules
+from .server_timing import timed
+
+
+# -----------------------------------------------------------------------------
+#
+class FastJSONResponse(JSONResponse):
+    """ A JSON response that is serialized by pydantic-core.
+
+    This is the same Rust serializer that ``model_dump_json`` uses, and it
+    handles Pydantic/SQLModel objects (including ORM rows), lists and dicts
+    of them, datetime and Enum values directly.
+
+    When it's the application default response class, it replaces the
+    ``json.dumps`` call that renders the already encoded route result.
+    When a route returns it directly, FastAPI also skips the
+    ``response_model`` validation and ``jsonable_encoder`` passes, the
+    ``response_model`` is then only used for the OpenAPI documentation.
+    """
+
+    def render(self, content: Any) -> bytes:
+        """ Return the content serialized as compact UTF-8 JSON.
+
+        Args:
+            content: Response content.
+
+        Returns:
+            JSON encoded content.
+        """
+        with timed('serialize'):
+            return to_json(content)
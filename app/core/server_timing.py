@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+
+Per-request timing breakdown, returned in a ``Server-Timing`` response
+header and logged as structured log fields.
+
+The middleware stores a timing collector in a context variable for the
+duration of the request, and the measure points (``timed`` blocks and the
+SQLAlchemy cursor events) add to it. The collected metrics are:
+
+  - ``acquire``: Waiting for the ``UnitOfWork`` DB connection.
+  - ``sql``: Executing SQL statements (and the statement count).
+  - ``commit``: Committing the ``UnitOfWork`` transaction.
+  - ``coalesce``: Waiting for a group commit (when write coalescing is
+    enabled, the group is run in another task, and isn't broken down).
+  - ``serialize``: Rendering the JSON response.
+  - ``app``: The rest, like request validation and route code.
+  - ``total``: Until the response headers are sent.
+
+When it's disabled (TRACKING_SERVER_TIMING=0), the middleware and the
+cursor events are never installed, and a ``timed`` block is only a
+context variable lookup.
+"""
+
+# BUILTIN modules
+from time import perf_counter
+from contextvars import ContextVar
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# Third party modules
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Constants
+METRICS = ('acquire', 'sql', 'commit', 'coalesce', 'serialize')
+""" Measured metrics, in the order they are reported. """
+
+_timings: ContextVar[Optional[Dict[str, List]]] = ContextVar('server_timing', default=None)
+""" Metric name to [seconds, count] for the current request, None outside a request. """
+
+
+# ---------------------------------------------------------
+#
+def active() -> bool:
+    """ Return True when the current request is timed. """
+    return _timings.get() is not None
+
+
+# ---------------------------------------------------------
+#
+def record(name: str, seconds: float):
+    """ Add a measured duration to the current request metric.
+
+    Args:
+        name: Metric name.
+        seconds: Measured duration.
+    """
+    timings = _timings.get()
+
+    if timings is not None:
+        metric = timings.setdefault(name, [0.0, 0])
+        metric[0] += seconds
+        metric[1] += 1
+
+
+# ---------------------------------------------------------
+#
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """ Measure the duration of the block as the named metric.
+
+    Args:
+        name: Metric name.
+    """
+    if _timings.get() is None:
+        yield
+        return
+
+    start = perf_counter()
+
+    try:
+        yield
+
+    finally:
+        record(name, perf_counter() - start)
+
+
+# ---------------------------------------------------------
+#
+def _before_cursor_execute(conn: Connection, cursor: Any, statement: str,
+                           parameters: Any, context: Any, executemany: bool):
+    """ Store the statement start time in the execution context. """
+    context.server_timing_start = perf_counter()
+
+
+# ---------------------------------------------------------
+#
+def _after_cursor_execute(conn: Connection, cursor: Any, statement: str,
+                          parameters: Any, context: Any, executemany: bool):
+    """ Add the statement duration to the ``sql`` metric. """
+    record('sql', perf_counter() - context.server_timing_start)
+
+
+# ---------------------------------------------------------
+#
+def instrument_engine(engine: AsyncEngine):
+    """ Time every SQL statement that is executed by the engine.
+
+    It's safe to call it more than once for the same engine.
+
+    Args:
+        engine: Instrumented DB engine.
+    """
+    for name, listener in (('before_cursor_execute', _before_cursor_execute),
+                           ('after_cursor_execute', _after_cursor_execute)):
+        if not event.contains(engine.sync_engine, name, listener):
+            event.listen(engine.sync_engine, name, listener)
+
+
+# ---------------------------------------------------------
+#
+def summary(timings: Dict[str, List], total: float) -> Dict[str, float]:
+    """ Return the metrics in milliseconds, with the ``app`` remainder.
+
+    Args:
+        timings: Collected metrics.
+        total: Seconds until the response headers are sent.
+
+    Returns:
+        Metric name to milliseconds, plus the ``statements`` count.
+    """
+    measured = sum(timings[name][0] for name in METRICS if name in timings)
+    result = {name: round(timings[name][0] * 1000, 3)
+              for name in METRICS if name in timings}
+    result['app'] = round(max(total - measured, 0.0) * 1000, 3)
+    result['total'] = round(total * 1000, 3)
+    result['statements'] = timings.get('sql', [0.0, 0])[1]
+    return result
+
+
+# ---------------------------------------------------------
+#
+def header_value(fields: Dict[str, float]) -> str:
+    """ Return the metrics formatted as a Server-Timing header value.
+
+    Args:
+        fields: Metric name to milliseconds (see ``summary``).
+
+    Returns:
+        Server-Timing header value.
+    """
+    metrics = []
+
+    for name, value in fields.items():
+        if name == 'statements':
+            continue
+
+        desc = f';desc="{fields["statements"]} statements"' if name == 'sql' else ''
+        metrics.append(f'{name};dur={value}{desc}')
+
+    return ', '.join(metrics)
+
+
+# -----------------------------------------------------------------------------
+#
+class ServerTimingMiddleware:
+    """ Add a Server-Timing header with the request timing breakdown.
+
+    The same metrics are logged, as the ``server_timing`` log field.
+    """
+
+    def __init__(self, app: ASGIApp):
+        """ The class constructor.
+
+        Args:
+            app: Wrapped ASGI application.
+        """
+        self.app = app
+
+    # ---------------------------------------------------------
+    #
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        """ Time the request and add the header to the response.
+
+        Args:
+            scope: ASGI connection scope.
+            receive: ASGI receive channel.
+            send: ASGI send channel.
+        """
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        timings = {}
+        start = perf_counter()
+        token = _timings.set(timings)
+
+        async def send_with_timing(message: Message):
+            """ Add the header when the response is started. """
+            if message['type'] == 'http.response.start':
+                fields = summary(timings, perf_counter() - start)
+                MutableHeaders(scope=message).append('Server-Timing', header_value(fields))
+                logger.bind(server_timing=fields).info(
+                    f"{scope['method']} {scope['path']} {message['status']}: "
+                    f"{fields['total']} ms ({fields['statements']} statements)")
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+
+        finally:
+            _timings.reset(token)
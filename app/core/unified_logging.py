@@ -9,16 +9,64 @@ VERSION INFO:
     $Date: 2024-04-22 16:14:44
      $Rev: 1
 ```
+
+There are two logging profiles (see ``config.log_profile``):
+
+  - *development*: Colorized text on stderr, with the local variables
+    shown in tracebacks.
+  - *production*: One JSON object per line. The records are encoded and
+    written by a background thread, so that a log call never waits for
+    the stream. Tracebacks don't evaluate the local variables.
+
+Every record gets the ``request_id`` and ``method`` fields of the current
+request (see ``request_context``).
+
+A disabled level costs a method call and a level check. Arguments are
+only formatted when the record is logged, so use ``logger.debug('{}',
+value)`` rather than an f-string for frequent debug calls, and a
+``sampled`` logger for the high-volume ones.
 """
 
 # BUILTIN modules
 import sys
+import queue
 import logging
-from typing import cast
-from types import FrameType
+import threading
+import traceback
+from typing import Any, Callable, Dict, Optional, TextIO, Tuple
 
 # Third party modules
 from loguru import logger
+from pydantic_core import to_json
+
+# Local modules
+from .request_context import add_to_record
+
+# Constants
+STDLIB_LEVELS = {logging.DEBUG: 'DEBUG', logging.INFO: 'INFO', logging.WARNING: 'WARNING',
+                 logging.ERROR: 'ERROR', logging.CRITICAL: 'CRITICAL'}
+""" Python logging level numbers to Loguru level names. """
+LEVEL_NUMBERS = {'TRACE': 5, 'DEBUG': 10, 'INFO': 20, 'SUCCESS': 25,
+                 'WARNING': 30, 'ERROR': 40, 'CRITICAL': 50}
+""" Loguru level names to level numbers, for the built-in levels. """
+
+
+# ---------------------------------------------------------
+#
+def _stdlib_origin(record: dict):
+    """ Replace the InterceptHandler location with the Python logging call location.
+
+    Args:
+        record: Loguru record.
+    """
+    origin = record['extra'].pop('stdlib_record', None)
+
+    if origin is not None:
+        record.update(name=origin.name, function=origin.funcName, line=origin.lineno)
+
+
+_stdlib_logger = logger.patch(_stdlib_origin)
+""" Logger used for the records from the Python logging module. """
 
 
 # -----------------------------------------------------------------------------
@@ -29,54 +77,244 @@ class InterceptHandler(logging.Handler):
     def emit(self, record: logging.LogRecord):
         """ Move the specified logging record to loguru.
 
+        The call location is taken from the record (by a patch of the used
+        logger), instead of walking the stack frames back to the caller.
+
         Args:
             record: Original python log record.
         """
-        try:
-            level = logger.level(record.levelname).name
+        level = STDLIB_LEVELS.get(record.levelno, record.levelno)
+        log = (_stdlib_logger.opt(exception=record.exc_info)
+               if record.exc_info else _stdlib_logger)
+        log.log(level, '{}', record.getMessage(), stdlib_record=record)
 
-        except ValueError:
-            level = str(record.levelno)
 
-        frame, depth = logging.currentframe(), 0
+# -----------------------------------------------------------------------------
+#
+class QueueSink:
+    """ A stream sink where a background thread does the writing.
 
-        while frame and (depth == 0 or frame.f_code.co_filename == logging.__file__):
-            frame = cast(FrameType, frame.f_back)
-            depth += 1
+    The log call only puts the message on a queue, the writer thread
+    encodes (optionally) and writes everything that is queued in one call.
+    Loguru calls ``stop`` when the handler is removed, and the queue is
+    then drained.
 
-        logger.opt(
-            depth=depth,
-            exception=record.exc_info).log(
-            level,
-            record.getMessage()
-        )
+    Attributes:
+        stream: Written stream.
+        encode: Returns the written line of a message (with its record).
+    """
+
+    def __init__(self, stream: TextIO, encode: Callable[[Any], str] = str):
+        """ The class constructor.
+
+        Args:
+            stream: Written stream.
+            encode: Returns the written line of a message (with its record).
+        """
+        self.stream = stream
+        self.encode = encode
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    # ---------------------------------------------------------
+    #
+    def write(self, message: str):
+        """ Queue a formatted message.
+
+        Args:
+            message: Formatted log message.
+        """
+        self._queue.put(message)
+
+    # ---------------------------------------------------------
+    #
+    def stop(self):
+        """ Write the queued messages and stop the writer thread. """
+        self._queue.put(None)
+        self._thread.join()
+
+    # ---------------------------------------------------------
+    #
+    def _run(self):
+        """ Write queued messages until stopped. """
+        running = True
+
+        while running:
+            messages = [self._queue.get()]
+
+            while not self._queue.empty():
+                messages.append(self._queue.get())
+
+            if None in messages:
+                running = False
+                messages = messages[:messages.index(None)]
+
+            try:
+                self.stream.write(''.join(map(self.encode, messages)))
+                self.stream.flush()
+
+            except Exception as why:
+                print(f'Log writer failed: {why}', file=sys.stderr)
+
+
+# -----------------------------------------------------------------------------
+#
+class SampledLogger:
+    """ A logger where only the first, and then every Nth, call is logged.
+
+    The calls are counted per call location, and the skipped calls
+    return before a Loguru record is created.
+
+    Attributes:
+        rate: Sample rate, 100 means that every 100th call is logged.
+    """
+
+    def __init__(self, rate: int):
+        """ The class constructor.
+
+        Args:
+            rate: Sample rate, 100 means that every 100th call is logged.
+        """
+        self.rate = rate
+        self._counts: Dict[Tuple[Any, int], int] = {}
+
+    # ---------------------------------------------------------
+    #
+    def _log(self, level: str, message: str, args: tuple, kwargs: dict):
+        """ Log every Nth call from the location that called the public method.
+
+        A disabled level returns before the call location is looked up and
+        counted, using the same minimum level of all handlers that Loguru
+        itself checks first.
+
+        Args:
+            level: Log level name.
+            message: Log message (formatted with args and kwargs).
+            args: Message arguments.
+            kwargs: Message keyword arguments (also added as extra fields).
+        """
+        number = LEVEL_NUMBERS.get(level) or logger.level(level).no
+
+        if number < logger._core.min_level:
+            return
+
+        frame = sys._getframe(2)
+        location = (frame.f_code, frame.f_lineno)
+        count = self._counts.get(location, 0)
+        self._counts[location] = count + 1
+
+        if count % self.rate == 0:
+            logger.opt(depth=2).log(level, message, *args, **kwargs)
+
+    # ---------------------------------------------------------
+    #
+    def log(self, level: str, message: str, *args: Any, **kwargs: Any):
+        """ Log every Nth call from the caller location.
+
+        Args:
+            level: Log level name.
+            message: Log message (formatted with args and kwargs).
+            args: Message arguments.
+            kwargs: Message keyword arguments (also added as extra fields).
+        """
+        self._log(level, message, args, kwargs)
+
+    # ---------------------------------------------------------
+    #
+    def debug(self, message: str, *args: Any, **kwargs: Any):
+        """ Log every Nth call from the caller location with the DEBUG level. """
+        self._log('DEBUG', message, args, kwargs)
+
+    # ---------------------------------------------------------
+    #
+    def info(self, message: str, *args: Any, **kwargs: Any):
+        """ Log every Nth call from the caller location with the INFO level. """
+        self._log('INFO', message, args, kwargs)
+
+
+# ---------------------------------------------------------
+#
+def json_line(message: Any) -> str:
+    """ Return the record of a Loguru message as one JSON object line.
+
+    Args:
+        message: Loguru message (with its record).
+
+    Returns:
+        JSON encoded record line.
+    """
+    record = message.record
+    line = {'time': record['time'].isoformat(), 'level': record['level'].name,
+            'message': record['message'], 'logger': record['name'],
+            'function': record['function'], 'line': record['line']}
+    line.update((key, value) for key, value in record['extra'].items()
+                if value is not None)
+
+    if record['exception']:
+        line['exception'] = ''.join(traceback.format_exception(*record['exception']))
+
+    return to_json(line, fallback=str).decode() + '\n'
 
 
 # ---------------------------------------------------------
 #
-def create_unified_logger(log_level: str) -> logger:
+def sampled(rate: int) -> SampledLogger:
+    """ Return a logger where only every Nth call of a call location is logged.
+
+    Args:
+        rate: Sample rate, 100 means that every 100th call is logged.
+
+    Returns:
+        Sampled logger object.
+    """
+    return SampledLogger(rate)
+
+
+# ---------------------------------------------------------
+#
+def create_unified_logger(log_level: str, profile: str = 'development',
+                          sink: Optional[TextIO] = None) -> logger:
     """ Return unified Loguru logger object.
 
     Args:
         log_level: Desired log level.
+        profile: Logging profile, *development* or *production*.
+        sink: Written stream (stderr when not specified).
 
     Returns:
         Unified Loguru logger object.
     """
     level = log_level
+    sink = sink or sys.stderr
 
     # Remove all existing loggers.
     logger.remove()
 
-    # Create a basic Loguru logging config.
-    logger.add(
-        enqueue=False,
-        colorize=True,
-        diagnose=True,
-        backtrace=True,
-        sink=sys.stderr,
-        level=level.upper(),
-    )
+    # Add the current request ID and method to every record.
+    logger.configure(patcher=add_to_record)
+
+    if profile == 'production':
+        logger.add(
+            enqueue=False,
+            colorize=False,
+            diagnose=False,
+            backtrace=False,
+            format='{message}',
+            sink=QueueSink(sink, json_line),
+            level=level.upper(),
+        )
+
+    else:
+        # Create a basic Loguru logging config.
+        logger.add(
+            enqueue=False,
+            colorize=True,
+            diagnose=True,
+            backtrace=True,
+            sink=sink,
+            level=level.upper(),
+        )
 
     # Prepare to incorporate python standard logging.
     seen = set()
@@ -12,19 +12,115 @@ VERSION INFO:
 """
 
 # BUILTIN modules
+import asyncio
 from types import TracebackType
-from typing import TypeVar, Generic, Type, Optional
+from time import monotonic, perf_counter
+from typing import Any, Awaitable, Callable, TypeVar, Generic, Type, Optional
 
 # Third party modules
 from loguru import logger
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.exc import OperationalError
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 # Local modules
-from ..core.database import async_engine
+from . import server_timing
+from .config import RetryPolicy
+from .metrics import DB_ACQUIRE, DB_BUSY_FAILURES, DB_BUSY_RETRIES, DB_TRANSACTIONS
+from .unified_logging import sampled
+from ..core.database import async_engine, async_read_engine
 
 # Typing constants
 T = TypeVar("T", bound="AsyncSession")
+Operation = Callable[[Any], Awaitable[Any]]
+""" A write operation that receives an active CRUD class object. """
+
+# Constants
+BUSY_ERROR_CODES = (5, 6)
+""" SQLITE_BUSY and SQLITE_LOCKED (the primary result codes). """
+BUSY_ERROR_MESSAGES = ('database is locked', 'database is busy', 'database table is locked')
+""" Busy or locked error messages, when the result code isn't available. """
+DEBUG_SAMPLE_RATE = 100
+""" Only every Nth unit of work is debug logged, since there is one per request. """
+_log = sampled(DEBUG_SAMPLE_RATE)
+""" Sampled logger for the unit of work debug records. """
+
+
+# ---------------------------------------------------------
+#
+def is_busy_error(error: BaseException) -> bool:
+    """ Return True when the error is a busy or locked DB error.
+
+    Args:
+        error: Raised exception.
+
+    Returns:
+        True when the DB operation can be retried.
+    """
+    if not isinstance(error, OperationalError):
+        return False
+
+    code = getattr(error.orig, 'sqlite_errorcode', None)
+
+    if code is not None:
+        return code & 0xff in BUSY_ERROR_CODES
+
+    return any(message in str(error.orig) for message in BUSY_ERROR_MESSAGES)
+
+
+# ---------------------------------------------------------
+#
+async def retry_busy(name: str, policy: RetryPolicy,
+                     operation: Callable[[], Awaitable[Any]]) -> Any:
+    """ Run the operation, and re-run it when it fails with a busy or locked DB error.
+
+    The re-runs, and the failures after the last retry, are counted per name
+    (see ``metrics``).
+
+    Args:
+        name: Retried unit name (the metrics label).
+        policy: Retry policy.
+        operation: Complete unit of work, including its commit.
+
+    Returns:
+        The operation result.
+
+    Raises:
+        OperationalError: When the last retry failed, or the deadline is passed.
+    """
+    deadline = monotonic() + policy.deadline
+    retry = 0
+
+    while True:
+        try:
+            return await operation()
+
+        except OperationalError as why:
+            if not is_busy_error(why):
+                raise
+
+            retry += 1
+            delay = policy.delay(retry)
+
+            if retry >= policy.attempts or monotonic() + delay > deadline:
+                DB_BUSY_FAILURES.inc(name)
+                raise
+
+            DB_BUSY_RETRIES.inc(name)
+            logger.warning('{} unit of work retry {} in {:.3f} sec => {}',
+                           name, retry, delay, why.orig)
+            await asyncio.sleep(delay)
+
+
+write_session_maker = sessionmaker(
+    bind=async_engine, class_=AsyncSession, expire_on_commit=False
+)
+""" Session factory for the single connection writer engine. """
+
+read_session_maker = sessionmaker(
+    bind=async_read_engine, class_=AsyncSession, expire_on_commit=False
+)
+""" Session factory for the read-only engine. """
 
 
 # ------------------------------------------------------------------------
@@ -35,25 +131,45 @@ class UnitOfWork:
     It automatically handles transaction commit when everything worked and
     rollback when an exception occurs.
 
+    A read-only unit uses the read-only engine, so that it never has to
+    queue behind a bulk upsert on the writer connection. There is nothing
+    to commit, so the session is only closed, which ends the transaction
+    without expiring the loaded objects (a rollback would expire them,
+    and they could not be used after the unit is left).
+
+    The DB connection is acquired when the unit is entered, so that the
+    wait for it is measured (see ``metrics`` and ``server_timing``)
+    separately from the first statement.
+
+    A busy or locked DB error (another process holds the write lock for
+    longer than ``busy_timeout``) can't be handled inside the unit, the
+    whole unit has to be re-run. Use ``run`` with a retry policy for that.
+
     Attributes:
         session (AsyncSession): The SQLAlchemy asyncio session object.
+        read_only (bool): Use the read-only engine when True.
+        retry (RetryPolicy): Retry policy used by ``run``, None for no retries.
         crud_session_class (Any): Any CRUD class using a session object.
         async_session_maker (sessionmaker): The SQLAlchemy ORM sessionmaker class.
     """
 
     # ---------------------------------------------------------
     #
-    def __init__(self, crud_session_class: Generic[T]):
+    def __init__(self, crud_session_class: Generic[T], read_only: bool = False,
+                 retry: Optional[RetryPolicy] = None):
         """ The class constructor.
 
         Args:
             crud_session_class: Used CRUD session class.
+            read_only: Use the read-only engine when True.
+            retry: Retry policy used by ``run``, None for no retries.
         """
         self.session = None
+        self.retry = retry
+        self.read_only = read_only
         self.crud_session_class = crud_session_class
-        self.async_session_maker = sessionmaker(
-            bind=async_engine, class_=AsyncSession, expire_on_commit=False
-        )
+        self.async_session_maker = (read_session_maker if read_only
+                                    else write_session_maker)
 
     # ---------------------------------------------------------
     #
@@ -63,8 +179,12 @@ class UnitOfWork:
         Returns:
             A CRUD model with an active DB session.
         """
-        logger.debug('Establishing MySQL session...')
         self.session = self.async_session_maker()
+        start = perf_counter()
+        await self.session.connection()
+        waited = perf_counter() - start
+        DB_ACQUIRE.observe(waited, 'reader' if self.read_only else 'writer')
+        server_timing.record('acquire', waited)
         return self.crud_session_class(self.session)
 
     # ---------------------------------------------------------
@@ -81,13 +201,55 @@ class UnitOfWork:
             exc_val: Possible exception.
             traceback: Possible traceback type.
         """
-        if exc_type is not None:
-            logger.debug('MySQL rollback...')
-            await self.session.rollback()
+        outcome = 'close'
+
+        # The session is closed (and the connection is returned to
+        # the pool) even when the commit fails.
+        try:
+            if exc_type is not None:
+                outcome = 'rollback'
+                await self.session.rollback()
+
+            elif not self.read_only:
+                outcome = 'commit'
+
+                try:
+                    with server_timing.timed(outcome):
+                        await self.session.commit()
+
+                except Exception:
+                    outcome = 'rollback'
+                    raise
+
+        finally:
+            if outcome != 'close':
+                DB_TRANSACTIONS.inc(outcome)
+
+            await self.session.close()
+
+        _log.debug('{} unit of work ended with {}',
+                   self.crud_session_class.__name__, outcome)
+
+    # ---------------------------------------------------------
+    #
+    async def run(self, operation: Operation) -> Any:
+        """ Run the operation in the unit, and re-run the whole unit on busy errors.
+
+        The operation is re-run according to the retry policy (when there
+        is one), so it must not have side effects outside the DB session.
+
+        Args:
+            operation: Operation to run with a CRUD class object.
+
+        Returns:
+            The operation result.
+        """
+        async def unit() -> Any:
+            """ Run the operation once, including the commit. """
+            async with self as crud:
+                return await operation(crud)
 
-        else:
-            logger.debug('MySQL commit...')
-            await self.session.commit()
+        if self.retry is None:
+            return await unit()
 
-        logger.debug('Ending MySQL session...')
-        await self.session.close()
+        return await retry_busy(self.crud_session_class.__name__, self.retry, unit)
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# BUILTIN modules
+import asyncio
+from contextvars import Context
+from time import perf_counter
+from typing import Any, Generic, List, Optional
+
+# Third party modules
+from loguru import logger
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Local modules
+from .config import config
+from .server_timing import timed
+from .request_context import current, reset_current, set_current
+from .metrics import DB_ACQUIRE, DB_TRANSACTIONS
+from .unit_of_work import (UnitOfWork, Operation, is_busy_error, retry_busy,
+                           write_session_maker, T)
+
+
+# ------------------------------------------------------------------------
+#
+class WriteCoalescer:
+    """ Group-commit queue for small concurrent write operations.
+
+    Operations that arrive within a short window (or until the batch
+    is full) are run in one DB transaction, which means one commit (and
+    one fsync) for the whole group instead of one per request.
+
+    Every operation runs inside its own SAVEPOINT, so an exception
+    (like an ``IntegrityError``) only rolls back that operation and is
+    raised to its awaiting caller, while the rest of the group is
+    committed. When the final commit fails, all callers in the group
+    receive the commit exception.
+
+    Attributes:
+        window (float): Max seconds to wait for more operations.
+        max_batch (int): Max number of operations in one transaction.
+    """
+
+    # ---------------------------------------------------------
+    #
+    def __init__(self, window: float, max_batch: int):
+        """ The class constructor.
+
+        Args:
+            window: Max seconds to wait for more operations.
+            max_batch: Max number of operations in one transaction.
+        """
+        self.window = window
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # ---------------------------------------------------------
+    #
+    async def submit(self, crud_session_class: Generic[T],
+                     operation: Operation) -> Any:
+        """ Queue a write operation and wait for its own result.
+
+        Args:
+            crud_session_class: Used CRUD session class.
+            operation: Write operation to run with a CRUD class object.
+
+        Returns:
+            The operation result.
+
+        Raises:
+            Exception: The exception raised by the operation, or the commit.
+        """
+        loop = asyncio.get_running_loop()
+
+        # The background task is bound to the event loop it was started in.
+        # It's started in an empty context, since it's shared by all
+        # requests, and not part of the one that happened to start it.
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = Context().run(asyncio.create_task, self._run())
+
+        future = loop.create_future()
+        self._queue.put_nowait((crud_session_class, operation, future, current()))
+        return await future
+
+    # ---------------------------------------------------------
+    #
+    async def stop(self):
+        """ Flush queued operations and stop the background task. """
+        running = (self._task is not None and not self._task.done()
+                   and self._loop is asyncio.get_running_loop())
+
+        if running:
+            self._queue.put_nowait(None)
+            await self._task
+
+        self._task = None
+
+    # ---------------------------------------------------------
+    #
+    async def _run(self):
+        """ Collect operations into groups and run them until stopped. """
+        loop = asyncio.get_running_loop()
+
+        while True:
+            item = await self._queue.get()
+
+            if item is None:
+                return
+
+            batch = [item]
+            deadline = loop.time() + self.window
+
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+
+                try:
+                    item = (self._queue.get_nowait() if timeout <= 0
+                            else await asyncio.wait_for(self._queue.get(), timeout))
+
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+
+                if item is None:
+                    await self._flush(batch)
+                    return
+
+                batch.append(item)
+
+            await self._flush(batch)
+
+    # ---------------------------------------------------------
+    #
+    @staticmethod
+    async def _flush(batch: List[tuple]):
+        """ Run a group of operations in one transaction, and return the results.
+
+        The whole group is re-run when it fails with a busy or locked DB
+        error (see ``config.write_retry``). When the group fails, every
+        operation that doesn't have a result yet gets the exception.
+
+        Args:
+            batch: Queued (crud_session_class, operation, future, context) items.
+        """
+        try:
+            await retry_busy('group', config.write_retry,
+                             lambda: WriteCoalescer._run_group(batch))
+
+        except Exception as why:
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(why)
+
+    # ---------------------------------------------------------
+    #
+    @staticmethod
+    async def _run_group(batch: List[tuple]):
+        """ Run a group of operations in one transaction.
+
+        The outer transaction is started explicitly, since pysqlite only
+        begins a transaction implicitly before DML statements. Otherwise,
+        the first SAVEPOINT would run (and be released) in autocommit mode.
+        That is skipped when the session joins an already started
+        transaction with a SAVEPOINT (like the rolled back test transaction).
+
+        Each operation runs with the request context (request ID) of the
+        request that queued it, so that its logs are correlated. An
+        operation that fails is rolled back to its savepoint, and gets its
+        exception, unless it's a busy or locked DB error, which fails the
+        group (so that it can be re-run).
+
+        Args:
+            batch: Queued (crud_session_class, operation, future, context) items.
+
+        Raises:
+            Exception: The exception raised by the commit, or a busy error.
+        """
+        done = []
+        session: AsyncSession = write_session_maker()
+
+        try:
+            start = perf_counter()
+            connection = await session.connection()
+            DB_ACQUIRE.observe(perf_counter() - start, 'writer')
+
+            if not connection.in_nested_transaction():
+                await connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+            for crud_session_class, operation, future, context in batch:
+                if future.done():
+                    continue
+
+                token = set_current(context)
+
+                try:
+                    async with session.begin_nested():
+                        result = await operation(crud_session_class(session))
+
+                    done.append((future, result))
+
+                except Exception as why:
+                    if is_busy_error(why):
+                        raise
+
+                    future.set_exception(why)
+
+                finally:
+                    reset_current(token)
+
+            logger.bind(request_ids=[context[0] for *_, context in batch]).debug(
+                'Group commit of {} operation(s)...', len(done))
+            await session.commit()
+            DB_TRANSACTIONS.inc('commit')
+
+        except Exception:
+            await session.rollback()
+            DB_TRANSACTIONS.inc('rollback')
+            raise
+
+        else:
+            for future, result in done:
+                if not future.done():
+                    future.set_result(result)
+
+        finally:
+            await session.close()
+
+
+write_coalescer = WriteCoalescer(config.coalesce_window, config.coalesce_max_batch)
+""" The application write coalescer (used when write coalescing is enabled). """
+
+
+# ---------------------------------------------------------
+#
+async def run_write(crud_session_class: Generic[T], operation: Operation) -> Any:
+    """ Run a small write operation in its own, or in a group, transaction.
+
+    The operation is group-committed when ``config.write_coalescing``
+    is enabled, otherwise it's run in its own UnitOfWork. A group is run
+    in the coalescer task, so only the total wait for it is part of the
+    request timing (the ``coalesce`` Server-Timing metric).
+
+    Either way, it's re-run when the DB is busy or locked (by another
+    process), according to ``config.write_retry``. The operation must not
+    have side effects outside the DB session.
+
+    Args:
+        crud_session_class: Used CRUD session class.
+        operation: Write operation to run with a CRUD class object.
+
+    Returns:
+        The operation result.
+    """
+    if config.write_coalescing:
+        with timed('coalesce'):
+            return await write_coalescer.submit(crud_session_class, operation)
+
+    return await UnitOfWork(crud_session_class, retry=config.write_retry).run(operation)
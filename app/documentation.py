@@ -20,11 +20,19 @@ tags_metadata = [
         "name": "SMS_documents",
         "description": "These endpoints handles SMS transfer batch documents.",
     },
+    {
+        "name": "Ingest_jobs",
+        "description": "These endpoints handles asynchronous document ingestion jobs.",
+    },
+    {
+        "name": "Admin",
+        "description": "These endpoints handles service monitoring.",
+    },
 ]
 """ OpenAPI UBID endpoint tags documentation. """
 
 description = """
-**This is a RESTful API portal with 7 URL endpoints distributed over 2 groups that interfaces 2 SQLite
+**This is a RESTful API portal with 16 URL endpoints distributed over 4 groups that interfaces 4 SQLite
 tables in the ``tracking`` database.**
 <br><br>
 ![image](/static/overview.png)
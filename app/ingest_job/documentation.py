@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# Third party modules
+from fastapi import Path
+
+job_id_documentation = Path(
+    ...,
+    description='Specify an ingestion job ID to search for.<br>'
+                '*Example: `0b6f8f3e-58c1-4d1a-9bb5-1f6c3a2e7d41`*'
+)
+""" OpenAPI job ID Path documentation. """
+
+job_documentation = {
+    "id": "0b6f8f3e-58c1-4d1a-9bb5-1f6c3a2e7d41",
+    "UBID": "2a168739-b204-4abf-aec1-a88069e3cd08",
+    "state": "RUNNING",
+    "total": 5000,
+    "done": 2500,
+    "rate": 41250.5,
+    "error": None,
+    "created": "2024-12-11T18:51:22",
+    "started": "2024-12-11T18:51:22",
+    "finished": None
+}
+""" OpenAPI IngestJob example documentation. """
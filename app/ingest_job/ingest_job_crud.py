@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# BUILTIN modules
+from uuid import uuid4
+from typing import Optional
+
+# Third party modules
+from sqlalchemy.orm import defer
+from sqlmodel import select, update, func, or_, and_
+from sqlalchemy.engine.cursor import CursorResult
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Local modules
+from ..sms_document.models import SmsDocumentPayload
+from .models import IngestJobModel, IngestJobState
+
+
+# -----------------------------------------------------------------------------
+#
+class IngestJobCrud:
+    """ Ingestion job CRUD operations.
+
+    This class implements the IRepository protocol for ingestion job CRUD operations.
+
+    Attributes:
+        session (AsyncSession): Active SQLModel database session.
+    """
+
+    def __init__(self, session: AsyncSession):
+        """ Implicit constructor.
+
+        Args:
+            session: Current DB session.
+        """
+        self.session = session
+
+    # ---------------------------------------------------------
+    #
+    async def create(self, payload: SmsDocumentPayload) -> IngestJobModel:
+        """ Create a new queued job row in DB table tracking.ingest_jobs.
+
+        Args:
+            payload: SMS Document payload.
+
+        Returns:
+            The created job row.
+        """
+        job = IngestJobModel(id=str(uuid4()), UBID=payload.UBID,
+                             total=len(payload.documents),
+                             documents=payload.documents)
+        self.session.add(job)
+        await self.session.flush()
+        await self.session.refresh(job)
+        return job
+
+    # ---------------------------------------------------------
+    #
+    async def read(self, job_id: str) -> IngestJobModel | None:
+        """ Get specified job row from DB table tracking.ingest_jobs.
+
+        The stored documents are not loaded.
+
+        Args:
+            job_id: Job search key.
+
+        Returns:
+            Found job row, or None.
+        """
+        query = (
+            select(IngestJobModel)
+            .options(defer(IngestJobModel.documents))
+            .where(IngestJobModel.id == str(job_id))
+        )
+        result = await self.session.exec(query)
+        return result.one_or_none()
+
+    # ---------------------------------------------------------
+    #
+    async def claim(self, lease: int) -> IngestJobModel | None:
+        """ Claim the oldest available job in DB table tracking.ingest_jobs.
+
+        A job is available when it's queued, or when it's running with a
+        heartbeat that is older than the lease (its worker is gone). The
+        claim is one atomic UPDATE ... RETURNING statement, so the same job
+        is never claimed twice, even by workers in different processes.
+
+        Args:
+            lease: Seconds before a running job is considered abandoned.
+
+        Returns:
+            The claimed job row, or None when no job is available.
+        """
+        available = (
+            select(IngestJobModel.id)
+            .where(or_(
+                IngestJobModel.state == IngestJobState.QUEUED,
+                and_(IngestJobModel.state == IngestJobState.RUNNING,
+                     IngestJobModel.heartbeat < func.datetime('now', f'-{lease} seconds'))))
+            .order_by(IngestJobModel.created)
+            .limit(1)
+        )
+        query = (
+            update(IngestJobModel)
+            .where(IngestJobModel.id == available.scalar_subquery())
+            .values(state=IngestJobState.RUNNING,
+                    started=func.coalesce(IngestJobModel.started,
+                                          func.current_timestamp()),
+                    heartbeat=func.current_timestamp())
+            .returning(IngestJobModel)
+        )
+        result = await self.session.exec(query)
+        return result.scalars().one_or_none()
+
+    # ---------------------------------------------------------
+    #
+    async def progress(self, job_id: str, done: int) -> int:
+        """ Update job progress and heartbeat in DB table tracking.ingest_jobs.
+
+        Args:
+            job_id: Job search key.
+            done: Number of upserted documents.
+
+        Returns:
+            1 for successful UPDATE, 0 for failed UPDATE.
+        """
+        query = (
+            update(IngestJobModel)
+            .where(IngestJobModel.id == job_id)
+            .values(done=done, heartbeat=func.current_timestamp())
+        )
+        response: CursorResult = await self.session.exec(query)
+        return response.rowcount
+
+    # ---------------------------------------------------------
+    #
+    async def finish(self, job_id: str, state: IngestJobState,
+                     error: Optional[str] = None) -> int:
+        """ Finish (or requeue) a job in DB table tracking.ingest_jobs.
+
+        The stored documents are removed when the job is done, or failed.
+
+        Args:
+            job_id: Job search key.
+            state: Final state (QUEUED to requeue the job).
+            error: Failure reason.
+
+        Returns:
+            1 for successful UPDATE, 0 for failed UPDATE.
+        """
+        values = dict(state=state, error=error)
+
+        if state != IngestJobState.QUEUED:
+            values.update(finished=func.current_timestamp(), documents=None)
+
+        query = (
+            update(IngestJobModel)
+            .where(IngestJobModel.id == job_id)
+            .values(**values)
+        )
+        response: CursorResult = await self.session.exec(query)
+        return response.rowcount
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# BUILTIN modules
+from uuid import UUID
+
+# Third party modules
+from fastapi import APIRouter, HTTPException
+
+# Local modules
+from .models import IngestJob
+from ..core.responses import FastJSONResponse
+from ..core.unit_of_work import UnitOfWork
+from .ingest_job_crud import IngestJobCrud
+from ..core.models import NotFoundError
+from .documentation import job_id_documentation
+
+# Constants
+ROUTER = APIRouter(prefix="/tracking/jobs", tags=["Ingest_jobs"])
+""" jobs endpoint router. """
+
+
+# ---------------------------------------------------------
+#
+@ROUTER.get(
+    "/{job_id}/",
+    response_model=IngestJob,
+    responses={404: {"model": NotFoundError}},
+)
+async def read_ingest_job(job_id: UUID = job_id_documentation) -> FastJSONResponse:
+    """**Return the progress of an ingestion job from table tracking.ingest_jobs.**
+
+    Args:
+        job_id: Job search key.
+
+    Returns:
+        Job state, progress, rate and possible error.
+
+    Raises:
+        HTTPException(404): When the tracking.ingest_jobs row is not found.
+    """
+    async with UnitOfWork(IngestJobCrud, read_only=True) as crud:
+        job = await crud.read(job_id)
+
+    if not job:
+        errmsg = f"Job '{job_id}' is not found in table tracking.ingest_jobs"
+        raise HTTPException(status_code=404, detail=errmsg)
+
+    return FastJSONResponse(IngestJob.from_model(job))
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# BUILTIN modules
+import asyncio
+from typing import List, Optional
+
+# Third party modules
+from loguru import logger
+from sqlalchemy.exc import SQLAlchemyError
+
+# Local modules
+from ..core.config import config
+from .ingest_job_crud import IngestJobCrud
+from ..core.unit_of_work import UnitOfWork
+from .models import IngestJobModel, IngestJobState
+from ..sms_document.sms_document_crud import SmsDocumentCrud
+
+# Constants
+JOB_CHUNK_SIZE = 5000
+""" Documents per transaction (and progress update) when running a job. """
+
+
+# ------------------------------------------------------------------------
+#
+class IngestJobWorkers:
+    """ A bounded in-process pool of ingestion job workers.
+
+    The jobs are queued in DB table tracking.ingest_jobs, not in memory,
+    so queued and interrupted jobs survive a restart, and several service
+    processes can share the same queue.
+
+    Attributes:
+        size (int): Number of concurrent workers.
+        lease (int): Seconds before a running job is considered abandoned.
+        poll_interval (float): Max seconds between looking for new jobs.
+    """
+
+    # ---------------------------------------------------------
+    #
+    def __init__(self, size: int, lease: int, poll_interval: float):
+        """ The class constructor.
+
+        Args:
+            size: Number of concurrent workers.
+            lease: Seconds before a running job is considered abandoned.
+            poll_interval: Max seconds between looking for new jobs.
+        """
+        self.size = size
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    # ---------------------------------------------------------
+    #
+    def start(self):
+        """ Start the workers, they immediately pick up any pending jobs. """
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work(idx))
+                       for idx in range(self.size)]
+
+    # ---------------------------------------------------------
+    #
+    async def stop(self):
+        """ Stop the workers, an interrupted job is requeued. """
+        for task in self._tasks:
+            task.cancel()
+
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # ---------------------------------------------------------
+    #
+    def notify(self):
+        """ Wake up idle workers since a new job is queued. """
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # ---------------------------------------------------------
+    #
+    async def _work(self, idx: int):
+        """ Claim and run jobs until cancelled.
+
+        Args:
+            idx: Worker number.
+        """
+        while True:
+            try:
+                job = await UnitOfWork(IngestJobCrud, retry=config.write_retry).run(
+                    lambda crud: crud.claim(self.lease))
+
+            except SQLAlchemyError as why:
+                logger.error(f'Ingest worker {idx} failed to claim a job => {why}')
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+
+                except asyncio.TimeoutError:
+                    pass
+
+                continue
+
+            # An unexpected error must not end the worker, the job is
+            # requeued by the next claim when its lease has expired.
+            try:
+                await self.run(job)
+
+            except Exception:
+                logger.exception(f'Ingest worker {idx} failed to run job {job.id}')
+
+    # ---------------------------------------------------------
+    #
+    @staticmethod
+    async def finish(job: IngestJobModel, state: IngestJobState,
+                     error: Optional[str] = None):
+        """ Store the end state of a job.
+
+        A failure is logged, the job is then claimed again when its
+        lease has expired.
+
+        Args:
+            job: Claimed job row.
+            state: End state.
+            error: Failure reason.
+        """
+        try:
+            await UnitOfWork(IngestJobCrud, retry=config.write_retry).run(
+                lambda crud: crud.finish(job.id, state, error))
+
+        except SQLAlchemyError as why:
+            logger.error(f'Ingest job {job.id} failed to store state {state} => {why}')
+
+    # ---------------------------------------------------------
+    #
+    @staticmethod
+    async def run(job: IngestJobModel):
+        """ Upsert the job documents, starting where the job was interrupted.
+
+        Every chunk and its progress update are committed together, so a
+        chunk is re-run when the DB is busy. Any other error fails the job
+        (a cancelled job is requeued).
+
+        Args:
+            job: Claimed job row.
+        """
+        done = job.done
+        logger.info(f'Running ingest job {job.id} ({done}/{job.total} done)...')
+
+        try:
+            while done < job.total:
+                rows = job.documents[done:done + JOB_CHUNK_SIZE]
+
+                async def upsert_chunk(crud: SmsDocumentCrud):
+                    """ Upsert the chunk and store the progress (can be re-run). """
+                    await crud.upsert_rows(rows, ubid=job.UBID)
+                    await IngestJobCrud(crud.session).progress(job.id, done + len(rows))
+
+                await UnitOfWork(SmsDocumentCrud, retry=config.write_retry).run(upsert_chunk)
+                done += len(rows)
+
+            state, error = IngestJobState.DONE, None
+
+        except asyncio.CancelledError:
+            await IngestJobWorkers.finish(job, IngestJobState.QUEUED)
+            raise
+
+        except SQLAlchemyError as why:
+            state, error = IngestJobState.FAILED, str(why.args[0])
+            logger.error(f'Ingest job {job.id} failed => {error}')
+
+        except Exception as why:
+            state, error = IngestJobState.FAILED, f'{type(why).__name__}: {why}'
+            logger.exception(f'Ingest job {job.id} failed => {error}')
+
+        await IngestJobWorkers.finish(job, state, error)
+
+
+job_workers = IngestJobWorkers(config.job_workers, config.job_lease,
+                               config.job_poll_interval)
+""" The application ingestion job worker pool. """
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# BUILTIN modules
+from enum import Enum
+from typing import Optional, List
+from datetime import datetime, timezone
+
+# Third party modules
+from pydantic import ConfigDict
+from sqlmodel import SQLModel, Field, text
+from sqlalchemy.dialects.sqlite import CHAR, JSON, TIMESTAMP
+
+# Local modules
+from ..core.models import ValidatingSQLModel
+from .documentation import job_documentation
+
+
+# -----------------------------------------------------------------------------
+#
+class IngestJobState(str, Enum):
+    """ Ingestion job states.
+
+    Note that they are ordered in the correct state change order sequence.
+    """
+    QUEUED = "QUEUED"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    FAILED = "FAILED"
+
+
+# -----------------------------------------------------------------------------
+#
+class IngestJob(SQLModel):
+    """ An ingestion job status model.
+
+    Attributes:
+        id: Unique job ID.
+        UBID: The SMS transfer batch ID.
+        state: Job state.
+        total: Number of documents in the job.
+        done: Number of upserted documents.
+        rate: Upserted documents per second since the job started.
+        error: Failure reason, when the job failed.
+        created: Timestamp when the job was queued.
+        started: Timestamp when the job was first claimed by a worker.
+        finished: Timestamp when the job was done, or failed.
+    """
+    model_config = ConfigDict(json_schema_extra={"example": job_documentation})
+
+    id: str
+    UBID: str
+    state: IngestJobState
+    total: int
+    done: int
+    rate: float = 0.0
+    error: Optional[str] = None
+    created: Optional[datetime] = None
+    started: Optional[datetime] = None
+    finished: Optional[datetime] = None
+
+    # ---------------------------------------------------------
+    #
+    @classmethod
+    def from_model(cls, model: "IngestJobModel") -> "IngestJob":
+        """ Return the job status, including the rate, for a job DB row.
+
+        Args:
+            model: Ingestion job DB model.
+
+        Returns:
+            Ingestion job status.
+        """
+        job = cls.model_validate(model, from_attributes=True)
+
+        if job.started and job.done:
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            elapsed = ((job.finished or now) - job.started).total_seconds()
+            job.rate = round(job.done / max(elapsed, 1.0), 1)
+
+        return job
+
+
+# ---------------------------------------------------------
+#
+class IngestJobModel(ValidatingSQLModel, table=True):
+    """ A DB table definition for a queued document ingestion job.
+
+    The job documents are stored in the table until the job is finished,
+    which means that queued (and interrupted) work survives a restart.
+    The ``done`` value is updated in the same transaction as every
+    upserted chunk, so an interrupted job resumes where it stopped.
+
+    A running job updates ``heartbeat`` with every chunk. A worker can
+    claim a RUNNING job with an expired heartbeat (its worker is gone).
+
+    Attributes:
+        id: Unique job ID.
+        UBID: The SMS transfer batch ID.
+        state: Job state.
+        total: Number of documents in the job.
+        done: Number of upserted documents.
+        error: Failure reason, when the job failed.
+        created: Timestamp when the job was queued.
+        started: Timestamp when the job was first claimed by a worker.
+        finished: Timestamp when the job was done, or failed.
+        heartbeat: Timestamp of the last progress update.
+        documents: The SMS documents (cleared when the job is finished).
+    """
+    __tablename__ = "ingest_jobs"
+
+    id: str = Field(sa_type=CHAR(36), primary_key=True)
+    UBID: str = Field(sa_type=CHAR(36), nullable=False)
+    state: IngestJobState = Field(
+        default=IngestJobState.QUEUED, index=True,
+        sa_column_kwargs={'nullable': False, 'server_default': IngestJobState.QUEUED}
+    )
+    total: int = Field(nullable=False)
+    done: int = Field(
+        default=0,
+        sa_column_kwargs={'nullable': False, 'server_default': text("0")}
+    )
+    error: Optional[str] = Field(default=None, nullable=True)
+    created: Optional[datetime] = Field(
+        default=None,
+        sa_type=TIMESTAMP,
+        sa_column_kwargs={'nullable': False,
+                          'server_default': text("CURRENT_TIMESTAMP")}
+    )
+    started: Optional[datetime] = Field(default=None, sa_type=TIMESTAMP, nullable=True)
+    finished: Optional[datetime] = Field(default=None, sa_type=TIMESTAMP, nullable=True)
+    heartbeat: Optional[datetime] = Field(default=None, sa_type=TIMESTAMP, nullable=True)
+    documents: Optional[List[dict]] = Field(default=None, sa_type=JSON, nullable=True)
@@ -12,38 +12,37 @@ VERSION INFO:
 """
 
 # BUILTIN modules
-from typing import Any
 from pathlib import Path
-from dataclasses import dataclass
 from contextlib import asynccontextmanager
 
 # Third party modules
-from fastapi import FastAPI
-from sqlalchemy import event
+from fastapi import FastAPI, Request
+from sqlalchemy.exc import OperationalError
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.dialects.sqlite.aiosqlite import AsyncAdapt_aiosqlite_connection
+from starlette.middleware.gzip import GZipMiddleware
 
 # Local modules
+from .core.config import config
+from .core.responses import FastJSONResponse
+from .core.admission import AdmissionMiddleware, bulk_admission
+from .core.compression import DecompressionMiddleware
+from .core import metrics, query_stats, server_timing
+from .core.unit_of_work import is_busy_error
+from .core.request_context import RequestIdMiddleware
 from .core.unified_logging import create_unified_logger
 from .documentation import tags_metadata, description
 from .sms_document.sms_document_routes import ROUTER as sms_document_router
 from .sms_transfer.sms_transfer_routes import ROUTER as sms_transfer_router
-from .core.database import create_async_db_tables, close_async_db, async_engine
+from .core.write_coalescer import write_coalescer
+from .ingest_job.ingest_job_worker import job_workers
+from .ingest_job.ingest_job_routes import ROUTER as ingest_job_router
+from .admin.admin_routes import ROUTER as admin_router
+from .core.database import (async_engine, async_read_engine,
+                            create_async_db_tables, close_async_db)
 
-
-# -----------------------------------------------------------------------------
-#
-@dataclass(frozen=True)
-class Configuration:
-    """ Configuration parameters for the FastAPI app. """
-    version: str = '0.5.0'
-    log_level: str = 'info'
-    title: str = 'TrackingDb API'
-    name: str = 'TrackingDbService'
-
-
-config = Configuration()
-""" A simplified config handling since this is a example that needs to be small. """
+# Constants
+DB_BUSY_RETRY_AFTER = 1
+""" Seconds a client should wait before retrying a request that failed on a busy DB. """
 
 
 # -----------------------------------------------------------------------------
@@ -51,7 +50,14 @@ config = Configuration()
 class Service(FastAPI):
     """
     This class adds router and image handling for the OpenAPI documentation
-    as well as unified logging.
+    as well as unified logging. Responses are serialized by the
+    ``FastJSONResponse`` class, unless another class is specified.
+    Document uploads can be gzip (or zstd) compressed, and large
+    responses are gzip compressed when the client accepts it. Every
+    response gets a Server-Timing header, unless it's disabled, and the
+    service metrics are available in the Prometheus format. Every request
+    has an X-Request-ID, that is added to its logs and its response. Bulk
+    document upserts are admission controlled.
 
     Attributes:
         logger: logger object instance.
@@ -66,6 +72,7 @@ class Service(FastAPI):
             args: Named arguments.
             kwargs: Key-value pair arguments.
         """
+        kwargs.setdefault('default_response_class', FastJSONResponse)
         super().__init__(*args, **kwargs)
 
         # Needed for OpenAPI Markdown images to be displayed.
@@ -77,22 +84,90 @@ class Service(FastAPI):
         # file (app/documentation.py).
         self.include_router(sms_document_router)
         self.include_router(sms_transfer_router)
+        self.include_router(ingest_job_router)
+        self.include_router(admin_router)
+
+        # Accept compressed document uploads, and compress large
+        # responses for clients that send Accept-Encoding: gzip.
+        self.add_middleware(DecompressionMiddleware,
+                            paths=(sms_document_router.prefix,),
+                            max_size=config.max_decompressed_body)
+
+        # Limit the concurrent bulk document upserts (including the
+        # streamed ones), and their queued request bodies (outside the
+        # decompression, that removes the Content-Length header).
+        self.add_middleware(AdmissionMiddleware, controller=bulk_admission,
+                            routes=(('POST', f'{sms_document_router.prefix}/'),),
+                            streams=(('POST', f'{sms_document_router.prefix}/[^/]+/stream'),))
+        self.add_middleware(GZipMiddleware, minimum_size=config.gzip_min_size)
+
+        # Time the connection wait, SQL, commit and serialization of
+        # every request (outside the compression, admission and routes,
+        # and inside the metrics and request ID middlewares, so that its
+        # log record gets the request ID).
+        if config.server_timing:
+            server_timing.instrument_engine(async_engine)
+            server_timing.instrument_engine(async_read_engine)
+            self.add_middleware(server_timing.ServerTimingMiddleware)
+
+        # Count changed rows, and measure the latency of every route
+        # (see the /tracking/metrics endpoint).
+        metrics.instrument_engine(async_engine)
+        metrics.instrument_engine(async_read_engine)
+        self.add_middleware(metrics.MetricsMiddleware)
+
+        # Collect statistics per SQL statement, and log the slow ones
+        # (see the /tracking/admin/queries endpoint).
+        query_stats.instrument_engine(async_engine)
+        query_stats.instrument_engine(async_read_engine)
+
+        # Assign or propagate the X-Request-ID of every request (outermost,
+        # so that the logs of the other middlewares are correlated too).
+        self.add_middleware(RequestIdMiddleware)
+
+        # A unit of work that is still busy after its retries is a 503.
+        self.add_exception_handler(OperationalError, db_busy_handler)
 
         # Unify logging within the imported package's closure.
-        self.logger = create_unified_logger(config.log_level)
+        self.logger = create_unified_logger(config.log_level, config.log_profile)
+
+
+# ---------------------------------------------------------
+#
+async def db_busy_handler(_: Request, exc: OperationalError) -> FastJSONResponse:
+    """ Return 503 when the DB is still busy or locked after the last retry.
+
+    The Retry-After header tells the client when to try again. Other
+    operational errors are re-raised (and returned as 500).
+
+    Args:
+        _: Not used (needed by signature).
+        exc: Raised DB error.
+
+    Returns:
+        Service unavailable response.
+    """
+    if not is_busy_error(exc):
+        raise exc
+
+    return FastJSONResponse({'detail': f'The DB is busy => {exc.orig}'}, status_code=503,
+                            headers={'Retry-After': str(DB_BUSY_RETRY_AFTER)})
 
 
 # ---------------------------------------------------------
 #
 async def startup():
-    """ Create asynchronous database pool and missing tables. """
+    """ Create asynchronous database pool, missing tables and start job workers. """
     await create_async_db_tables()
+    job_workers.start()
 
 
 # ---------------------------------------------------------
 #
 async def shutdown():
-    """ Close asynchronous database connection pool. """
+    """ Stop job workers, flush queued writes and close the DB connection pools. """
+    await job_workers.stop()
+    await write_coalescer.stop()
     await close_async_db()
 
 
@@ -118,16 +193,3 @@ app = Service(
 )
 """ Create the FastAPI application. """
 
-
-# ---------------------------------------------------------
-#
-@event.listens_for(async_engine.sync_engine, "connect")
-def set_sqlite_pragma(dbapi_connection: AsyncAdapt_aiosqlite_connection, _: Any):
-    """ Enable foreign key usage on the sqlite database.
-
-    Args:
-        dbapi_connection: DB connection object.
-        _: Not used (needed by signature).
-    """
-    cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA foreign_keys=ON")
@@ -53,3 +53,40 @@ query_response_documentation = {
               "'2a168739-b204-4abf-aec1-a88069e3cd08' in table tracking.sms_documents"
 }
 """ OpenAPI Query response example documentation. """
+
+stream_response_documentation = {
+    "documents": 412343,
+    "chunks": 825,
+    "result": "Inserted 412343 document(s) for UBID "
+              "'2a168739-b204-4abf-aec1-a88069e3cd08' in table tracking.sms_documents"
+}
+""" OpenAPI Stream response example documentation. """
+
+stats_documentation = {
+    "UBID": "2a168739-b204-4abf-aec1-a88069e3cd08",
+    "INIT": 412000,
+    "SENT": 300,
+    "DONE": 43,
+    "total": 412343
+}
+""" OpenAPI SmsDocumentStats example documentation. """
+
+ranges_documentation = {
+    "UBID": "2a168739-b204-4abf-aec1-a88069e3cd08",
+    "documents": 300000,
+    "ranges": [
+        {"first": 1, "last": 250000, "count": 250000},
+        {"first": 255001, "last": 305000, "count": 50000}
+    ]
+}
+""" OpenAPI SmsDocumentRanges example documentation. """
+
+stream_body_documentation = (
+    '{"SMScount": 1, "uniqueId": "1000019152", "data": {"source": "DentalCare", '
+    '"destination": "+01708804622", "userData": "Welcome to your...", '
+    '"refId": "2a168739-b204-4abf-aec1-a88069e3cd08.0000019152"}}\n'
+    '{"SMScount": 1, "uniqueId": "1000019153", "data": {"source": "DentalCare", '
+    '"destination": "+01708804623", "userData": "Welcome to your...", '
+    '"refId": "2a168739-b204-4abf-aec1-a88069e3cd08.0000019153"}}\n'
+)
+""" OpenAPI NDJSON stream request body example documentation. """
@@ -14,16 +14,21 @@ VERSION INFO:
 # BUILTIN modules
 from enum import Enum
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Annotated
 
 # Third party modules
-from pydantic import PositiveInt, ConfigDict
+from typing_extensions import TypedDict
+from pydantic import PositiveInt, ConfigDict, StringConstraints, TypeAdapter
+from sqlalchemy import Connection, Select, Table, event
 from sqlalchemy.dialects.sqlite import CHAR, JSON, TIMESTAMP
-from sqlmodel import SQLModel, Field, Column, ForeignKey, text
+from sqlmodel import (SQLModel, Field, Column, ForeignKey, text,
+                      select, insert, func, case)
 
 # Local modules
 from ..core.models import ValidatingSQLModel
-from .documentation import payload_documentation, query_response_documentation
+from .documentation import (payload_documentation, query_response_documentation,
+                            stream_response_documentation, stats_documentation,
+                            ranges_documentation)
 
 
 # -----------------------------------------------------------------------------
@@ -53,19 +58,94 @@ class QueryResponse(SQLModel):
 
 # -----------------------------------------------------------------------------
 #
-class SmsDocumentItem(SQLModel):
+class StreamResponse(QueryResponse):
+    """ A streaming ingestion response model.
+
+    Attributes:
+        documents: Number of received documents.
+        chunks: Number of upserted document chunks.
+    """
+    model_config = ConfigDict(json_schema_extra={"example": stream_response_documentation})
+
+    documents: int
+    chunks: int
+
+
+# -----------------------------------------------------------------------------
+#
+class SmsDocumentStats(SQLModel):
+    """ An SMS batch document state statistics model.
+
+    Attributes:
+        UBID: The SMS transfer batch ID.
+        INIT: Number of documents in state INIT.
+        SENT: Number of documents in state SENT.
+        DONE: Number of documents in state DONE.
+        total: Number of documents in the batch.
+    """
+    model_config = ConfigDict(json_schema_extra={"example": stats_documentation})
+
+    UBID: str
+    INIT: int
+    SENT: int
+    DONE: int
+    total: int
+
+
+# -----------------------------------------------------------------------------
+#
+class UniqueIdRange(SQLModel):
+    """ A range of consecutive numeric SMS document uniqueId values.
+
+    Attributes:
+        first: First uniqueId in the range.
+        last: Last uniqueId in the range.
+        count: Number of documents in the range.
+    """
+    first: int
+    last: int
+    count: int
+
+
+# -----------------------------------------------------------------------------
+#
+class SmsDocumentRanges(SQLModel):
+    """ The stored uniqueId ranges of an SMS batch model.
+
+    Attributes:
+        UBID: The SMS transfer batch ID.
+        documents: Number of documents in the ranges.
+        ranges: Stored uniqueId ranges, in ascending order.
+    """
+    model_config = ConfigDict(json_schema_extra={"example": ranges_documentation})
+
+    UBID: str
+    documents: int
+    ranges: List[UniqueIdRange]
+
+
+# -----------------------------------------------------------------------------
+#
+class SmsDocumentItem(TypedDict):
     """ An SMS document payload item.
 
+    This is a TypedDict and not a model, so a whole documents array is
+    validated in one pydantic-core pass into plain dicts that are bound
+    directly to the UPSERT statement. The batch ``UBID`` is bound once
+    per statement, any ``UBID`` key in an item is dropped.
+
     Attributes:
         data: The SMS metadata.
         SMScount: Number of 160 character block message splits.
-        UBID: The SMS transfer batch ID.
         uniqueId: Unique SMS transfer ID.
     """
     data: dict
     SMScount: PositiveInt
-    UBID: Optional[str] = None
-    uniqueId: str = Field(max_length=10)
+    uniqueId: Annotated[str, StringConstraints(max_length=10)]
+
+
+document_item_adapter = TypeAdapter(SmsDocumentItem)
+""" Validator for one SMS document payload item (used by NDJSON streaming). """
 
 
 # -----------------------------------------------------------------------------
@@ -77,12 +157,12 @@ class SmsDocumentPayload(SQLModel):
         UBID: The SMS transfer BATCH ID.
         documents:
             A dictionary containing the SMS documents in the transfer batch.
-            A limit is set to a maximum of 5000 documents.
+            A limit is set to a maximum of 50000 documents.
     """
     model_config = ConfigDict(json_schema_extra={"example": payload_documentation})
 
     UBID: str = Field(max_length=36)
-    documents: List[SmsDocumentItem] = Field(max_length=5000)
+    documents: List[SmsDocumentItem] = Field(max_length=50000)
 
 
 # ---------------------------------------------------------
@@ -129,3 +209,137 @@ class SmsDocumentModel(ValidatingSQLModel, table=True):
                           'server_default': text("CURRENT_TIMESTAMP")}
     )
     data: dict = Field(sa_type=JSON, nullable=False)
+
+
+# ---------------------------------------------------------
+#
+class SmsDocumentCounterModel(ValidatingSQLModel, table=True):
+    """ A DB table definition for the per-batch SMS document counters.
+
+    The counters are maintained by the triggers in ``COUNTER_TRIGGERS``
+    on every INSERT, UPDATE and DELETE in table tracking.sms_documents,
+    so a batch count is a primary key lookup instead of an index scan.
+
+    Note that a foreign key is defined against the SmsTransferModel
+    with a cascading-delete, the same as for the documents.
+
+    Attributes:
+        UBID: The SMS transfer batch ID.
+        INIT: Number of documents in state INIT.
+        SENT: Number of documents in state SENT.
+        DONE: Number of documents in state DONE.
+    """
+    __tablename__ = "sms_document_counters"
+
+    UBID: str = Field(
+        sa_column=Column(
+            CHAR(36), ForeignKey("sms_transfers.UBID", ondelete="CASCADE"),
+            primary_key=True)
+    )
+    INIT: int = Field(
+        default=0,
+        sa_column_kwargs={'nullable': False, 'server_default': text("0")}
+    )
+    SENT: int = Field(
+        default=0,
+        sa_column_kwargs={'nullable': False, 'server_default': text("0")}
+    )
+    DONE: int = Field(
+        default=0,
+        sa_column_kwargs={'nullable': False, 'server_default': text("0")}
+    )
+
+
+COUNTER_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS sms_documents_count_insert
+    AFTER INSERT ON sms_documents
+    BEGIN
+        INSERT INTO sms_document_counters (UBID, INIT, SENT, DONE)
+        VALUES (NEW.UBID, NEW.state = 'INIT', NEW.state = 'SENT', NEW.state = 'DONE')
+        ON CONFLICT (UBID) DO UPDATE SET
+            INIT = INIT + excluded.INIT,
+            SENT = SENT + excluded.SENT,
+            DONE = DONE + excluded.DONE;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS sms_documents_count_update
+    AFTER UPDATE OF state, UBID ON sms_documents
+    WHEN OLD.state IS NOT NEW.state OR OLD.UBID IS NOT NEW.UBID
+    BEGIN
+        UPDATE sms_document_counters SET
+            INIT = INIT - (OLD.state = 'INIT'),
+            SENT = SENT - (OLD.state = 'SENT'),
+            DONE = DONE - (OLD.state = 'DONE')
+        WHERE UBID = OLD.UBID;
+        INSERT INTO sms_document_counters (UBID, INIT, SENT, DONE)
+        VALUES (NEW.UBID, NEW.state = 'INIT', NEW.state = 'SENT', NEW.state = 'DONE')
+        ON CONFLICT (UBID) DO UPDATE SET
+            INIT = INIT + excluded.INIT,
+            SENT = SENT + excluded.SENT,
+            DONE = DONE + excluded.DONE;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS sms_documents_count_delete
+    AFTER DELETE ON sms_documents
+    BEGIN
+        UPDATE sms_document_counters SET
+            INIT = INIT - (OLD.state = 'INIT'),
+            SENT = SENT - (OLD.state = 'SENT'),
+            DONE = DONE - (OLD.state = 'DONE')
+        WHERE UBID = OLD.UBID;
+    END
+    """,
+)
+""" Triggers that keep table tracking.sms_document_counters up to date. """
+
+
+# ---------------------------------------------------------
+#
+def counter_totals(ubid: Optional[str] = None) -> Select:
+    """ Return a query that counts the documents per batch and state.
+
+    This is the (expensive) source of truth for the counters, it's
+    used when the counters are seeded, or checked for consistency.
+
+    Args:
+        ubid: Only count this batch, all batches when not specified.
+
+    Returns:
+        Query returning UBID, INIT, SENT and DONE columns.
+    """
+    doc = SmsDocumentModel.__table__.c
+    query = (
+        select(doc.UBID, *[func.count(case((doc.state == state.value, 1)))
+                           .label(state.value) for state in SmsDocumentState])
+        .group_by(doc.UBID)
+    )
+
+    if ubid:
+        query = query.where(doc.UBID == ubid)
+
+    return query
+
+
+# ---------------------------------------------------------
+#
+@event.listens_for(SQLModel.metadata, 'after_create')
+def create_counter_triggers(_, connection: Connection, tables: List[Table], **__):
+    """ Create the counter triggers, and seed the counters when the table is new.
+
+    Seeding makes an existing DB consistent the first time it's started
+    with the counters table.
+
+    Args:
+        connection: Active DB connection.
+        tables: The tables that were created.
+    """
+    for trigger in COUNTER_TRIGGERS:
+        connection.exec_driver_sql(trigger)
+
+    if SmsDocumentCounterModel.__table__ in tables:
+        columns = ['UBID'] + [state.value for state in SmsDocumentState]
+        connection.execute(insert(SmsDocumentCounterModel.__table__)
+                           .from_select(columns, counter_totals()))
@@ -13,15 +13,22 @@ VERSION INFO:
 
 # BUILTIN modules
 from uuid import UUID
+from typing import List, Optional
 
 # Third party modules
-from sqlmodel import select, update, func
+from sqlalchemy import bindparam
+from sqlmodel import select, update, delete, insert, func, or_, cast, Integer
 from sqlalchemy.engine.cursor import CursorResult
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.dialects.sqlite import insert as upsert
 
 # Local modules
-from .models import SmsDocumentModel, SmsDocumentState, SmsDocumentPayload
+from .models import (SmsDocumentModel, SmsDocumentState, SmsDocumentPayload,
+                     SmsDocumentCounterModel, UniqueIdRange, counter_totals)
+
+# Constants
+UPSERT_CHUNK_SIZE = 500
+""" Documents per UPSERT statement (tuned with benchmarks/bench_upsert_chunks.py). """
 
 
 # -----------------------------------------------------------------------------
@@ -45,13 +52,23 @@ class SmsDocumentCrud:
 
     # ---------------------------------------------------------
     #
-    async def create(self, payload: SmsDocumentPayload) -> int:
+    async def create(self, payload: SmsDocumentPayload,
+                     chunk_size: int = UPSERT_CHUNK_SIZE) -> int:
         """
         Create new SMS document row(s) in DB table
         tracking.sms_documents.
 
         Note that this is a BULK UPSERT operation since there
-        can be thousands of documents in a batch.
+        can be thousands of documents in a batch. One UPSERT
+        statement is compiled and then executed (executemany)
+        for every chunk of documents within the current
+        transaction. Since every row is bound separately, the
+        SQLite bound-parameter limit never applies, and the
+        event loop is released between the chunks.
+
+        The validated payload documents are bound as they are, the
+        ``UBID`` is bound once in the statement, so no copy of the
+        documents is made.
 
         The UPSERT usage can come in handy when a transfer fails,
         and you have to retry sending the batch (the batch state
@@ -63,16 +80,32 @@ class SmsDocumentCrud:
 
         Args:
             payload: SMS Document payload.
+            chunk_size: Max number of documents per executemany call.
 
         Returns:
-            1 for successful Upsert, 0 for failed Upsert.
+            Number of upserted documents.
         """
-        for document in payload.documents:
-            document.UBID = payload.UBID
+        return await self.upsert_rows(payload.documents, chunk_size, payload.UBID)
 
+    # ---------------------------------------------------------
+    #
+    async def upsert_rows(self, rows: List[dict],
+                          chunk_size: int = UPSERT_CHUNK_SIZE,
+                          ubid: Optional[str] = None) -> int:
+        """
+        Upsert SMS document rows in DB table tracking.sms_documents.
+
+        Args:
+            rows: SMS document rows.
+            chunk_size: Max number of documents per executemany call.
+            ubid: Batch ID bound for all rows, when the rows don't contain it.
+
+        Returns:
+            Number of upserted documents.
+        """
+        count = 0
         query = (
-            upsert(SmsDocumentModel)
-            .values(payload.model_dump()['documents'])
+            upsert(SmsDocumentModel.__table__)
             .on_conflict_do_update(
                 index_elements=['UBID', 'uniqueId'],
                 set_=dict(
@@ -80,28 +113,153 @@ class SmsDocumentCrud:
                     when=func.current_timestamp())
             )
         )
-        response: CursorResult = await self.session.exec(query)
-        return response.rowcount
+
+        if ubid:
+            query = query.values(UBID=bindparam('UBID', str(ubid)))
+
+        for idx in range(0, len(rows), chunk_size):
+            chunk = rows[idx:idx + chunk_size]
+            response: CursorResult = await self.session.exec(query, params=chunk)
+            count += response.rowcount
+
+        return count
 
     # ---------------------------------------------------------
     #
     async def count(self, ubid: UUID) -> int:
         """
         Return count of all SMS document(s) within a batch from DB
-        table tracking.sms_documents.
+        table tracking.sms_document_counters.
+
+        This is a primary key lookup, independent of the batch size.
 
         Args:
             ubid: Batch search key.
 
         Returns:
-            Number of found SMS transfer batches.
+            Number of found SMS transfer batch documents.
         """
+        counter = SmsDocumentCounterModel
         query = (
-            select(func.count(SmsDocumentModel.uniqueId))
-            .where(SmsDocumentModel.UBID == str(ubid))
+            select(counter.INIT + counter.SENT + counter.DONE)
+            .where(counter.UBID == str(ubid))
         )
+        return await self.session.scalar(query) or 0
+
+    # ---------------------------------------------------------
+    #
+    async def stats(self, ubid: UUID) -> SmsDocumentCounterModel | None:
+        """
+        Return the per-state document counters for a batch from DB
+        table tracking.sms_document_counters.
+
+        Args:
+            ubid: Batch search key.
+
+        Returns:
+            Found batch counters, or None.
+        """
+        query = (
+            select(SmsDocumentCounterModel)
+            .where(SmsDocumentCounterModel.UBID == str(ubid))
+        )
+        result = await self.session.exec(query)
+        return result.one_or_none()
+
+    # ---------------------------------------------------------
+    #
+    async def rebuild_counters(self, ubid: Optional[UUID] = None) -> int:
+        """
+        Recount the documents, and replace the content of DB table
+        tracking.sms_document_counters with the result.
+
+        This is a full index scan of the documents, and it's
+        only needed when the counters are suspected to be wrong.
+
+        Args:
+            ubid: Only rebuild this batch, all batches when not specified.
+
+        Returns:
+            Number of batches where the counters were inconsistent.
+        """
+        ubid = str(ubid) if ubid else None
+        table = SmsDocumentCounterModel.__table__
+        counter = table.c
+        actual = counter_totals(ubid).subquery()
+        states = [state.value for state in SmsDocumentState]
+
+        # Stored counters that are missing, or differ from the actual count.
+        query = (
+            select(func.count())
+            .select_from(actual.outerjoin(table, counter.UBID == actual.c.UBID))
+            .where(or_(counter.UBID.is_(None),
+                       *[counter[name] != actual.c[name] for name in states]))
+        )
+        inconsistent = await self.session.scalar(query)
+
+        # Stored counters for batches that no longer have any documents.
+        query = (
+            select(func.count())
+            .select_from(table)
+            .where(counter.UBID.not_in(select(actual.c.UBID)),
+                   counter.INIT + counter.SENT + counter.DONE != 0)
+        )
+
+        if ubid:
+            query = query.where(counter.UBID == ubid)
+
+        inconsistent += await self.session.scalar(query)
+
+        query = delete(SmsDocumentCounterModel)
+
+        if ubid:
+            query = query.where(SmsDocumentCounterModel.UBID == ubid)
+
         await self.session.exec(query)
-        return await self.session.scalar(query)
+        await self.session.exec(
+            insert(SmsDocumentCounterModel)
+            .from_select(['UBID'] + states, counter_totals(ubid))
+        )
+        return inconsistent
+
+    # ---------------------------------------------------------
+    #
+    async def read_ranges(self, ubid: UUID) -> List[UniqueIdRange]:
+        """
+        Read the stored uniqueId ranges for a batch from DB table
+        tracking.sms_documents.
+
+        The ranges are found with the "gaps and islands" technique:
+        the numeric uniqueId minus its row number within the batch is
+        constant within a range of consecutive values. Only the
+        (UBID, uniqueId) primary key index is read, and one row per
+        range is returned, instead of one row per document.
+
+        Note that the uniqueId values are expected to be numeric (like
+        the ones that insert_bigger_batch.py creates), a non-numeric
+        value is counted as 0.
+
+        Args:
+            ubid: Batch search key.
+
+        Returns:
+            Stored uniqueId ranges, in ascending order.
+        """
+        number = cast(SmsDocumentModel.uniqueId, Integer)
+        islands = (
+            select(number.label('number'),
+                   (number - func.row_number().over(order_by=number)).label('island'))
+            .where(SmsDocumentModel.UBID == str(ubid))
+            .subquery()
+        )
+        query = (
+            select(func.min(islands.c.number), func.max(islands.c.number), func.count())
+            .group_by(islands.c.island)
+            .order_by(func.min(islands.c.number))
+        )
+        response = await self.session.exec(query)
+        return [UniqueIdRange(first=first, last=last, count=count)
+                for first, last, count in response.all()]
 
     # ---------------------------------------------------------
     #
@@ -110,12 +268,16 @@ class SmsDocumentCrud:
         Update state for all documents within a batch in DB table
         tracking.sms_documents.
 
+        This is a single round trip already, and the affected row count
+        is enough to detect an unknown batch. A RETURNING clause would
+        only add the transfer of every updated document row.
+
         Args:
             ubid: Batch search key.
             state: Update value.
 
         Returns:
-            1 for successful UPDATE, 0 for failed UPDATE.
+            Number of updated rows, 0 when the batch is not found.
         """
         query = (
             update(SmsDocumentModel)
@@ -13,21 +13,73 @@ VERSION INFO:
 
 # BUILTIN modules
 from uuid import UUID
+from typing import AsyncIterator, Optional
 
 # Third party modules
+from pydantic import ValidationError
 from sqlalchemy.exc import IntegrityError
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Query
 
 # Local modules
+from ..core.config import config
 from ..core.unit_of_work import UnitOfWork
-from .sms_document_crud import SmsDocumentCrud
+from ..core.responses import FastJSONResponse
+from ..core.write_coalescer import run_write
+from ..ingest_job.models import IngestJob
+from ..ingest_job.ingest_job_crud import IngestJobCrud
+from ..ingest_job.ingest_job_worker import job_workers
+from .documentation import stream_body_documentation
 from ..core.models import UnknownError, NotFoundError
-from .models import SmsDocumentState, SmsDocumentPayload, QueryResponse
+from .sms_document_crud import SmsDocumentCrud, UPSERT_CHUNK_SIZE
 from ..core.documentation import ubid_documentation, state_documentation
+from .models import (SmsDocumentState, SmsDocumentPayload, QueryResponse,
+                     StreamResponse, SmsDocumentStats, SmsDocumentRanges,
+                     document_item_adapter)
 
 # Constants
 ROUTER = APIRouter(prefix="/tracking/sms_documents", tags=["SMS_documents"])
 """ sms_documents endpoint router. """
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+""" Media type of the streaming ingestion request body. """
+NDJSON_MAX_LINE = 65536
+""" Max size in bytes of one NDJSON document line. """
+
+
+# ---------------------------------------------------------
+#
+async def ndjson_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[tuple]:
+    """ Split a streamed request body into NDJSON lines.
+
+    Only the current, incomplete, line is kept between body chunks,
+    which keeps the memory usage flat regardless of the body size.
+
+    Args:
+        stream: Request body byte chunks.
+
+    Yields:
+        Line number and content of every non-empty line.
+
+    Raises:
+        HTTPException(413): When a line exceeds NDJSON_MAX_LINE bytes.
+    """
+    lineno, buffer = 0, b''
+
+    async for chunk in stream:
+        *lines, buffer = (buffer + chunk).split(b'\n')
+
+        for line in lines:
+            lineno += 1
+
+            if line.strip():
+                yield lineno, line
+
+        if len(buffer) > NDJSON_MAX_LINE:
+            errmsg = (f"Line {lineno + 1} exceeds the max line "
+                      f"size of {NDJSON_MAX_LINE} bytes")
+            raise HTTPException(status_code=413, detail=errmsg)
+
+    if buffer.strip():
+        yield lineno + 1, buffer
 
 
 # ---------------------------------------------------------
@@ -36,24 +88,48 @@ ROUTER = APIRouter(prefix="/tracking/sms_documents", tags=["SMS_documents"])
     "/",
     status_code=201,
     response_model=QueryResponse,
-    responses={422: {"model": UnknownError}}
+    responses={202: {"model": IngestJob},
+               411: {"model": UnknownError},
+               413: {"model": UnknownError},
+               422: {"model": UnknownError},
+               503: {"model": UnknownError}}
 )
 async def create_sms_transfer_batch_documents(
-        payload: SmsDocumentPayload) -> QueryResponse:
+        payload: SmsDocumentPayload,
+        asynchronous: bool = Query(
+            False, description='Queue the upsert as an ingestion job and '
+                               'return **202** with the job status.')
+) -> FastJSONResponse:
     """**Create SMS batch document(s) in table tracking.sms_documents.**
 
+    In asynchronous mode the documents are stored in a queued ingestion
+    job, and the progress is available at ``/tracking/jobs/{job_id}/``.
+
+    The number of concurrent upserts, and their queued request bytes,
+    are limited by ``AdmissionMiddleware`` before the payload is read.
+    A rejected request gets **411** (no Content-Length), **413** (too
+    large) or **503** with a Retry-After header (too many queued).
+
     Args:
       payload: Create method payload.
+      asynchronous: Queue the upsert as an ingestion job when True.
 
     Returns:
-        DB insert result.
+        DB insert result, or the queued job status (asynchronous mode).
 
     Raises:
         HTTPException(422): When failed to UPSERT row in tracking.sms_documents.
     """
+    if asynchronous:
+        job = await UnitOfWork(IngestJobCrud, retry=config.write_retry).run(
+            lambda crud: crud.create(payload))
+
+        job_workers.notify()
+        return FastJSONResponse(IngestJob.from_model(job), status_code=202)
+
     try:
-        async with UnitOfWork(SmsDocumentCrud) as crud:
-            count = await crud.create(payload)
+        count = await UnitOfWork(SmsDocumentCrud, retry=config.write_retry).run(
+            lambda crud: crud.create(payload))
 
     except IntegrityError as why:
         errmsg = (f"Failed Upsert of UBID '{payload.UBID}' document(s) "
@@ -62,7 +138,103 @@ async def create_sms_transfer_batch_documents(
 
     result = (f"Inserted {count} document(s) for UBID '{payload.UBID}' "
               f"in table tracking.sms_documents")
-    return QueryResponse(result=result)
+    return FastJSONResponse(QueryResponse(result=result), status_code=201)
+
+
+# ---------------------------------------------------------
+#
+@ROUTER.post(
+    "/{ubid}/stream",
+    status_code=201,
+    response_model=StreamResponse,
+    responses={413: {"model": UnknownError},
+               415: {"model": UnknownError},
+               422: {"model": UnknownError},
+               503: {"model": UnknownError}},
+    openapi_extra={"requestBody": {
+        "required": True,
+        "content": {NDJSON_MEDIA_TYPE: {
+            "schema": {"type": "string"},
+            "example": stream_body_documentation}}}},
+)
+async def stream_sms_transfer_batch_documents(
+        request: Request,
+        ubid: UUID = ubid_documentation) -> FastJSONResponse:
+    """
+    **Create SMS batch document(s) from a streamed NDJSON body in table
+    tracking.sms_documents.**
+
+    Every line in the ``application/x-ndjson`` body is one SMS document
+    (without UBID). The lines are validated one by one while the body is
+    received, and every chunk of ``UPSERT_CHUNK_SIZE`` documents is
+    upserted in its own short transaction, so there is no limit on the
+    number of documents, and a slow upload never holds the DB writer.
+
+    The chunks before a failing line stay stored. The upsert is
+    idempotent, so the whole body can be sent again.
+
+    The stream takes one of the bulk upsert slots of
+    ``AdmissionMiddleware``, and gets **503** with a Retry-After header
+    when they are all taken.
+
+    Args:
+        request: Current request (the NDJSON body is read from it).
+        ubid: Batch key.
+
+    Returns:
+        DB insert totals.
+
+    Raises:
+        HTTPException(413): When a document line is too big.
+        HTTPException(415): When the body isn't NDJSON.
+        HTTPException(422): When a document is invalid, or failed to
+            UPSERT rows in tracking.sms_documents.
+    """
+    media_type = request.headers.get('content-type', '').split(';')[0].strip()
+
+    if media_type != NDJSON_MEDIA_TYPE:
+        errmsg = f"Unsupported media type '{media_type}', use '{NDJSON_MEDIA_TYPE}'"
+        raise HTTPException(status_code=415, detail=errmsg)
+
+    rows, documents, chunks, count = [], 0, 0, 0
+
+    async def upsert(chunk: list) -> int:
+        """ Upsert a chunk of documents in its own short unit of work. """
+        return await UnitOfWork(SmsDocumentCrud, retry=config.write_retry).run(
+            lambda crud: crud.upsert_rows(chunk, ubid=ubid))
+
+    try:
+        async for lineno, line in ndjson_lines(request.stream()):
+            try:
+                rows.append(document_item_adapter.validate_json(line))
+
+            except ValidationError as why:
+                errors = '; '.join(f"{'.'.join(map(str, error['loc']))}: "
+                                   f"{error['msg']}" for error in why.errors())
+                errmsg = f"Invalid document on line {lineno} => {errors}"
+                raise HTTPException(status_code=422, detail=errmsg)
+
+            if len(rows) == UPSERT_CHUNK_SIZE:
+                count += await upsert(rows)
+                documents += len(rows)
+                chunks += 1
+                rows = []
+
+        if rows:
+            count += await upsert(rows)
+            documents += len(rows)
+            chunks += 1
+
+    except IntegrityError as why:
+        errmsg = (f"Failed Upsert of UBID '{ubid}' document(s) "
+                  f"in table tracking.sms_documents => {why.args[0]}")
+        raise HTTPException(status_code=422, detail=errmsg)
+
+    result = (f"Inserted {count} document(s) for UBID '{ubid}' "
+              f"in table tracking.sms_documents")
+    return FastJSONResponse(
+        StreamResponse(result=result, documents=documents, chunks=chunks),
+        status_code=201)
 
 
 # ---------------------------------------------------------
@@ -73,7 +245,7 @@ async def create_sms_transfer_batch_documents(
     responses={404: {"model": NotFoundError}},
 )
 async def count_sms_transfer_batch_documents(
-        ubid: UUID = ubid_documentation) -> QueryResponse:
+        ubid: UUID = ubid_documentation) -> FastJSONResponse:
     """
     **Return count of all SMS batch document(s) from table
     tracking.sms_documents.**
@@ -87,7 +259,7 @@ async def count_sms_transfer_batch_documents(
     Raises:
         HTTPException(404): When the tracking.sms_documents row is not found.
     """
-    async with UnitOfWork(SmsDocumentCrud) as crud:
+    async with UnitOfWork(SmsDocumentCrud, read_only=True) as crud:
         count = await crud.count(ubid)
 
     if not count:
@@ -97,7 +269,113 @@ async def count_sms_transfer_batch_documents(
 
     result = (f"Found {count} document(s) for UBID "
               f"'{ubid}' in table tracking.sms_documents")
-    return QueryResponse(result=result)
+    return FastJSONResponse(QueryResponse(result=result))
+
+
+# ---------------------------------------------------------
+#
+@ROUTER.get(
+    "/{ubid}/stats/",
+    response_model=SmsDocumentStats,
+    responses={404: {"model": NotFoundError}},
+)
+async def read_sms_transfer_batch_documents_stats(
+        ubid: UUID = ubid_documentation) -> FastJSONResponse:
+    """
+    **Return count of SMS batch document(s) per state from table
+    tracking.sms_document_counters.**
+
+    Args:
+        ubid: Batch search key.
+
+    Returns:
+        Number of found SMS transfer batch documents per state.
+
+    Raises:
+        HTTPException(404): When the batch has no documents.
+    """
+    async with UnitOfWork(SmsDocumentCrud, read_only=True) as crud:
+        counters = await crud.stats(ubid)
+
+    if not counters or not (counters.INIT + counters.SENT + counters.DONE):
+        errmsg = (f"UBID '{ubid}' not found in "
+                  f"table tracking.sms_documents")
+        raise HTTPException(status_code=404, detail=errmsg)
+
+    return FastJSONResponse(SmsDocumentStats(
+        **counters.model_dump(), total=counters.INIT + counters.SENT + counters.DONE))
+
+
+# ---------------------------------------------------------
+#
+@ROUTER.get(
+    "/{ubid}/ranges/",
+    response_model=SmsDocumentRanges,
+    responses={404: {"model": NotFoundError}},
+)
+async def read_sms_transfer_batch_documents_ranges(
+        ubid: UUID = ubid_documentation) -> FastJSONResponse:
+    """
+    **Return the stored uniqueId ranges of an SMS batch from table
+    tracking.sms_documents.**
+
+    A client that resumes an interrupted upload uses this to only
+    send the documents that are missing, since re-sending a stored
+    document resets its ``state`` and ``when`` values.
+
+    Args:
+        ubid: Batch search key.
+
+    Returns:
+        Stored uniqueId ranges, in ascending order.
+
+    Raises:
+        HTTPException(404): When the batch has no documents.
+    """
+    async with UnitOfWork(SmsDocumentCrud, read_only=True) as crud:
+        ranges = await crud.read_ranges(ubid)
+
+    if not ranges:
+        errmsg = (f"UBID '{ubid}' not found in "
+                  f"table tracking.sms_documents")
+        raise HTTPException(status_code=404, detail=errmsg)
+
+    return FastJSONResponse(SmsDocumentRanges(
+        UBID=str(ubid), documents=sum(item.count for item in ranges), ranges=ranges))
+
+
+# ---------------------------------------------------------
+#
+@ROUTER.post(
+    "/counters/rebuild/",
+    response_model=QueryResponse,
+)
+async def rebuild_sms_document_counters(
+        ubid: Optional[UUID] = Query(
+            None, description='Only rebuild this batch, '
+                              'all batches when not specified.')
+) -> FastJSONResponse:
+    """
+    **Recount the SMS documents, and rebuild table
+    tracking.sms_document_counters.**
+
+    The counters are maintained by DB triggers, so this consistency
+    check is only needed when they are suspected to be wrong. Note
+    that it scans all documents in the batch (or all batches).
+
+    Args:
+        ubid: Batch search key.
+
+    Returns:
+        DB rebuild statistics.
+    """
+    inconsistent = await UnitOfWork(SmsDocumentCrud, retry=config.write_retry).run(
+        lambda crud: crud.rebuild_counters(ubid))
+
+    scope = f"UBID '{ubid}'" if ubid else "all batches"
+    result = (f"Rebuilt counters for {scope} in table tracking.sms_document_"
+              f"counters, {inconsistent} batch(es) were inconsistent")
+    return FastJSONResponse(QueryResponse(result=result))
 
 
 # ---------------------------------------------------------
@@ -110,7 +388,7 @@ async def count_sms_transfer_batch_documents(
 async def update_sms_transfer_batch_documents_state(
         ubid: UUID = ubid_documentation,
         state: SmsDocumentState = state_documentation,
-) -> QueryResponse:
+) -> FastJSONResponse:
     """
     **Update state for all SMS document(s) belonging to a batch
     in table tracking.sms_documents.**
@@ -125,8 +403,8 @@ async def update_sms_transfer_batch_documents_state(
     Raises:
         HTTPException(404): When the tracking.sms_documents row is not found.
     """
-    async with UnitOfWork(SmsDocumentCrud) as crud:
-        count = await crud.update_state(ubid, state)
+    count = await run_write(SmsDocumentCrud,
+                            lambda crud: crud.update_state(ubid, state))
 
     if not count:
         errmsg = (f"UBID '{ubid}' not found in "
@@ -135,4 +413,4 @@ async def update_sms_transfer_batch_documents_state(
 
     result = (f"Updated state to '{state.value}' in {count} row(s) for "
               f"UBID '{ubid}' in table tracking.sms_documents")
-    return QueryResponse(result=result)
+    return FastJSONResponse(QueryResponse(result=result))
@@ -31,3 +31,10 @@ transfer_documentation = {
     "fileName": "2a168739-b204-4abf-aec1-a88069e3cd08.zip"
 }
 """ OpenAPI SmsTransfer example documentation. """
+
+page_documentation = {
+    "items": [transfer_documentation],
+    "next_cursor": "WyIyMDI0LTA0LTE3IDA4OjU4OjM3IiwgIjJhMTY4NzM5LWIyMDQtNGFiZi1hZWMx"
+                   "LWE4ODA2OWUzY2QwOCJd"
+}
+""" OpenAPI SmsTransferPage example documentation. """
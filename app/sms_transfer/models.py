@@ -13,17 +13,19 @@ VERSION INFO:
 
 # BUILTIN modules
 from enum import Enum
-from typing import Optional
 from datetime import datetime
+from typing import List, Optional
 
 # Third party modules
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, text
 from pydantic import PositiveInt, ConfigDict
 from sqlalchemy.dialects.sqlite import CHAR, TIMESTAMP
 
 # Local modules
 from ..core.models import ValidatingSQLModel
-from .documentation import payload_documentation, transfer_documentation
+from .documentation import (payload_documentation, transfer_documentation,
+                            page_documentation)
 
 
 # ---------------------------------------------------------------------------
@@ -78,6 +80,47 @@ class SmsTransfer(SmsTransferPayload):
     state: Optional[SmsTransferState] = SmsTransferState.INIT
 
 
+# -----------------------------------------------------------------------------
+#
+class SmsTransferItem(SQLModel):
+    """ A projected SMS batch transfer model, unselected fields are left unset.
+
+    Attributes:
+        SMScount: Number of 160 character block message splits.
+        documents: Number of SMS messages.
+        UBID: The SMS transfer batch ID.
+        fileName: Name of SMS transfer batch file.
+        origName: Name of original file from the customer.
+        when: Timestamp when the document was created, or updated.
+        fallbackCount: Number of failed, or timed out messages that should be
+            distributed using the fallback channel.
+        state: SMS document state.
+    """
+    SMScount: Optional[int] = None
+    documents: Optional[int] = None
+    UBID: Optional[str] = None
+    fileName: Optional[str] = None
+    origName: Optional[str] = None
+    when: Optional[datetime] = None
+    fallbackCount: Optional[int] = None
+    state: Optional[SmsTransferState] = None
+
+
+# -----------------------------------------------------------------------------
+#
+class SmsTransferPage(SQLModel):
+    """ One page of SMS batch transfers, ordered by ``when`` and ``UBID``.
+
+    Attributes:
+        items: The SMS batch transfers on this page.
+        next_cursor: Opaque cursor for the next page, or None on the last page.
+    """
+    model_config = ConfigDict(json_schema_extra={"example": page_documentation})
+
+    items: List[SmsTransferItem]
+    next_cursor: Optional[str] = None
+
+
 # ---------------------------------------------------------
 #
 class SmsTransferModel(ValidatingSQLModel, table=True):
@@ -104,6 +147,10 @@ class SmsTransferModel(ValidatingSQLModel, table=True):
         SMScount: Number of 160 character block message splits.
     """
     __tablename__ = "sms_transfers"
+    __table_args__ = (
+        Index('ix_sms_transfers_when_ubid', 'when', 'UBID'),
+        Index('ix_sms_transfers_state_when_ubid', 'state', 'when', 'UBID'),
+    )
 
     UBID: str = Field(sa_type=CHAR(36), primary_key=True)
     fileName: str = Field(max_length=55, nullable=False)
@@ -12,10 +12,14 @@ VERSION INFO:
 """
 
 # BUILTIN modules
+import json
+import base64
 from uuid import UUID
-from typing import List
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence, Tuple
 
 # Third party modules
+from sqlalchemy import String, tuple_, type_coerce
 from sqlmodel import select, update, delete, func
 from sqlalchemy.engine.cursor import CursorResult
 from sqlmodel.ext.asyncio.session import AsyncSession
@@ -25,6 +29,10 @@ from sqlalchemy.dialects.sqlite import insert as upsert
 from .models import (SmsTransferModel, SmsTransfer,
                      SmsTransferState, SmsTransferPayload)
 
+# Constants
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+""" Format of the CURRENT_TIMESTAMP text that SQLite stores in column ``when``. """
+
 
 # -----------------------------------------------------------------------------
 #
@@ -93,6 +101,146 @@ class SmsTransferCrud:
         result = await self.session.exec(query)
         return result.all()
 
+    # ---------------------------------------------------------
+    #
+    async def read_page(
+            self,
+            limit: int,
+            cursor: Optional[str] = None,
+            state: Optional[SmsTransferState] = None,
+            since: Optional[datetime] = None,
+            until: Optional[datetime] = None,
+            fields: Optional[Sequence[str]] = None
+    ) -> Tuple[List[dict], Optional[str]]:
+        """ Get one page of SMS transfer rows from DB table tracking.sms_transfers.
+
+        The rows are ordered by (``when``, ``UBID``) and the page continues
+        after the cursor position (keyset pagination), so the cost depends on
+        the page size and not on the table size. The composite indexes on
+        (``when``, ``UBID``) and (``state``, ``when``, ``UBID``) make this an
+        index range scan, with or without a ``state`` filter.
+
+        Column ``when`` is compared as the stored text, since a bound Python
+        datetime gets a microseconds suffix that doesn't compare equal
+        to the CURRENT_TIMESTAMP text. The stored text is UTC, so a
+        timezone aware ``since`` or ``until`` is converted to UTC first,
+        a naive one is taken as UTC.
+
+        Args:
+            limit: Max number of rows to return.
+            cursor: Position to continue after, from a previous page.
+            state: Only return rows in this state.
+            since: Only return rows where ``when`` >= since.
+            until: Only return rows where ``when`` < until.
+            fields: Columns to return, all columns when not specified.
+
+        Returns:
+            Found SMS transfer rows and the cursor for the next page,
+            or None when this is the last page.
+
+        Raises:
+            ValueError: When the cursor or a field name is invalid.
+        """
+        columns = SmsTransferModel.__table__.c
+        unknown = set(fields or []) - set(columns.keys())
+
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(sorted(unknown))}")
+
+        when = type_coerce(SmsTransferModel.when, String)
+        selected = [columns[name] for name in fields] if fields else list(columns)
+        query = (
+            select(*selected, when.label('cursor_when'),
+                   SmsTransferModel.UBID.label('cursor_ubid'))
+            .order_by(SmsTransferModel.when, SmsTransferModel.UBID)
+            .limit(limit + 1)
+        )
+
+        if state:
+            query = query.where(SmsTransferModel.state == state)
+
+        if since:
+            query = query.where(when >= self.when_text(since))
+
+        if until:
+            query = query.where(when < self.when_text(until))
+
+        if cursor:
+            query = query.where(tuple_(when, SmsTransferModel.UBID) >
+                                tuple_(*self.decode_cursor(cursor)))
+
+        result = await self.session.exec(query)
+        rows = [dict(row._mapping) for row in result.all()]
+        next_cursor = None
+
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = self.encode_cursor(rows[-1]['cursor_when'],
+                                             rows[-1]['cursor_ubid'])
+
+        for row in rows:
+            del row['cursor_when'], row['cursor_ubid']
+
+        return rows, next_cursor
+
+    # ---------------------------------------------------------
+    #
+    @staticmethod
+    def when_text(value: datetime) -> str:
+        """ Return the datetime in the stored (UTC) ``when`` text format.
+
+        Args:
+            value: Timezone aware datetime, or a naive one in UTC.
+
+        Returns:
+            UTC timestamp text.
+        """
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+
+        return value.strftime(TIMESTAMP_FORMAT)
+
+    # ---------------------------------------------------------
+    #
+    @staticmethod
+    def encode_cursor(when: str, ubid: str) -> str:
+        """ Return an opaque page cursor for the specified sort key.
+
+        Args:
+            when: Stored ``when`` text of the last row on the page.
+            ubid: UBID of the last row on the page.
+
+        Returns:
+            URL safe cursor.
+        """
+        return base64.urlsafe_b64encode(json.dumps([when, ubid]).encode()).decode()
+
+    # ---------------------------------------------------------
+    #
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[str, str]:
+        """ Return the sort key of the specified page cursor.
+
+        Args:
+            cursor: URL safe cursor.
+
+        Returns:
+            Stored ``when`` text and UBID of the last row on the previous page.
+
+        Raises:
+            ValueError: When the cursor is invalid.
+        """
+        try:
+            when, ubid = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+        except (TypeError, ValueError) as why:
+            raise ValueError(f"Invalid cursor '{cursor}'") from why
+
+        if not (isinstance(when, str) and isinstance(ubid, str)):
+            raise ValueError(f"Invalid cursor '{cursor}'")
+
+        return when, ubid
+
     # ---------------------------------------------------------
     #
     async def read(self, ubid: UUID) -> SmsTransfer | None:
@@ -113,52 +261,67 @@ class SmsTransferCrud:
 
     # ---------------------------------------------------------
     #
-    async def update_state(self, ubid: UUID, state: SmsTransferState) -> int:
+    async def update_state(self, ubid: UUID,
+                           state: SmsTransferState) -> SmsTransferModel | None:
         """ Update SMS transfer row state in DB table tracking.sms_transfers.
 
-        The DB implicitly updates the ``when`` timestamp value.
+        The updated row is returned by the same ``UPDATE ... RETURNING``
+        statement, so the transition needs a single DB round trip.
 
         Args:
             ubid: Batch search key.
             state: Update value.
 
         Returns:
-            1 for successful UPDATE, 0 for failed UPDATE.
+            Updated SMS transfer row, or None when the row is not found.
         """
         query = (
             update(SmsTransferModel)
             .where(SmsTransferModel.UBID == str(ubid))
             .values({'state': state})
+            .returning(SmsTransferModel)
         )
-        response: CursorResult = await self.session.exec(query)
-        return response.rowcount
+        result = await self.session.exec(query)
+        return result.scalars().one_or_none()
 
     # ---------------------------------------------------------
     #
-    async def delete(self, ubid: UUID) -> int:
-        """ Delete specified transfer row from DB table tracking.sms_transfers.
+    async def update_totals(self, ubid: UUID, documents: int, sms_count: int) -> int:
+        """ Update SMS transfer row totals in DB table tracking.sms_transfers.
+
+        This is used by the offline bulk loader, that only knows the
+        totals of a streamed input when all documents are loaded.
 
         Args:
             ubid: Batch search key.
+            documents: Number of SMS messages.
+            sms_count: Number of 160 character block message splits.
 
         Returns:
-            1 for successful DELETE, 0 for failed DELETE.
+            1 for successful UPDATE, 0 when the row is not found.
         """
         query = (
-            delete(SmsTransferModel)
+            update(SmsTransferModel)
             .where(SmsTransferModel.UBID == str(ubid))
+            .values(documents=documents, SMScount=sms_count)
         )
         response: CursorResult = await self.session.exec(query)
         return response.rowcount
 
     # ---------------------------------------------------------
     #
-    async def refresh(self, model: SmsTransferModel):
-        """ Refresh the content of the specified DB model.
-
-        Implicitly returns the updated model from the DB.
+    async def delete(self, ubid: UUID) -> int:
+        """ Delete specified transfer row from DB table tracking.sms_transfers.
 
         Args:
-            model: SMS Transfer DB model.
+            ubid: Batch search key.
+
+        Returns:
+            1 for successful DELETE, 0 for failed DELETE.
         """
-        await self.session.refresh(model)
+        query = (
+            delete(SmsTransferModel)
+            .where(SmsTransferModel.UBID == str(ubid))
+        )
+        response: CursorResult = await self.session.exec(query)
+        return response.rowcount
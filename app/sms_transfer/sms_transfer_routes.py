@@ -13,22 +13,29 @@ VERSION INFO:
 
 # BUILTIN modules
 from uuid import UUID
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 
 # Third party modules
 from sqlalchemy.exc import IntegrityError
-from fastapi import APIRouter, HTTPException, Response, status
+from fastapi import APIRouter, HTTPException, Query, Response, status
 
 # Local modules
+from ..core.config import config
 from ..core.unit_of_work import UnitOfWork
+from ..core.responses import FastJSONResponse
+from ..core.write_coalescer import run_write
 from .sms_transfer_crud import SmsTransferCrud
 from ..core.models import UnknownError, NotFoundError
-from .models import SmsTransfer, SmsTransferPayload, SmsTransferState
+from .models import (SmsTransfer, SmsTransferPayload, SmsTransferState,
+                     SmsTransferPage)
 from ..core.documentation import ubid_documentation, state_documentation
 
 # Constants
 ROUTER = APIRouter(prefix="/tracking/sms_transfers", tags=["SMS_transfers"])
 """ sms_transfers endpoint router. """
+MAX_PAGE_SIZE = 500
+""" Max number of SMS transfer batches in one page. """
 
 
 # ---------------------------------------------------------
@@ -52,8 +59,7 @@ async def create_sms_transfer_batch(payload: SmsTransferPayload) -> SmsTransferP
         HTTPException(422): When failed to UPSERT row in tracking.sms_transfers.
     """
     try:
-        async with UnitOfWork(SmsTransferCrud) as crud:
-            await crud.create(payload)
+        await run_write(SmsTransferCrud, lambda crud: crud.create(payload))
 
     except IntegrityError as why:
         errmsg = (f"Failed Upsert of UBID '{payload.UBID}' in table "
@@ -63,21 +69,84 @@ async def create_sms_transfer_batch(payload: SmsTransferPayload) -> SmsTransferP
     return payload
 
 
+# ---------------------------------------------------------
+#
+@ROUTER.get(
+    "/",
+    response_model=SmsTransferPage,
+    responses={422: {"model": UnknownError}}
+)
+async def list_sms_transfer_batches(
+        limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE,
+                           description='Max number of batches in the page.'),
+        cursor: Optional[str] = Query(
+            None, description='The `next_cursor` value of the previous page.'),
+        state: Optional[SmsTransferState] = Query(
+            None, description='Only return batches in this state.'),
+        since: Optional[datetime] = Query(
+            None, description='Only return batches where `when` >= since.'),
+        until: Optional[datetime] = Query(
+            None, description='Only return batches where `when` < until.'),
+        fields: Optional[str] = Query(
+            None, description='Comma separated fields to return, '
+                              'all fields when not specified.<br>'
+                              '*Example: `UBID,state,when`*')
+) -> FastJSONResponse:
+    """
+    **Return one page of SMS transfer batches from table tracking.sms_transfers.**
+
+    The batches are ordered by `when` and `UBID`. Pass the `next_cursor`
+    value as `cursor` to get the next page, it is null on the last page.
+    Only the selected fields are returned.
+
+    Args:
+        limit: Max number of batches in the page.
+        cursor: Position to continue after.
+        state: State filter.
+        since: Start of time range filter.
+        until: End of time range filter.
+        fields: Comma separated projection of fields.
+
+    Returns:
+        One page of SMS transfer batches.
+
+    Raises:
+        HTTPException(422): When the cursor or a field name is invalid.
+    """
+    columns = [name.strip() for name in fields.split(',')] if fields else None
+
+    try:
+        async with UnitOfWork(SmsTransferCrud, read_only=True) as crud:
+            rows, next_cursor = await crud.read_page(
+                limit, cursor, state, since, until, columns)
+
+    except ValueError as why:
+        raise HTTPException(status_code=422, detail=str(why))
+
+    # The rows only contain the selected columns, so they are returned
+    # as they are (without a validation pass per row).
+    return FastJSONResponse({'items': rows, 'next_cursor': next_cursor})
+
+
 # ---------------------------------------------------------
 #
 @ROUTER.get(
     "/{ubid}/",
+    deprecated=True,
     response_model=List[SmsTransfer],
 )
-async def read_all_sms_transfer_batches() -> List[SmsTransfer]:
+async def read_all_sms_transfer_batches() -> FastJSONResponse:
     """
     **Return existing SMS transfer batches from table tracking.sms_transfers.**
 
+    Deprecated since it returns the whole table, use the paginated
+    `GET /tracking/sms_transfers/` endpoint instead.
+
     Returns:
         All existing SMS transfer batches.
     """
-    async with UnitOfWork(SmsTransferCrud) as crud:
-        return await crud.read_all()
+    async with UnitOfWork(SmsTransferCrud, read_only=True) as crud:
+        return FastJSONResponse(await crud.read_all())
 
 
 # ---------------------------------------------------------
@@ -90,7 +159,7 @@ async def read_all_sms_transfer_batches() -> List[SmsTransfer]:
 async def update_sms_transfer_batch_state(
         ubid: UUID = ubid_documentation,
         state: SmsTransferState = state_documentation
-) -> SmsTransfer:
+) -> FastJSONResponse:
     """**Update SMS transfer batch state in table tracking.sms_transfers.**
 
     Args:
@@ -103,18 +172,15 @@ async def update_sms_transfer_batch_state(
     Raises:
         HTTPException(404): When the tracking.sms_transfers row is not found.
     """
-    async with UnitOfWork(SmsTransferCrud) as crud:
-        response = await crud.read(ubid)
+    response = await run_write(SmsTransferCrud,
+                               lambda crud: crud.update_state(ubid, state))
 
-        if not response:
-            errmsg = (f"UBID '{ubid}' is not found in "
-                      f"table tracking.sms_transfers")
-            raise HTTPException(status_code=404, detail=errmsg)
-
-        await crud.update_state(ubid, state)
-        await crud.refresh(response)
+    if not response:
+        errmsg = (f"UBID '{ubid}' is not found in "
+                  f"table tracking.sms_transfers")
+        raise HTTPException(status_code=404, detail=errmsg)
 
-    return response
+    return FastJSONResponse(response)
 
 
 # ---------------------------------------------------------
@@ -133,8 +199,8 @@ async def delete_sms_transfer_batch(ubid: UUID = ubid_documentation):
     Raises:
         HTTPException(404): When the tracking.sms_transfers row is not found.
     """
-    async with UnitOfWork(SmsTransferCrud) as crud:
-        response = await crud.delete(ubid)
+    response = await UnitOfWork(SmsTransferCrud, retry=config.write_retry).run(
+        lambda crud: crud.delete(ubid))
 
     if not response:
         errmsg = (f"UBID '{ubid}' is not found "
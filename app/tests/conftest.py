@@ -9,21 +9,47 @@ VERSION INFO:
     $Date: 2024-12-11 19:51:22
      $Rev: 20
 ```
+
+The DB fixture layer works like this:
+
+  - The schema is created once per test session (``db_schema``).
+  - Every test that uses the DB gets its own connection with an outer
+    transaction that is rolled back when the test ends (``db_session``).
+    The test sessions, and the ``UnitOfWork`` sessions of the application,
+    join that transaction with a SAVEPOINT, so their commits and rollbacks
+    never reach the DB file.
+  - The test DB is an in-memory DB (see ``config.db_url``), and every
+    pytest-xdist worker is a separate process, so every worker has its own
+    isolated DB. Run the suite on all cores with ``pytest -n auto``.
+
+Tests that need real commits (like the write coalescer tests) don't use
+``db_session``, they only depend on ``db_schema``, and clean up after
+themselves.
 """
 
 # BUILTIN modules
+import sys
 import json
+import importlib
 from pathlib import Path
+from types import ModuleType
+from typing import Callable
 
 # Third party modules
 import pytest_asyncio
 from loguru import logger
-from pytest import FixtureRequest
+from sqlalchemy import Connection
 from httpx import AsyncClient, ASGITransport
+from sqlalchemy.ext.asyncio import AsyncConnection
+from pytest import FixtureRequest, MonkeyPatch
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 # Local modules
-from ..main import app, startup
-from ..core.unit_of_work import UnitOfWork
+from ..main import app
+from ..core.database import async_engine, create_async_db_tables
+from ..core.unit_of_work import write_session_maker, read_session_maker
+from ..sms_document.models import SmsDocumentPayload
+from ..sms_transfer.models import SmsTransferPayload
 from ..sms_document.sms_document_crud import SmsDocumentCrud
 from ..sms_transfer.sms_transfer_crud import SmsTransferCrud
 
@@ -31,10 +57,77 @@ from ..sms_transfer.sms_transfer_crud import SmsTransferCrud
 logger.remove()
 
 
+# ---------------------------------------------------------
+#
+def set_driver_transactions(conn: Connection, isolation_level: str | None):
+    """ Set the sqlite3 driver isolation level of the DB connection.
+
+    With the ``None`` value, the driver no longer begins a transaction
+    implicitly before a DML statement, so the outer test transaction is
+    started (and the SAVEPOINT statements are run) within an explicit
+    BEGIN. This is the documented SQLAlchemy recipe for SAVEPOINT support
+    with the sqlite3 driver.
+
+    Args:
+        conn: DB connection object.
+        isolation_level: Driver isolation level.
+    """
+    conn.connection.dbapi_connection.isolation_level = isolation_level
+
+
+# ---------------------------------------------------------
+#
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def db_schema():
+    """ Create all tables once per test session. """
+    await create_async_db_tables()
+
+
 # ---------------------------------------------------------
 #
 @pytest_asyncio.fixture(scope="function")
-async def test_app():
+async def db_connection(db_schema: None) -> AsyncConnection:
+    """ Return a DB connection with an outer transaction that is rolled back.
+
+    The application ``UnitOfWork`` session factories are bound to the
+    connection during the test, so the routes and workers also run
+    inside the rolled back transaction.
+
+    Note that this is a DB connection generator.
+    """
+    async with async_engine.connect() as conn:
+        await conn.run_sync(set_driver_transactions, None)
+        await conn.begin()
+        await conn.exec_driver_sql('BEGIN')
+
+        with MonkeyPatch.context() as patch:
+            for maker in (write_session_maker, read_session_maker):
+                patch.setitem(maker.kw, 'bind', conn)
+                patch.setitem(maker.kw, 'join_transaction_mode', 'create_savepoint')
+
+            yield conn
+
+        await conn.rollback()
+        await conn.run_sync(set_driver_transactions, '')
+
+
+# ---------------------------------------------------------
+#
+@pytest_asyncio.fixture(scope="function")
+async def db_session(db_connection: AsyncConnection) -> AsyncSession:
+    """ Return a DB session that joins the outer test transaction.
+
+    Note that this is a DB session generator.
+    """
+    async with AsyncSession(bind=db_connection, expire_on_commit=False,
+                            join_transaction_mode='create_savepoint') as session:
+        yield session
+
+
+# ---------------------------------------------------------
+#
+@pytest_asyncio.fixture(scope="function")
+async def test_app(db_connection: AsyncConnection):
     """ httpx AsyncClient generator. """
     transport = ASGITransport(app=app)
 
@@ -45,6 +138,37 @@ async def test_app():
         yield client
 
 
+# ---------------------------------------------------------
+#
+@pytest_asyncio.fixture(scope="session")
+def import_script() -> Callable[[str], ModuleType]:
+    """ Return a function that imports a repository root script (like bulk_load.py).
+
+    The scripts import the application as ``app``, and each other by their
+    plain names, while the tests import the application relative to the
+    repository package. The loaded application modules are registered
+    under the ``app`` names too, so that the scripts use the same modules
+    (and SQLModel table definitions) as the tests.
+
+    Returns:
+        Function that imports a script by its module name.
+    """
+    package = __name__.rsplit('.', 2)[0]
+    root = package.rpartition('.')[0]
+
+    for name, module in list(sys.modules.items()):
+        if name == package or name.startswith(f'{package}.'):
+            sys.modules.setdefault(f'app{name[len(package):]}', module)
+
+    def load(name: str) -> ModuleType:
+        """ Import the script module, and register it by its plain name. """
+        module = importlib.import_module(f'{root}.{name}' if root else name)
+        sys.modules.setdefault(name, module)
+        return module
+
+    return load
+
+
 # ---------------------------------------------------------
 #
 @pytest_asyncio.fixture(scope="module")
@@ -69,28 +193,36 @@ def test_data(request: FixtureRequest) -> dict:
 # ---------------------------------------------------------
 #
 @pytest_asyncio.fixture(scope="function")
-async def transfer_crud() -> SmsTransferCrud:
-    """
-    Create all tables if needed and return an
-    active SmsTransferCrud object.
+async def transfer_crud(db_session: AsyncSession) -> SmsTransferCrud:
+    """ Return an SmsTransferCrud object in the rolled back test transaction. """
+    return SmsTransferCrud(db_session)
 
-    Note that this is a DB session generator.
-    """
-    async with UnitOfWork(SmsTransferCrud) as crud:
-        await startup()
-        yield crud
+
+# ---------------------------------------------------------
+#
+@pytest_asyncio.fixture(scope="function")
+async def document_crud(db_session: AsyncSession) -> SmsDocumentCrud:
+    """ Return an SmsDocumentCrud object in the rolled back test transaction. """
+    return SmsDocumentCrud(db_session)
 
 
 # ---------------------------------------------------------
 #
 @pytest_asyncio.fixture(scope="function")
-async def document_crud() -> SmsDocumentCrud:
-    """
-    Create all tables if needed and return an
-    active SmsDocumentCrud object.
+async def stored_transfer(test_data: dict,
+                          transfer_crud: SmsTransferCrud) -> SmsTransferPayload:
+    """ Store the ``create_transfer`` test data transfer and return it. """
+    payload = SmsTransferPayload(**test_data['create_transfer']['payload'])
+    await transfer_crud.create(payload)
+    return payload
 
-    Note that this is a DB session generator.
-    """
-    async with UnitOfWork(SmsDocumentCrud) as crud:
-        await startup()
-        yield crud
+
+# ---------------------------------------------------------
+#
+@pytest_asyncio.fixture(scope="function")
+async def stored_documents(test_data: dict, stored_transfer: SmsTransferPayload,
+                           document_crud: SmsDocumentCrud) -> SmsDocumentPayload:
+    """ Store the ``create_document`` test data documents (and transfer) and return them. """
+    payload = SmsDocumentPayload(**test_data['create_document']['payload'])
+    await document_crud.create(payload)
+    return payload
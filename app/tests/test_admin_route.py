@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# Third party modules
+from loguru import logger
+from httpx import AsyncClient
+from pytest import mark, MonkeyPatch
+
+# Local modules
+from ..core import query_stats
+from ..core.metrics import Counter, Histogram, render
+
+pytestmark = mark.test_data(__name__.rsplit('.')[-1])
+""" Add the test_data fixture to all test functions in the module. """
+
+
+# ---------------------------------------------------------
+#
+def parse_samples(text: str) -> dict:
+    """ Return the sample values of a Prometheus text exposition.
+
+    Args:
+        text: Prometheus text exposition.
+
+    Returns:
+        Sample name (with labels) to value.
+    """
+    return {key: float(value)
+            for key, value in (line.rsplit(' ', 1)
+                               for line in text.splitlines() if not line.startswith('#'))}
+
+
+# ---------------------------------------------------------
+#
+async def test_read_metrics(test_data: dict,
+                            test_app: AsyncClient):
+    """ Test that the metrics follow the requests, writes and commits. """
+    response = await test_app.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == test_data['content_type']
+    before = parse_samples(response.text)
+
+    response = await test_app.post("/sms_transfers/", json=test_data['create_transfer'])
+    assert response.status_code == 201
+
+    response = await test_app.get("/no_such_route")
+    assert response.status_code == 404
+
+    after = parse_samples((await test_app.get("/metrics")).text)
+
+    for sample, increase in test_data['samples'].items():
+        assert after[sample] - before.get(sample, 0) == increase
+
+
+# ---------------------------------------------------------
+#
+async def test_render_metrics(test_data: dict):
+    """ Test the Prometheus text format of a histogram and a counter. """
+    registry = []
+    histogram = Histogram('test_seconds', 'Test histogram.', ('route',),
+                          buckets=(1, 5), registry=registry)
+    counter = Counter('test_total', 'Test counter.', ('route',), registry=registry)
+
+    for value in test_data['render']['observations']:
+        histogram.observe(value, '/a')
+
+    counter.inc('a"b', amount=2)
+    assert render(registry).split('\n') == test_data['render']['response']
+
+
+# ---------------------------------------------------------
+#
+async def test_read_query_stats(test_data: dict,
+                                test_app: AsyncClient,
+                                monkeypatch: MonkeyPatch):
+    """ Test that a slow statement is logged with its plan, and aggregated. """
+    want = test_data['slow_query']
+    monkeypatch.setattr(query_stats, "slow_query_threshold", 0)
+
+    response = await test_app.delete("/admin/queries")
+    assert response.status_code == 204
+
+    messages = []
+    sink = logger.add(messages.append, level='WARNING')
+
+    try:
+        response = await test_app.get("/sms_transfers/all/")
+        assert response.status_code == 200
+
+    finally:
+        logger.remove(sink)
+
+    assert any(message.record['message'].startswith(want['message']) for message in messages)
+
+    response = await test_app.get("/admin/queries")
+    assert response.status_code == 200
+    result = [item for item in response.json()
+              if item['fingerprint'].startswith(want['fingerprint'])]
+    assert len(result) == 1
+    assert result[0]['count'] == 1
+    assert result[0]['p50_ms'] == result[0]['max_ms']
+    assert any(line.startswith(want['plan']) for line in result[0]['plan'])
+
+    response = await test_app.get("/admin/queries", params={'limit': 1})
+    assert len(response.json()) == 1
+
+
+# ---------------------------------------------------------
+#
+async def test_statement_fingerprint(test_data: dict):
+    """ Test that literals and value lists are normalized. """
+    for statement, want in test_data['fingerprints']:
+        assert query_stats.fingerprint(statement) == want
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# BUILTIN modules
+import asyncio
+from dataclasses import replace
+
+# Third party modules
+from httpx import AsyncClient
+from pytest import mark, MonkeyPatch
+
+# Local modules
+from ..core.config import AdmissionLimits
+from ..core.metrics import BULK_QUEUED_BYTES, BULK_REJECTED, BULK_WAITING
+from ..core.admission import AdmissionController, bulk_admission
+
+pytestmark = mark.test_data(__name__.rsplit('.')[-1])
+""" Add the test_data fixture to all test functions in the module. """
+
+
+# ---------------------------------------------------------
+#
+async def test_admission_order_and_bytes(test_data: dict):
+    """ Test that waiting requests are admitted in order, within the byte cap. """
+    params = test_data['controller']
+    controller = AdmissionController(AdmissionLimits(**params['limits']))
+    admitted = []
+
+    async def request(name: str, size: int):
+        """ Wait for admission and record the order. """
+        reason = await controller.acquire(size)
+        admitted.append(name if reason is None else reason)
+
+    assert await controller.acquire(params['size']) is None
+    tasks = [asyncio.create_task(request(name, params['size'])) for name in params['waiting']]
+    await asyncio.sleep(0)
+    assert controller.waiting == len(params['waiting'])
+    assert BULK_WAITING.values[()] == len(params['waiting'])
+
+    # The waiting requests use up the byte cap.
+    assert await controller.acquire(params['size']) == 'queue_full'
+
+    for _ in params['waiting']:
+        controller.release(params['size'])
+        await asyncio.sleep(0)
+
+    await asyncio.gather(*tasks)
+    assert admitted == params['waiting']
+    assert controller.active == 1
+
+    controller.release(params['size'])
+    assert (controller.active, controller.waiting, controller.queued_bytes) == (0, 0, 0)
+    assert BULK_QUEUED_BYTES.values[()] == 0
+
+
+# ---------------------------------------------------------
+#
+async def test_admission_timeout_and_cancel(test_data: dict):
+    """ Test that a request that times out, or is cancelled, leaves the queue. """
+    params = test_data['controller']
+    limits = AdmissionLimits(**{**params['limits'], 'max_wait': params['short_wait']})
+    controller = AdmissionController(limits)
+
+    assert await controller.acquire(params['size']) is None
+    assert await controller.acquire(params['size']) == 'timeout'
+
+    task = asyncio.create_task(controller.acquire(params['size']))
+    await asyncio.sleep(0)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    assert (controller.active, controller.waiting) == (1, 0)
+    assert controller.queued_bytes == params['size']
+    controller.release(params['size'])
+    assert (controller.active, controller.queued_bytes) == (0, 0)
+
+
+# ---------------------------------------------------------
+#
+async def test_bulk_upsert_rejections(test_data: dict, test_app: AsyncClient,
+                                      monkeypatch: MonkeyPatch):
+    """ Test the 411, 413 and 503 responses of the bulk document upsert route. """
+    params = test_data['route']
+    monkeypatch.setattr(bulk_admission, 'limits',
+                        replace(bulk_admission.limits, **params['limits']))
+    rejected = dict(BULK_REJECTED.values)
+
+    async def chunked():
+        """ A request body without a Content-Length. """
+        yield b'{}'
+
+    response = await test_app.post('/sms_documents/', content=chunked())
+    assert response.status_code == 411
+
+    response = await test_app.post('/sms_documents/', json=params['too_large'])
+    assert response.status_code == 413
+
+    # Occupy the only slot, like a running bulk upsert.
+    assert await bulk_admission.acquire(1) is None
+
+    try:
+        response = await test_app.post('/sms_documents/', json=params['payload'])
+
+    finally:
+        bulk_admission.release(1)
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == params['retry_after']
+    assert bulk_admission.queued_bytes == 0
+
+    for reason in params['reasons']:
+        assert BULK_REJECTED.values[(reason,)] == rejected.get((reason,), 0) + 1
+
+
+# ---------------------------------------------------------
+#
+async def test_stream_upload_rejection(test_data: dict, test_app: AsyncClient,
+                                       monkeypatch: MonkeyPatch):
+    """ Test that the streaming upload route shares the concurrency limit. """
+    params = test_data['route']
+    monkeypatch.setattr(bulk_admission, 'limits',
+                        replace(bulk_admission.limits, **params['limits']))
+
+    async def chunked():
+        """ A request body without a Content-Length. """
+        yield b'{}'
+
+    # Occupy the only slot, like a running bulk upsert.
+    assert await bulk_admission.acquire(1) is None
+
+    try:
+        response = await test_app.post(params['stream_path'], content=chunked(),
+                                       headers={'Content-Type': 'application/x-ndjson'})
+
+    finally:
+        bulk_admission.release(1)
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == params['retry_after']
+    assert (bulk_admission.active, bulk_admission.queued_bytes) == (0, 0)
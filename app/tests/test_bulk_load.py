@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# BUILTIN modules
+import json
+import argparse
+from pathlib import Path
+from types import ModuleType
+from typing import AsyncGenerator, Callable, Tuple
+
+# Third party modules
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Local modules
+from ..core.config import config
+from ..sms_transfer.models import SmsTransfer
+from ..sms_transfer.sms_transfer_crud import SmsTransferCrud
+from ..sms_document.sms_document_crud import SmsDocumentCrud
+from ..core.database import create_sqlite_engine, create_async_db_tables
+
+pytestmark = pytest.mark.test_data(__name__.rsplit('.')[-1])
+""" Add the test_data fixture to all test functions in the module. """
+
+
+# ---------------------------------------------------------
+#
+@pytest.fixture(scope="module")
+def loader(import_script: Callable[[str], ModuleType]) -> ModuleType:
+    """ Return the bulk_load script module (it imports insert_bigger_batch). """
+    import_script('insert_bigger_batch')
+    return import_script('bulk_load')
+
+
+# ---------------------------------------------------------
+#
+@pytest_asyncio.fixture()
+async def engine(tmp_path: Path) -> AsyncGenerator[AsyncEngine, None]:
+    """ Return an engine to an empty DB file. """
+    engine = create_sqlite_engine(f'sqlite+aiosqlite:///{tmp_path / "bulk.db"}',
+                                  config.sqlite)
+    await create_async_db_tables(engine)
+    yield engine
+    await engine.dispose()
+
+
+# ---------------------------------------------------------
+#
+def loader_args(test_data: dict, **kwargs) -> argparse.Namespace:
+    """ Return the loader command line arguments of the test.
+
+    Args:
+        test_data: Test module data.
+        kwargs: Overridden arguments.
+    """
+    return argparse.Namespace(**{**test_data['args'], 'ubid': test_data['UBID'], **kwargs})
+
+
+# ---------------------------------------------------------
+#
+async def stored(engine: AsyncEngine, ubid: str) -> Tuple[SmsTransfer, int]:
+    """ Return the stored transfer batch, and its number of stored documents.
+
+    Args:
+        engine: Used DB engine.
+        ubid: Unique Batch ID.
+    """
+    async with AsyncSession(engine) as session:
+        transfer = await SmsTransferCrud(session).read(ubid)
+        return transfer, await SmsDocumentCrud(session).count(ubid)
+
+
+# ---------------------------------------------------------
+#
+async def test_load_generated(loader: ModuleType, engine: AsyncEngine, test_data: dict):
+    """ Test that generated documents are loaded in transaction sized parts. """
+    params = test_data['generate']
+    args = loader_args(test_data, generate=params['count'])
+
+    assert await loader.load(engine, args) == (params['documents'], params['transactions'])
+
+    transfer, count = await stored(engine, test_data['UBID'])
+    assert count == params['documents']
+    assert transfer.documents == params['documents']
+    assert transfer.SMScount == params['sms_count']
+    assert transfer.origName == 'generated'
+
+
+# ---------------------------------------------------------
+#
+async def test_load_ndjson(loader: ModuleType, engine: AsyncEngine,
+                           test_data: dict, tmp_path: Path):
+    """ Test that an NDJSON file is loaded, and that blank lines are skipped. """
+    path = tmp_path / 'documents.ndjson'
+    path.write_text('\n'.join(json.dumps(item) for item in test_data['documents']) + '\n\n')
+    documents = test_data['documents']
+
+    assert await loader.load(engine, loader_args(test_data, ndjson=path)) == (len(documents), 1)
+
+    transfer, count = await stored(engine, test_data['UBID'])
+    assert count == len(documents)
+    assert transfer.SMScount == sum(item['SMScount'] for item in documents)
+    assert transfer.origName == path.name
+
+
+# ---------------------------------------------------------
+#
+async def test_load_csv(loader: ModuleType, engine: AsyncEngine,
+                        test_data: dict, tmp_path: Path):
+    """ Test that a CSV file is loaded, with a single document per transaction. """
+    path = tmp_path / 'documents.csv'
+    path.write_text(test_data['csv'], encoding='utf-8')
+    documents = test_data['documents']
+    args = loader_args(test_data, csv=path, transaction_size=1)
+
+    assert await loader.load(engine, args) == (len(documents), len(documents) + 1)
+
+    transfer, count = await stored(engine, test_data['UBID'])
+    assert count == len(documents)
+    assert transfer.documents == len(documents)
+    assert transfer.SMScount == sum(item['SMScount'] for item in documents)
+
+
+# ---------------------------------------------------------
+#
+async def test_load_existing(loader: ModuleType, engine: AsyncEngine,
+                             test_data: dict, tmp_path: Path):
+    """ Test that an existing batch is only replaced, with all its documents, on request. """
+    path = tmp_path / 'documents.ndjson'
+    path.write_text('\n'.join(json.dumps(item) for item in test_data['documents']))
+    documents = test_data['documents']
+    await loader.load(engine, loader_args(test_data, generate=test_data['generate']['count']))
+
+    with pytest.raises(ValueError):
+        await loader.load(engine, loader_args(test_data, ndjson=path))
+
+    args = loader_args(test_data, ndjson=path, replace=True)
+    assert await loader.load(engine, args) == (len(documents), 1)
+
+    transfer, count = await stored(engine, test_data['UBID'])
+    assert count == len(documents)
+    assert transfer.documents == len(documents)
+    assert transfer.SMScount == sum(item['SMScount'] for item in documents)
+
+
+# ---------------------------------------------------------
+#
+async def test_load_empty(loader: ModuleType, engine: AsyncEngine,
+                          test_data: dict, tmp_path: Path):
+    """ Test that an empty file stores the batch with zero totals. """
+    path = tmp_path / 'documents.ndjson'
+    path.touch()
+
+    assert await loader.load(engine, loader_args(test_data, ndjson=path)) == (0, 1)
+
+    transfer, count = await stored(engine, test_data['UBID'])
+    assert (count, transfer.documents, transfer.SMScount) == (0, 0, 0)
+
+
+# ---------------------------------------------------------
+#
+async def test_read_documents(loader: ModuleType, test_data: dict, tmp_path: Path):
+    """ Test that the NDJSON and CSV readers yield the same validated documents. """
+    ndjson_path, csv_path = tmp_path / 'documents.ndjson', tmp_path / 'documents.csv'
+    ndjson_path.write_text('\n'.join(json.dumps(item) for item in test_data['documents']))
+    csv_path.write_text(test_data['csv'], encoding='utf-8')
+    expected = [loader.document_item_adapter.validate_python(item)
+                for item in test_data['documents']]
+
+    assert list(loader.read_ndjson(ndjson_path)) == expected
+    assert list(loader.read_csv(csv_path)) == expected
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# BUILTIN modules
+import gzip
+import json
+
+# Third party modules
+import zstandard
+from httpx import AsyncClient
+from pytest import mark, MonkeyPatch
+
+# Local modules
+from ..core.config import config
+from ..core.metrics import HTTP_REQUESTS
+from ..sms_document.sms_document_crud import SmsDocumentCrud
+from ..sms_transfer.sms_transfer_crud import SmsTransferCrud
+
+pytestmark = mark.test_data(__name__.rsplit('.')[-1])
+""" Add the test_data fixture to all test functions in the module. """
+
+
+# ---------------------------------------------------------
+#
+async def test_create_sms_doc_gzip(test_data: dict,
+                                   test_app: AsyncClient,
+                                   monkeypatch: MonkeyPatch):
+    """ Test creating an SMS document batch from a gzip compressed body. """
+
+    # ---------------------------------
+
+    async def mock_post(_, payload):
+        """ Monkeypatch """
+        return len(payload.documents)
+
+    monkeypatch.setattr(SmsDocumentCrud, "create", mock_post)
+
+    # ---------------------------------
+
+    body = json.dumps(test_data['create_document']['payload']).encode()
+    response = await test_app.post(
+        "/sms_documents/",
+        content=gzip.compress(body),
+        headers={"Content-Type": "application/json", "Content-Encoding": "gzip"}
+    )
+    assert response.status_code == 201
+    assert response.json() == test_data['created']
+
+
+# ---------------------------------------------------------
+#
+async def test_create_sms_doc_gzip_metrics(test_data: dict,
+                                           test_app: AsyncClient,
+                                           monkeypatch: MonkeyPatch):
+    """ Test that a compressed request is counted for its matched route. """
+
+    # ---------------------------------
+
+    async def mock_post(_, payload):
+        """ Monkeypatch """
+        return len(payload.documents)
+
+    monkeypatch.setattr(SmsDocumentCrud, "create", mock_post)
+
+    # ---------------------------------
+
+    labels = ('POST', test_data['metrics_route'], 201)
+    before = HTTP_REQUESTS.values.get(labels, 0)
+    body = json.dumps(test_data['create_document']['payload']).encode()
+    response = await test_app.post(
+        "/sms_documents/",
+        content=gzip.compress(body),
+        headers={"Content-Type": "application/json", "Content-Encoding": "gzip"}
+    )
+    assert response.status_code == 201
+    assert HTTP_REQUESTS.values.get(labels, 0) - before == 1
+
+
+# ---------------------------------------------------------
+#
+async def test_create_sms_doc_gzip_bomb(test_data: dict,
+                                        test_app: AsyncClient):
+    """ Test that a body that decompresses beyond the cap is rejected. """
+    body = gzip.compress(b' ' * (config.max_decompressed_body + 1))
+    response = await test_app.post(
+        "/sms_documents/",
+        content=body,
+        headers={"Content-Type": "application/json", "Content-Encoding": "gzip"}
+    )
+    assert response.status_code == 413
+    assert response.json() == test_data['too_large']
+
+
+# ---------------------------------------------------------
+#
+async def test_create_sms_doc_zstd(test_data: dict,
+                                   test_app: AsyncClient,
+                                   monkeypatch: MonkeyPatch):
+    """ Test creating an SMS document batch from a zstd compressed body. """
+
+    # ---------------------------------
+
+    async def mock_post(_, payload):
+        """ Monkeypatch """
+        return len(payload.documents)
+
+    monkeypatch.setattr(SmsDocumentCrud, "create", mock_post)
+
+    # ---------------------------------
+
+    body = json.dumps(test_data['create_document']['payload']).encode()
+    response = await test_app.post(
+        "/sms_documents/",
+        content=zstandard.ZstdCompressor().compress(body),
+        headers={"Content-Type": "application/json", "Content-Encoding": "zstd"}
+    )
+    assert response.status_code == 201
+    assert response.json() == test_data['created']
+
+
+# ---------------------------------------------------------
+#
+async def test_create_sms_doc_zstd_bomb(test_data: dict,
+                                        test_app: AsyncClient):
+    """ Test that a zstd body that decompresses beyond the cap is rejected. """
+    body = zstandard.ZstdCompressor().compress(b' ' * (config.max_decompressed_body + 1))
+    response = await test_app.post(
+        "/sms_documents/",
+        content=body,
+        headers={"Content-Type": "application/json", "Content-Encoding": "zstd"}
+    )
+    assert response.status_code == 413
+    assert response.json() == test_data['too_large']
+
+
+# ---------------------------------------------------------
+#
+async def test_stream_sms_doc_zstd_truncated(test_data: dict,
+                                             test_app: AsyncClient,
+                                             monkeypatch: MonkeyPatch):
+    """ Test that a truncated zstd stream is rejected, even when it ends on a line. """
+
+    # ---------------------------------
+
+    async def mock_upsert(_, rows, ubid):
+        """ Monkeypatch """
+        return len(rows)
+
+    monkeypatch.setattr(SmsDocumentCrud, "upsert_rows", mock_upsert)
+
+    # ---------------------------------
+
+    documents = test_data['create_document']['payload']['documents']
+    body = ''.join(f'{json.dumps(document)}\n' for document in documents).encode()
+
+    # A flushed block without the frame end, all the lines decompress.
+    compressor = zstandard.ZstdCompressor().compressobj()
+    truncated = compressor.compress(body) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    response = await test_app.post(
+        "/sms_documents/{UBID}/stream".format(**test_data),
+        content=truncated,
+        headers={"Content-Type": "application/x-ndjson", "Content-Encoding": "zstd"}
+    )
+    assert response.status_code == 400
+    assert response.json()['detail'] == test_data['truncated_zstd']
+
+
+# ---------------------------------------------------------
+#
+async def test_create_sms_doc_gzip_invalid(test_data: dict,
+                                           test_app: AsyncClient):
+    """ Test that a body that isn't gzip data is rejected. """
+    response = await test_app.post(
+        "/sms_documents/",
+        content=b'{"UBID": "not compressed"}',
+        headers={"Content-Type": "application/json", "Content-Encoding": "gzip"}
+    )
+    assert response.status_code == 400
+    assert response.json()['detail'].startswith(test_data['invalid_prefix'])
+
+
+# ---------------------------------------------------------
+#
+async def test_create_sms_doc_encoding(test_data: dict,
+                                       test_app: AsyncClient):
+    """ Test that an unsupported Content-Encoding is rejected. """
+    response = await test_app.post(
+        "/sms_documents/",
+        content=b'compressed',
+        headers={"Content-Type": "application/json", "Content-Encoding": "br"}
+    )
+    assert response.status_code == 415
+    assert response.json() == test_data['unsupported']
+
+
+# ---------------------------------------------------------
+#
+async def test_read_page_gzip_response(test_app: AsyncClient,
+                                       monkeypatch: MonkeyPatch):
+    """ Test that a large response is gzip compressed when accepted. """
+    rows = [{"UBID": f"{idx:036}", "state": "INIT"} for idx in range(100)]
+
+    # ---------------------------------
+
+    async def mock_get(*_):
+        """ Monkeypatch """
+        return rows, None
+
+    monkeypatch.setattr(SmsTransferCrud, "read_page", mock_get)
+
+    # ---------------------------------
+
+    response = await test_app.get("/sms_transfers/?limit=100",
+                                  headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.json()['items'] == rows
+
+    response = await test_app.get("/sms_transfers/?limit=100",
+                                  headers={"Accept-Encoding": "identity"})
+    assert 'content-encoding' not in response.headers
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# BUILTIN modules
+import asyncio
+import sqlite3
+
+# Third party modules
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+# Local modules
+from ..core.unit_of_work import UnitOfWork
+from ..ingest_job.models import IngestJobState
+from ..ingest_job.ingest_job_crud import IngestJobCrud
+from ..sms_document.models import SmsDocumentPayload
+from ..sms_transfer.models import SmsTransferPayload
+from ..ingest_job.ingest_job_worker import IngestJobWorkers
+from ..sms_document.sms_document_crud import SmsDocumentCrud
+from ..sms_transfer.sms_transfer_crud import SmsTransferCrud
+
+pytestmark = pytest.mark.test_data(__name__.rsplit('.')[-1])
+""" Add the test_data fixture to all test functions in the module. """
+
+
+# ---------------------------------------------------------
+#
+async def test_run_ingest_job(test_data: dict, db_connection: AsyncConnection):
+    """ Test that a queued job is claimed once, and upserts all documents. """
+    transfer = SmsTransferPayload(**test_data['create_transfer'])
+    payload = SmsDocumentPayload(**test_data['create_job'])
+
+    async with UnitOfWork(SmsTransferCrud) as crud:
+        await crud.create(transfer)
+
+    async with UnitOfWork(IngestJobCrud) as crud:
+        created = await crud.create(payload)
+
+    assert created.state == IngestJobState.QUEUED
+    assert created.total == 3
+
+    async with UnitOfWork(IngestJobCrud) as crud:
+        job = await crud.claim(lease=60)
+        assert await crud.claim(lease=60) is None
+
+    assert job.id == created.id
+    assert job.state == IngestJobState.RUNNING
+    await IngestJobWorkers.run(job)
+
+    async with UnitOfWork(IngestJobCrud) as crud:
+        finished = await crud.read(created.id)
+
+    assert finished.state == IngestJobState.DONE
+    assert finished.done == 3
+
+    async with UnitOfWork(SmsDocumentCrud) as crud:
+        assert await crud.count(transfer.UBID) == 3
+
+
+# ---------------------------------------------------------
+#
+async def test_run_ingest_job_failure(test_data: dict, db_connection: AsyncConnection):
+    """ Test that a job for an unknown UBID fails with a stored error. """
+    payload = SmsDocumentPayload(**test_data['orphan_job'])
+
+    async with UnitOfWork(IngestJobCrud) as crud:
+        created = await crud.create(payload)
+
+    async with UnitOfWork(IngestJobCrud) as crud:
+        job = await crud.claim(lease=60)
+
+    await IngestJobWorkers.run(job)
+
+    async with UnitOfWork(IngestJobCrud) as crud:
+        failed = await crud.read(created.id)
+
+    assert failed.state == IngestJobState.FAILED
+    assert failed.done == 0
+    assert 'FOREIGN KEY' in failed.error
+
+
+# ---------------------------------------------------------
+#
+async def test_run_ingest_job_unexpected_error(test_data: dict, db_connection: AsyncConnection,
+                                               monkeypatch: pytest.MonkeyPatch):
+    """ Test that a job fails with a stored error on a non-DB exception. """
+    transfer = SmsTransferPayload(**test_data['create_transfer'])
+    payload = SmsDocumentPayload(**test_data['create_job'])
+
+    async def broken_upsert(*args, **kwargs):
+        """ An upsert that fails with an unexpected error. """
+        raise RuntimeError('unexpected')
+
+    monkeypatch.setattr(SmsDocumentCrud, 'upsert_rows', broken_upsert)
+
+    async with UnitOfWork(SmsTransferCrud) as crud:
+        await crud.create(transfer)
+
+    async with UnitOfWork(IngestJobCrud) as crud:
+        created = await crud.create(payload)
+        job = await crud.claim(lease=60)
+
+    await IngestJobWorkers.run(job)
+
+    async with UnitOfWork(IngestJobCrud) as crud:
+        failed = await crud.read(created.id)
+
+    assert failed.state == IngestJobState.FAILED
+    assert failed.error == 'RuntimeError: unexpected'
+
+
+# ---------------------------------------------------------
+#
+async def test_run_ingest_job_busy_retry(test_data: dict, db_connection: AsyncConnection,
+                                         monkeypatch: pytest.MonkeyPatch):
+    """ Test that a chunk that fails with a busy DB error is re-run. """
+    transfer = SmsTransferPayload(**test_data['create_transfer'])
+    payload = SmsDocumentPayload(**test_data['create_job'])
+    upsert_rows, calls = SmsDocumentCrud.upsert_rows, []
+
+    async def busy_once(self, *args, **kwargs):
+        """ An upsert that fails with a locked DB the first time. """
+        calls.append(1)
+
+        if len(calls) == 1:
+            raise OperationalError('INSERT', {}, sqlite3.OperationalError('database is locked'))
+
+        return await upsert_rows(self, *args, **kwargs)
+
+    monkeypatch.setattr(SmsDocumentCrud, 'upsert_rows', busy_once)
+
+    async with UnitOfWork(SmsTransferCrud) as crud:
+        await crud.create(transfer)
+
+    async with UnitOfWork(IngestJobCrud) as crud:
+        created = await crud.create(payload)
+        job = await crud.claim(lease=60)
+
+    await IngestJobWorkers.run(job)
+
+    async with UnitOfWork(IngestJobCrud) as crud:
+        finished = await crud.read(created.id)
+
+    assert len(calls) == 2
+    assert finished.state == IngestJobState.DONE
+    assert finished.done == 3
+
+
+# ---------------------------------------------------------
+#
+async def test_worker_survives_job_error(test_data: dict, db_connection: AsyncConnection,
+                                         monkeypatch: pytest.MonkeyPatch):
+    """ Test that a worker keeps claiming jobs after a job raised an exception. """
+    transfer = SmsTransferPayload(**test_data['create_transfer'])
+    payload = SmsDocumentPayload(**test_data['create_job'])
+    claimed, runs = asyncio.Queue(), []
+
+    async def broken_run(job):
+        """ A job run that fails the first time, and then waits until cancelled.
+
+        The worker is then stopped outside a DB call, since cancelling a
+        call invalidates the (in-memory) test DB connection.
+        """
+        runs.append(job.id)
+        await claimed.put(job.id)
+
+        if len(runs) == 1:
+            raise RuntimeError('unexpected')
+
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(IngestJobWorkers, 'run', staticmethod(broken_run))
+
+    async with UnitOfWork(SmsTransferCrud) as crud:
+        await crud.create(transfer)
+
+    # The jobs are queued before the worker starts, since the worker and
+    # the test can't use the test DB connection at the same time.
+    async with UnitOfWork(IngestJobCrud) as crud:
+        created = [(await crud.create(payload)).id for _ in range(2)]
+
+    workers = IngestJobWorkers(size=1, lease=60, poll_interval=0.01)
+    workers.start()
+
+    try:
+        for job_id in created:
+            assert await asyncio.wait_for(claimed.get(), 5) == job_id
+
+    finally:
+        await workers.stop()
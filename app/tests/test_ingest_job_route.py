@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# Third party modules
+from httpx import AsyncClient
+from pytest import mark, MonkeyPatch
+
+# Local modules
+from ..ingest_job.models import IngestJobModel
+from ..ingest_job.ingest_job_crud import IngestJobCrud
+
+pytestmark = mark.test_data(__name__.rsplit('.')[-1])
+""" Add the test_data fixture to all test functions in the module. """
+
+
+# ---------------------------------------------------------
+#
+async def test_read_ingest_job(test_data: dict,
+                               test_app: AsyncClient,
+                               monkeypatch: MonkeyPatch):
+    """ Test read the progress of an ingestion job. """
+
+    # ---------------------------------
+
+    async def mock_get(_, __):
+        """ Monkeypatch """
+        return IngestJobModel(**test_data['read_job']['orig'])
+
+    monkeypatch.setattr(IngestJobCrud, "read", mock_get)
+
+    # ---------------------------------
+
+    response = await test_app.get("/jobs/{job_id}/".format(**test_data))
+    assert response.status_code == 200
+    assert response.json() == test_data['read_job']['response']
+
+
+# ---------------------------------------------------------
+#
+async def test_read_ingest_job_unknown(test_data: dict,
+                                       test_app: AsyncClient,
+                                       monkeypatch: MonkeyPatch):
+    """ Test read a non-existent ingestion job. """
+
+    # ---------------------------------
+
+    async def mock_get(_, __):
+        """ Monkeypatch """
+        return None
+
+    monkeypatch.setattr(IngestJobCrud, "read", mock_get)
+
+    # ---------------------------------
+
+    response = await test_app.get("/jobs/{job_id}/".format(**test_data))
+    assert response.status_code == 404
+    assert response.json() == test_data['read_not_found']
+
+
+# ---------------------------------------------------------
+#
+async def test_create_sms_doc_async(test_data: dict,
+                                    test_app: AsyncClient,
+                                    monkeypatch: MonkeyPatch):
+    """ Test that asynchronous mode queues a job and returns 202. """
+
+    # ---------------------------------
+
+    async def mock_post(_, __):
+        """ Monkeypatch """
+        return IngestJobModel(**test_data['queued_job'])
+
+    monkeypatch.setattr(IngestJobCrud, "create", mock_post)
+
+    # ---------------------------------
+
+    response = await test_app.post(
+        "/sms_documents/?asynchronous=true",
+        json=test_data['create_document']
+    )
+    assert response.status_code == 202
+    assert response.json() == test_data['queued_job']
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# BUILTIN modules
+import asyncio
+import argparse
+from pathlib import Path
+from types import ModuleType
+from typing import Callable
+
+# Third party modules
+import pytest
+from httpx import AsyncClient, MockTransport, Request, Response
+
+pytestmark = pytest.mark.test_data(__name__.rsplit('.')[-1])
+""" Add the test_data fixture to all test functions in the module. """
+
+
+# ---------------------------------------------------------
+#
+@pytest.fixture(scope="module")
+def loader(import_script: Callable[[str], ModuleType]) -> ModuleType:
+    """ Return the insert_bigger_batch script module. """
+    return import_script('insert_bigger_batch')
+
+
+# ---------------------------------------------------------
+#
+def loader_args(test_data: dict, **kwargs) -> argparse.Namespace:
+    """ Return the loader command line arguments of the test.
+
+    Args:
+        test_data: Test module data.
+        kwargs: Overridden arguments.
+    """
+    return argparse.Namespace(**{**test_data['args'], **kwargs})
+
+
+# ---------------------------------------------------------
+#
+async def test_generate_documents(loader: ModuleType, test_data: dict):
+    """ Test that the sub-batches adhere to the API limit, and skip stored ones. """
+    params = test_data['generate']
+    batches = list(loader.generate_documents(params['batch_size'], test_data['UBID'],
+                                      set(params['skip'])))
+
+    assert [batch for batch, _ in batches] == params['batches']
+    assert [len(documents) for _, documents in batches] == params['sizes']
+    assert batches[-1][1][-1]['uniqueId'] == params['last_id']
+
+
+# ---------------------------------------------------------
+#
+async def test_checkpoint(loader: ModuleType, test_data: dict, tmp_path: Path):
+    """ Test that acknowledged sub-batches survive a restart, until the UBID is done. """
+    ubid, path = test_data['UBID'], tmp_path / 'checkpoint.json'
+    loader.Checkpoint(path).ack(ubid, 12001, 2)
+    loader.Checkpoint(path).ack(ubid, 12001, 1)
+
+    checkpoint = loader.Checkpoint(path)
+    assert checkpoint.acked(ubid) == {1, 2}
+    assert checkpoint.batch_size(ubid) == 12001
+
+    checkpoint.done(ubid)
+    assert loader.Checkpoint(path).acked(ubid) == set()
+
+
+# ---------------------------------------------------------
+#
+async def test_retries_argument(loader: ModuleType):
+    """ Test that a negative retry count is rejected by the argument parser. """
+    assert loader.non_negative_int('0') == 0
+
+    for value in ('-1', 'many'):
+        with pytest.raises(argparse.ArgumentTypeError):
+            loader.non_negative_int(value)
+
+
+# ---------------------------------------------------------
+#
+async def test_concurrency_argument(loader: ModuleType):
+    """ Test that a concurrency below one is rejected by the argument parser. """
+    assert loader.positive_int('1') == 1
+
+    for value in ('0', '-1', 'many'):
+        with pytest.raises(argparse.ArgumentTypeError):
+            loader.positive_int(value)
+
+
+# ---------------------------------------------------------
+#
+async def test_retry_delay(loader: ModuleType, test_data: dict):
+    """ Test that a valid Retry-After header replaces the backoff delay. """
+    for retry_after, want in test_data['retry_after']:
+        assert loader.retry_delay(1, retry_after) == want
+
+    assert 0.4 <= loader.retry_delay(1, 'Wed, 21 Oct 2015 07:28:00 GMT') <= 0.6
+
+
+# ---------------------------------------------------------
+#
+async def test_send_retry_after(loader: ModuleType, test_data: dict,
+                                monkeypatch: pytest.MonkeyPatch):
+    """ Test that a 503 is retried after its Retry-After seconds. """
+    params = test_data['send']
+    responses = [Response(503, headers={'Retry-After': params['retry_after']},
+                          json=params['rejected']),
+                 Response(201, json=params['created'])]
+    delays = []
+
+    async def sleep(delay: float):
+        """ Record the retry delay instead of waiting. """
+        delays.append(delay)
+
+    monkeypatch.setattr(loader.asyncio, 'sleep', sleep)
+
+    async with AsyncClient(transport=MockTransport(lambda _: responses.pop(0))) as client:
+        result = await loader.send_sms_batch_documents(client, 1, params['payload'],
+                                                loader_args(test_data))
+
+    assert (result.ok, result.attempts) == (True, 2)
+    assert delays == [float(params['retry_after'])]
+
+
+# ---------------------------------------------------------
+#
+async def test_send_client_error(loader: ModuleType, test_data: dict):
+    """ Test that a client error isn't retried. """
+    params = test_data['send']
+    calls = []
+
+    def handler(request: Request) -> Response:
+        """ Reject the sub-batch. """
+        calls.append(request)
+        return Response(422, json=params['rejected'])
+
+    async with AsyncClient(transport=MockTransport(handler)) as client:
+        result = await loader.send_sms_batch_documents(client, 1, params['payload'],
+                                                loader_args(test_data))
+
+    assert (result.ok, result.attempts, len(calls)) == (False, 1, 1)
+
+
+# ---------------------------------------------------------
+#
+async def test_creator_memory_bound(loader: ModuleType, test_data: dict, tmp_path: Path,
+                                    monkeypatch: pytest.MonkeyPatch):
+    """ Test that at most ``concurrency`` sub-batches are generated and not yet sent. """
+    params = test_data['creator']
+    generate_documents, pending, peak = loader.generate_documents, [0], [0]
+
+    def counted(*args):
+        """ Count the generated sub-batches. """
+        for batch in generate_documents(*args):
+            pending[0] += 1
+            peak[0] = max(peak[0], pending[0])
+            yield batch
+
+    async def send(_, batch_id: int, payload: dict, __) -> tuple:
+        """ Pretend to send the sub-batch. """
+        await asyncio.sleep(0.001)
+        pending[0] -= 1
+        return loader.SubBatchResult(len(payload['documents']), 1, 1, 0.001, 1, True)
+
+    async def stored(*_) -> set:
+        """ Nothing is stored yet. """
+        return set()
+
+    monkeypatch.setattr(loader, 'generate_documents', counted)
+    monkeypatch.setattr(loader, 'send_sms_batch_documents', send)
+    monkeypatch.setattr(loader, 'read_stored_batches', stored)
+
+    args = loader_args(test_data, batch_size=params['batch_size'],
+                       concurrency=params['concurrency'], resume=test_data['UBID'],
+                       checkpoint=tmp_path / 'checkpoint.json')
+    await loader.creator(args)
+
+    assert pending[0] == 0
+    assert peak[0] == params['concurrency']
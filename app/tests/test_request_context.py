@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# BUILTIN modules
+import re
+import asyncio
+
+# Third party modules
+from loguru import logger
+from httpx import AsyncClient
+from pytest import mark, MonkeyPatch
+
+# Local modules
+from ..core import query_stats
+from ..core.write_coalescer import WriteCoalescer
+from ..core.request_context import request_id, reset_current, set_current
+from ..sms_transfer.sms_transfer_crud import SmsTransferCrud
+
+pytestmark = mark.test_data(__name__.rsplit('.')[-1])
+""" Add the test_data fixture to all test functions in the module. """
+
+
+# ---------------------------------------------------------
+#
+async def test_generated_request_id(test_data: dict, test_app: AsyncClient):
+    """ Test that requests without a valid X-Request-ID get a new unique ID. """
+    ids = set()
+
+    for header in test_data['invalid_ids']:
+        headers = {'X-Request-ID': header} if header else {}
+        response = await test_app.get("/sms_transfers/all/", headers=headers)
+        assert response.status_code == 200
+        assert re.fullmatch(test_data['generated_id'], response.headers['X-Request-ID'])
+        ids.add(response.headers['X-Request-ID'])
+
+    assert len(ids) == len(test_data['invalid_ids'])
+
+
+# ---------------------------------------------------------
+#
+async def test_propagated_request_id(test_data: dict,
+                                     test_app: AsyncClient,
+                                     monkeypatch: MonkeyPatch):
+    """ Test that the X-Request-ID is echoed, logged and kept by the slow-query log. """
+    want = test_data['propagated']
+    monkeypatch.setattr(query_stats, "slow_query_threshold", 0)
+    query_stats.reset()
+    messages = []
+    sink = logger.add(messages.append, level='WARNING')
+
+    try:
+        response = await test_app.get("/sms_transfers/all/",
+                                      headers={'X-Request-ID': want['request_id']})
+
+    finally:
+        logger.remove(sink)
+
+    assert response.headers['X-Request-ID'] == want['request_id']
+    assert messages
+    assert all(message.record['extra']['request_id'] == want['request_id']
+               and message.record['extra']['method'] == 'GET' for message in messages)
+    assert {item['slow_request_id'] for item in query_stats.snapshot()} == {want['request_id']}
+
+
+# ---------------------------------------------------------
+#
+async def test_coalesced_request_id(test_data: dict, db_schema: None):
+    """ Test that a coalesced write runs with the request ID of its request. """
+    coalescer = WriteCoalescer(window=0.05, max_batch=10)
+
+    async def read_request_id(_: SmsTransferCrud) -> str:
+        """ Return the request ID that the operation runs with. """
+        return request_id()
+
+    async def submit_as(rid: str) -> str:
+        """ Submit the operation from a request with the specified ID. """
+        token = set_current((rid, 'POST'))
+
+        try:
+            return await coalescer.submit(SmsTransferCrud, read_request_id)
+
+        finally:
+            reset_current(token)
+
+    results = await asyncio.gather(*[submit_as(rid) for rid in test_data['coalesced_ids']])
+    await coalescer.stop()
+    assert results == test_data['coalesced_ids']
+    assert request_id() is None
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# Third party modules
+from httpx import AsyncClient
+from pytest import mark
+
+# Local modules
+from ..core import server_timing
+from ..core.config import config
+
+pytestmark = mark.test_data(__name__.rsplit('.')[-1])
+""" Add the test_data fixture to all test functions in the module. """
+
+enabled = mark.skipif(not config.server_timing, reason="TRACKING_SERVER_TIMING=0")
+""" Skip the tests that need the middleware when it's disabled. """
+
+
+# ---------------------------------------------------------
+#
+def metric_names(header: str) -> list:
+    """ Return the metric names of a Server-Timing header value. """
+    return [item.split(';')[0] for item in header.split(', ')]
+
+
+# ---------------------------------------------------------
+#
+@enabled
+async def test_server_timing_create(test_data: dict,
+                                    test_app: AsyncClient):
+    """ Test the timing breakdown of a committed write. """
+    response = await test_app.post("/sms_transfers/", json=test_data['create_transfer'])
+    assert response.status_code == 201
+
+    header = response.headers['Server-Timing']
+    want = 'coalesced_metrics' if config.write_coalescing else 'create_metrics'
+    assert metric_names(header) == test_data[want]
+
+
+# ---------------------------------------------------------
+#
+@enabled
+async def test_server_timing_read(test_data: dict,
+                                  test_app: AsyncClient):
+    """ Test the timing breakdown of a read-only request (nothing to commit). """
+    response = await test_app.get("/sms_transfers/all/")
+    assert response.status_code == 200
+    assert metric_names(response.headers['Server-Timing']) == test_data['read_metrics']
+
+
+# ---------------------------------------------------------
+#
+async def test_server_timing_inactive():
+    """ Test that nothing is collected outside a timed request. """
+    assert not server_timing.active()
+
+    with server_timing.timed('sql'):
+        server_timing.record('sql', 1.0)
+
+    assert server_timing._timings.get() is None
+
+
+# ---------------------------------------------------------
+#
+async def test_server_timing_header(test_data: dict):
+    """ Test the Server-Timing header formatting. """
+    result = server_timing.header_value(test_data['header']['fields'])
+    assert result == test_data['header']['response']
@@ -11,6 +11,9 @@ VERSION INFO:
 ```
 """
 
+# BUILTIN modules
+import copy
+
 # Third party modules
 import pytest
 from sqlalchemy.exc import IntegrityError
@@ -39,13 +42,9 @@ async def test_create_crud_sms_doc_batch(test_data: dict,
     result = await transfer_crud.create(payload)
     assert result == test_data['create_transfer']['response']
 
-    try:
-        payload = SmsDocumentPayload(**test_data['create_document']['payload'])
-        result = await document_crud.create(payload)
-        assert result == test_data['create_document']['response']
-
-    except IntegrityError:
-        raise
+    payload = SmsDocumentPayload(**test_data['create_document']['payload'])
+    result = await document_crud.create(payload)
+    assert result == test_data['create_document']['response']
 
 
 # ---------------------------------------------------------
@@ -54,18 +53,17 @@ async def test_create_crud_sms_doc_fail(test_data: dict,
                                         transfer_crud: SmsTransferCrud,
                                         document_crud: SmsDocumentCrud):
     """ Test creating an SMS document batch for an unknown transfer UBID. """
-    try:
-        new_data = test_data.copy()
-        new_data['create_document']['payload']['UBID'] = "11dfd495-dc0a-11e6-a783-00059a3c7a00"
-        await test_create_crud_sms_doc_batch(new_data, transfer_crud, document_crud)
+    new_data = copy.deepcopy(test_data)
+    new_data['create_document']['payload']['UBID'] = "11dfd495-dc0a-11e6-a783-00059a3c7a00"
 
-    except IntegrityError:
-        assert True
+    with pytest.raises(IntegrityError):
+        await test_create_crud_sms_doc_batch(new_data, transfer_crud, document_crud)
 
 
 # ---------------------------------------------------------
 #
 async def test_read_crud_sms_documents(test_data: dict,
+                                       stored_documents: SmsDocumentPayload,
                                        document_crud: SmsDocumentCrud):
     """ Test read all documents for specified UBID. """
     payload = test_data['count']['payload']
@@ -86,6 +84,7 @@ async def test_read_crud_sms_unknown(test_data: dict,
 # ---------------------------------------------------------
 #
 async def test_update_state_crud_sms_doc(test_data: dict,
+                                         stored_documents: SmsDocumentPayload,
                                          document_crud: SmsDocumentCrud):
     """ Test update state for all sms_documents. """
     payload = test_data['update_state']['payload']
@@ -103,9 +102,57 @@ async def test_update_state_crud_sms_fail(test_data: dict,
     assert result == test_data['update_fail']['response']
 
 
+# ---------------------------------------------------------
+#
+async def test_stats_crud_sms_doc(test_data: dict,
+                                  stored_documents: SmsDocumentPayload,
+                                  document_crud: SmsDocumentCrud):
+    """ Test that the trigger maintained counters follow the state update. """
+    await document_crud.update_state(*test_data['update_state']['payload'])
+    result = await document_crud.stats(test_data['stats']['payload'])
+    assert result.model_dump() == test_data['stats']['response']
+
+
+# ---------------------------------------------------------
+#
+async def test_rebuild_crud_counters(test_data: dict,
+                                     stored_documents: SmsDocumentPayload,
+                                     document_crud: SmsDocumentCrud):
+    """ Test that a corrupted counter is found and rebuilt. """
+    await document_crud.update_state(*test_data['update_state']['payload'])
+    ubid = test_data['rebuild']['payload']
+    counter = await document_crud.stats(ubid)
+    counter.DONE = 42
+    await document_crud.session.flush()
+
+    for want in test_data['rebuild']['response']:
+        result = await document_crud.rebuild_counters(ubid)
+        assert result == want
+
+    result = await document_crud.stats(ubid)
+    assert result.model_dump() == test_data['stats']['response']
+
+
+# ---------------------------------------------------------
+#
+async def test_read_ranges_crud_sms_doc(test_data: dict,
+                                        stored_documents: SmsDocumentPayload,
+                                        document_crud: SmsDocumentCrud):
+    """ Test that stored uniqueId values are reported as consecutive ranges. """
+    ubid = test_data['ranges']['payload']
+    await document_crud.upsert_rows(test_data['ranges']['documents'], ubid=ubid)
+
+    result = await document_crud.read_ranges(ubid)
+    assert [item.model_dump() for item in result] == test_data['ranges']['response']
+
+    result = await document_crud.read_ranges(test_data['count_fail']['payload'])
+    assert result == []
+
+
 # ---------------------------------------------------------
 #
 async def test_read_all_crud_sms_foreign(test_data: dict,
+                                         stored_documents: SmsDocumentPayload,
                                          transfer_crud: SmsTransferCrud,
                                          document_crud: SmsDocumentCrud):
     """ Test read all documents for specified UBID.
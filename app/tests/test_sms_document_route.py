@@ -11,12 +11,17 @@ VERSION INFO:
 ```
 """
 
+# BUILTIN modules
+import json
+
 # Third party modules
 from httpx import AsyncClient
 from pytest import mark, MonkeyPatch
 from sqlalchemy.exc import IntegrityError
 
 # Local modules
+from ..sms_document import sms_document_routes
+from ..sms_document.models import SmsDocumentCounterModel, UniqueIdRange
 from ..sms_document.sms_document_crud import SmsDocumentCrud
 
 pytestmark = mark.test_data(__name__.rsplit('.')[-1])
@@ -131,6 +136,103 @@ async def test_read_sms_doc_exception(test_data: dict,
     assert response.json() == test_data['read_http_error']
 
 
+# ---------------------------------------------------------
+#
+async def test_read_sms_doc_stats(test_data: dict,
+                                  test_app: AsyncClient,
+                                  monkeypatch: MonkeyPatch):
+    """ Test read document counters per state for specified UBID. """
+
+    # ---------------------------------
+
+    async def mock_get(_, __):
+        """ Monkeypatch """
+        return SmsDocumentCounterModel(**test_data['stats']['counters'])
+
+    monkeypatch.setattr(SmsDocumentCrud, "stats", mock_get)
+
+    # ---------------------------------
+
+    url = "/sms_documents/{UBID}/stats/".format(**test_data)
+    response = await test_app.get(url)
+    assert response.status_code == 200
+    assert response.json() == test_data['stats']['response']
+
+
+# ---------------------------------------------------------
+#
+async def test_read_sms_doc_stats_unknown(test_data: dict,
+                                          test_app: AsyncClient,
+                                          monkeypatch: MonkeyPatch):
+    """ Test read document counters for unknown UBID. """
+
+    # ---------------------------------
+
+    async def mock_get(_, __):
+        """ Monkeypatch """
+        return None
+
+    monkeypatch.setattr(SmsDocumentCrud, "stats", mock_get)
+
+    # ---------------------------------
+
+    url = "/sms_documents/{UBID}/stats/".format(**test_data)
+    response = await test_app.get(url)
+    assert response.status_code == 404
+    assert response.json() == test_data['read_http_error']
+
+
+# ---------------------------------------------------------
+#
+async def test_read_sms_doc_ranges(test_data: dict,
+                                   test_app: AsyncClient,
+                                   monkeypatch: MonkeyPatch):
+    """ Test read the stored uniqueId ranges for specified UBID. """
+    ranges = [UniqueIdRange(**item) for item in test_data['ranges']['ranges']]
+
+    # ---------------------------------
+
+    async def mock_get(_, __):
+        """ Monkeypatch """
+        return ranges
+
+    monkeypatch.setattr(SmsDocumentCrud, "read_ranges", mock_get)
+
+    # ---------------------------------
+
+    url = "/sms_documents/{UBID}/ranges/".format(**test_data)
+    response = await test_app.get(url)
+    assert response.status_code == 200
+    assert response.json() == test_data['ranges']['response']
+
+    ranges = []
+    response = await test_app.get(url)
+    assert response.status_code == 404
+    assert response.json() == test_data['read_http_error']
+
+
+# ---------------------------------------------------------
+#
+async def test_rebuild_sms_doc_counters(test_data: dict,
+                                        test_app: AsyncClient,
+                                        monkeypatch: MonkeyPatch):
+    """ Test rebuild the document counters for all batches. """
+
+    # ---------------------------------
+
+    async def mock_post(_, __):
+        """ Monkeypatch """
+        return 1
+
+    monkeypatch.setattr(SmsDocumentCrud, "rebuild_counters", mock_post)
+
+    # ---------------------------------
+
+    response = await test_app.post("/sms_documents/counters/rebuild/")
+    assert response.status_code == 200
+    assert response.json() == test_data['rebuild']
+
+
 # ---------------------------------------------------------
 #
 async def test_update_state_sms_doc(test_data: dict,
@@ -175,3 +277,107 @@ async def test_update_state_sms_doc_exception(test_data: dict,
     response = await test_app.put(url)
     assert response.status_code == 404
     assert response.json() == test_data['read_http_error']
+
+
+# ---------------------------------------------------------
+#
+async def test_stream_sms_doc_batch(test_data: dict,
+                                    test_app: AsyncClient,
+                                    monkeypatch: MonkeyPatch):
+    """ Test creating an SMS document batch from an NDJSON stream. """
+
+    # ---------------------------------
+
+    async def mock_upsert(_, rows, ubid):
+        """ Monkeypatch """
+        assert str(ubid) == test_data['UBID']
+        return len(rows)
+
+    monkeypatch.setattr(SmsDocumentCrud, "upsert_rows", mock_upsert)
+
+    # ---------------------------------
+
+    documents = test_data['create_document']['payload']['documents']
+    body = '\n'.join(json.dumps(document) for document in documents)
+    response = await test_app.post(
+        "/sms_documents/{UBID}/stream".format(**test_data),
+        content=body.encode(),
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 201
+    assert response.json() == test_data['stream_document']['response']
+
+
+# ---------------------------------------------------------
+#
+async def test_stream_sms_doc_invalid_line(test_data: dict,
+                                           test_app: AsyncClient,
+                                           monkeypatch: MonkeyPatch):
+    """ Test that an invalid NDJSON line is reported with its line number. """
+
+    # ---------------------------------
+
+    async def mock_upsert(_, rows):
+        """ Monkeypatch """
+        return len(rows)
+
+    monkeypatch.setattr(SmsDocumentCrud, "upsert_rows", mock_upsert)
+
+    # ---------------------------------
+
+    documents = test_data['create_document']['payload']['documents']
+    invalid = dict(documents[1], SMScount=0)
+    body = '\n'.join(json.dumps(document) for document in (documents[0], invalid))
+    response = await test_app.post(
+        "/sms_documents/{UBID}/stream".format(**test_data),
+        content=body.encode(),
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 422
+    assert response.json() == test_data['stream_invalid_line']
+
+
+# ---------------------------------------------------------
+#
+async def test_stream_sms_doc_chunks(test_data: dict,
+                                     test_app: AsyncClient,
+                                     monkeypatch: MonkeyPatch):
+    """ Test that every chunk is upserted as soon as it's received. """
+    upserted = []
+
+    # ---------------------------------
+
+    async def mock_upsert(_, rows, ubid):
+        """ Monkeypatch """
+        upserted.append(len(rows))
+        return len(rows)
+
+    monkeypatch.setattr(SmsDocumentCrud, "upsert_rows", mock_upsert)
+    monkeypatch.setattr(sms_document_routes, "UPSERT_CHUNK_SIZE", 2)
+
+    # ---------------------------------
+
+    documents = test_data['create_document']['payload']['documents']
+    invalid = dict(documents[0], SMScount=0)
+    body = '\n'.join(json.dumps(document) for document in (*documents[:2], invalid))
+    response = await test_app.post(
+        "/sms_documents/{UBID}/stream".format(**test_data),
+        content=body.encode(),
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 422
+    assert upserted == [2]
+
+
+# ---------------------------------------------------------
+#
+async def test_stream_sms_doc_media_type(test_data: dict,
+                                         test_app: AsyncClient):
+    """ Test that only an NDJSON request body is accepted. """
+
+    response = await test_app.post(
+        "/sms_documents/{UBID}/stream".format(**test_data),
+        json=test_data['create_document']['payload']
+    )
+    assert response.status_code == 415
+    assert response.json() == test_data['stream_media_type']
@@ -11,11 +11,15 @@ VERSION INFO:
 ```
 """
 
+# BUILTIN modules
+from datetime import datetime
+
 # Third party modules
 import pytest
+from sqlmodel import func, update
 
 # Local modules
-from ..sms_transfer.models import SmsTransferPayload
+from ..sms_transfer.models import SmsTransferModel, SmsTransferPayload, SmsTransferState
 from ..sms_transfer.sms_transfer_crud import SmsTransferCrud
 
 pytestmark = pytest.mark.test_data(__name__.rsplit('.')[-1])
@@ -49,9 +53,11 @@ async def test_create_crud_sms_tran_fail(test_data: dict,
 # ---------------------------------------------------------
 #
 async def test_read_all_crud_sms_tran(test_data: dict,
+                                      stored_transfer: SmsTransferPayload,
                                       transfer_crud: SmsTransferCrud):
     """ Test read all the SMS transfer state row(s). """
     response = await transfer_crud.read_all()
+    assert len(response) == len(test_data['read_all']['response'])
 
     for idx, item in enumerate(response):
         want = test_data['read_all']['response'][idx]
@@ -70,32 +76,43 @@ async def test_read_all_crud_sms_tran(test_data: dict,
 # ---------------------------------------------------------
 #
 async def test_update_crud_sms_tran_state(test_data: dict,
+                                          stored_transfer: SmsTransferPayload,
                                           transfer_crud: SmsTransferCrud):
     """ Test update SMS transfer state row. """
     ubid = test_data['update_state']['orig']['UBID']
     state = test_data['update_state']['response']['state']
-    response = await transfer_crud.read(ubid)
+    response = await transfer_crud.update_state(ubid, state)
+    got = response.model_dump()
+    want = test_data["update_state"]["response"]
 
-    if response:
-        await transfer_crud.update_state(ubid, state)
-        await transfer_crud.refresh(response)
+    for key, value in want.items():
 
-        got = response.model_dump()
-        want = test_data["update_state"]["response"]
+        # We need to verify that we got an updated timestamp after the update.
+        if key == 'when':
+            assert str(got[key]) > value
 
-        for key, value in want.items():
+        else:
+            assert got[key] == value
 
-            # We need to verify that we got an updated timestamp after the update.
-            if key == 'when':
-                assert str(got[key]) > value
 
-            else:
-                assert got[key] == value
+# ---------------------------------------------------------
+#
+async def test_update_crud_sms_tran_totals(test_data: dict,
+                                           stored_transfer: SmsTransferPayload,
+                                           transfer_crud: SmsTransferCrud):
+    """ Test update SMS transfer row totals for known and unknown UBID. """
+    for ubid, want in test_data['update_totals']['response'].items():
+        result = await transfer_crud.update_totals(ubid, *test_data['update_totals']['payload'])
+        assert result == want
+
+    result = await transfer_crud.read_all()
+    assert (result[0].documents, result[0].SMScount) == tuple(test_data['update_totals']['payload'])
 
 
 # ---------------------------------------------------------
 #
 async def test_del_crud_sms_tran_batch(test_data: dict,
+                                       stored_transfer: SmsTransferPayload,
                                        transfer_crud: SmsTransferCrud):
     """ Test delete sms_transfer row."""
     result = await transfer_crud.delete(test_data['UBID'])
@@ -110,3 +127,66 @@ async def test_del_crud_sms_tran_unknown(test_data: dict,
     ubid = "7ac59850-b4e8-4ab6-ad1c-5b4645ba0000"
     result = await transfer_crud.delete(ubid)
     assert result == test_data['remove_not_found']
+
+
+# ---------------------------------------------------------
+#
+async def test_read_page_crud_sms_tran(test_data: dict,
+                                       transfer_crud: SmsTransferCrud):
+    """ Test paging through filtered and projected SMS transfer rows. """
+    params = test_data['read_page']
+
+    for payload in params['payloads']:
+        await transfer_crud.create(SmsTransferPayload(**payload))
+        await transfer_crud.update_state(payload['UBID'], SmsTransferState.DONE)
+
+    # Give the rows the same timestamp, so that the UBID decides the order
+    # (independent of whether the inserts straddle a second boundary).
+    ubids = [payload['UBID'] for payload in params['payloads']]
+    await transfer_crud.session.exec(
+        update(SmsTransferModel).where(SmsTransferModel.UBID.in_(ubids))
+        .values(when=func.current_timestamp()))
+    got, cursor = [], None
+
+    while True:
+        rows, cursor = await transfer_crud.read_page(
+            params['limit'], cursor, SmsTransferState.DONE,
+            fields=params['fields'])
+        assert len(rows) <= params['limit']
+        assert all(list(row) == params['fields'] for row in rows)
+        got += [row['UBID'] for row in rows]
+
+        if cursor is None:
+            break
+
+    assert [ubid for ubid in got if ubid in params['response']] == params['response']
+
+
+# ---------------------------------------------------------
+#
+async def test_read_page_crud_utc_offset(test_data: dict,
+                                         transfer_crud: SmsTransferCrud):
+    """ Test that a since and until with a UTC offset are compared in UTC. """
+    params = test_data['read_page_offset']
+    ubid = params['payload']['UBID']
+    await transfer_crud.create(SmsTransferPayload(**params['payload']))
+    await transfer_crud.session.exec(
+        update(SmsTransferModel).where(SmsTransferModel.UBID == ubid)
+        .values(when=datetime.fromisoformat(params['when'])))
+
+    for since, until, response in params['ranges']:
+        rows, _ = await transfer_crud.read_page(
+            10, since=datetime.fromisoformat(since),
+            until=datetime.fromisoformat(until), fields=['UBID'])
+        assert [row['UBID'] for row in rows] == response
+
+
+# ---------------------------------------------------------
+#
+async def test_read_page_crud_invalid(transfer_crud: SmsTransferCrud):
+    """ Test that an invalid cursor, or field name is rejected. """
+    with pytest.raises(ValueError):
+        await transfer_crud.read_page(10, cursor='not-a-cursor')
+
+    with pytest.raises(ValueError):
+        await transfer_crud.read_page(10, fields=['UBID', 'unknown'])
@@ -17,6 +17,7 @@ from pytest import mark, MonkeyPatch
 from sqlalchemy.exc import IntegrityError
 
 # Local modules
+from ..sms_transfer.models import SmsTransferModel
 from ..sms_transfer.sms_transfer_crud import SmsTransferCrud
 
 pytestmark = mark.test_data(__name__.rsplit('.')[-1])
@@ -110,34 +111,49 @@ async def test_read_all_sms_tran(test_data: dict,
 
 # ---------------------------------------------------------
 #
-async def test_update_sms_tran_state(test_data: dict,
-                                     test_app: AsyncClient,
-                                     monkeypatch: MonkeyPatch):
-    """ Test update SMS transfer state row. """
+async def test_read_page_sms_tran(test_data: dict,
+                                  test_app: AsyncClient,
+                                  monkeypatch: MonkeyPatch):
+    """ Test read one projected page of SMS transfer batch rows. """
 
     # ---------------------------------
 
-    async def mock_get(_, __):
+    async def mock_get(*_):
         """ Monkeypatch """
-        return test_data['update_state']['orig']
+        return test_data['read_page']['rows'], test_data['read_page']['next_cursor']
 
-    monkeypatch.setattr(SmsTransferCrud, "read", mock_get)
+    monkeypatch.setattr(SmsTransferCrud, "read_page", mock_get)
 
     # ---------------------------------
+    response = await test_app.get("/sms_transfers/?limit=1&fields=UBID,state")
+    assert response.status_code == 200
+    assert response.json() == test_data['read_page']['response']
 
-    async def mock_put(_, __, ___):
-        """ Monkeypatch """
-        return 0
 
-    monkeypatch.setattr(SmsTransferCrud, "update_state", mock_put)
+# ---------------------------------------------------------
+#
+async def test_read_page_sms_tran_cursor(test_data: dict,
+                                         test_app: AsyncClient):
+    """ Test read a page of SMS transfer batch rows with an invalid cursor. """
+    response = await test_app.get("/sms_transfers/?cursor=not-a-cursor")
+    assert response.status_code == 422
+    assert response.json() == test_data['read_page_invalid_cursor']
+
+
+# ---------------------------------------------------------
+#
+async def test_update_sms_tran_state(test_data: dict,
+                                     test_app: AsyncClient,
+                                     monkeypatch: MonkeyPatch):
+    """ Test update SMS transfer state row. """
 
     # ---------------------------------
 
-    async def mock_refresh(_, data):
+    async def mock_put(_, __, ___):
         """ Monkeypatch """
-        data.update(test_data['update_state']['response'])
+        return SmsTransferModel(**test_data['update_state']['response'])
 
-    monkeypatch.setattr(SmsTransferCrud, "refresh", mock_refresh)
+    monkeypatch.setattr(SmsTransferCrud, "update_state", mock_put)
 
     # ---------------------------------
 
@@ -156,11 +172,11 @@ async def test_update_sms_tran_state_error(test_data: dict,
 
     # ---------------------------------
 
-    async def mock_get(_, __):
+    async def mock_put(_, __, ___):
         """ Monkeypatch """
-        return 0
+        return None
 
-    monkeypatch.setattr(SmsTransferCrud, "read", mock_get)
+    monkeypatch.setattr(SmsTransferCrud, "update_state", mock_put)
 
     # ---------------------------------
 
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# BUILTIN modules
+import io
+import json
+import logging
+
+# Third party modules
+from pytest import mark
+from loguru import logger
+
+# Local modules
+from ..core.unified_logging import create_unified_logger, sampled
+
+pytestmark = mark.test_data(__name__.rsplit('.')[-1])
+""" Add the test_data fixture to all test functions in the module. """
+
+
+# ---------------------------------------------------------
+#
+def written_lines(stream: io.StringIO) -> list:
+    """ Stop the logging (the queued lines are written) and return the JSON lines.
+
+    Args:
+        stream: Production profile stream.
+
+    Returns:
+        Decoded log lines.
+    """
+    logger.remove()
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+# ---------------------------------------------------------
+#
+async def test_production_profile(test_data: dict):
+    """ Test the JSON lines of loguru and Python logging records. """
+    stream = io.StringIO()
+    create_unified_logger('info', 'production', stream)
+
+    logger.bind(request_id='0b6f8f3e').info('Created {} document(s)', 3)
+    logging.getLogger('tracking.stdlib').warning('Retrying %s in 5 sec', '{batch}')
+    logger.debug('Not logged')
+
+    try:
+        _ = 1 / 0
+
+    except ZeroDivisionError:
+        logger.exception('Failed')
+
+    record, stdlib_record, exception = written_lines(stream)
+
+    for want, got in ((test_data['record'], record),
+                      (test_data['stdlib_record'], stdlib_record)):
+        assert {key: got[key] for key in want} == want
+
+    assert record['logger'] == __name__
+    assert exception['exception'].strip().endswith(test_data['exception'])
+
+
+# ---------------------------------------------------------
+#
+async def test_sampled_logger(test_data: dict):
+    """ Test that only every Nth record of a sampled call is logged. """
+    want = test_data['sampled']
+    stream = io.StringIO()
+    create_unified_logger('debug', 'production', stream)
+    log = sampled(want['rate'])
+
+    for idx in range(want['calls']):
+        log.debug('call {}', idx)
+
+    lines = written_lines(stream)
+    assert [line['message'] for line in lines] == want['response']
+    assert {line['function'] for line in lines} == {'test_sampled_logger'}
+
+
+# ---------------------------------------------------------
+#
+async def test_sampled_logger_disabled(test_data: dict):
+    """ Test that the calls of a disabled level are neither logged nor counted. """
+    stream = io.StringIO()
+    create_unified_logger('info', 'production', stream)
+    log = sampled(test_data['sampled']['rate'])
+
+    for idx in range(test_data['sampled']['calls']):
+        log.debug('call {}', idx)
+
+    assert written_lines(stream) == []
+    assert log._counts == {}
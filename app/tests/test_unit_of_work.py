@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# BUILTIN modules
+import sqlite3
+import asyncio
+from pathlib import Path
+from dataclasses import replace
+
+# Third party modules
+import pytest
+from sqlmodel import SQLModel
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+# Local modules
+from ..core.config import config, RetryPolicy
+from ..core.metrics import DB_BUSY_FAILURES, DB_BUSY_RETRIES
+from ..core.database import create_engines, create_sqlite_engine
+from ..core.unit_of_work import (UnitOfWork, is_busy_error,
+                                 read_session_maker, write_session_maker)
+from ..sms_transfer import sms_transfer_routes
+from ..sms_transfer.models import SmsTransferPayload
+from ..sms_transfer.sms_transfer_crud import SmsTransferCrud
+
+pytestmark = pytest.mark.test_data(__name__.rsplit('.')[-1])
+""" Add the test_data fixture to all test functions in the module. """
+
+
+# ---------------------------------------------------------
+#
+async def hold_write_lock(engine: AsyncEngine, hold: float, stop: asyncio.Event):
+    """ Simulate another process that repeatedly holds the DB write lock.
+
+    Args:
+        engine: DB engine of the other process.
+        hold: Seconds the write lock is held every time.
+        stop: Stop when set.
+    """
+    async with engine.connect() as conn:
+        while not stop.is_set():
+            await conn.exec_driver_sql('BEGIN IMMEDIATE')
+            await asyncio.sleep(hold)
+            await conn.commit()
+            await asyncio.sleep(hold / 4)
+
+
+# ---------------------------------------------------------
+#
+async def run_writers(test_data: dict, tmp_path: Path, monkeypatch: pytest.MonkeyPatch,
+                      retry: RetryPolicy | None) -> tuple:
+    """ Run concurrent writers while another process holds the write lock.
+
+    Args:
+        test_data: Test module data.
+        tmp_path: Directory of the DB file.
+        monkeypatch: Binds the UnitOfWork to the DB file.
+        retry: UnitOfWork retry policy.
+
+    Returns:
+        Writer results (or exceptions), and the number of stored rows.
+    """
+    params = test_data['stress']
+    url = f'sqlite+aiosqlite:///{tmp_path / "busy.db"}'
+    pragmas = replace(config.sqlite, busy_timeout=params['busy_timeout'])
+    engine = create_sqlite_engine(url, pragmas, pool_size=1, max_overflow=0)
+    other = create_sqlite_engine(url, pragmas)
+    monkeypatch.setitem(write_session_maker.kw, 'bind', engine)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    stop = asyncio.Event()
+    blocker = asyncio.create_task(hold_write_lock(other, params['hold'], stop))
+    await asyncio.sleep(0.01)
+
+    async def writer(idx: int) -> int:
+        """ Store one transfer batch. """
+        payload = SmsTransferPayload(**{**params['payload'], 'UBID': f'{idx:036}'})
+        return await UnitOfWork(SmsTransferCrud, retry=retry).run(
+            lambda crud: crud.create(payload))
+
+    try:
+        results = await asyncio.gather(*[writer(idx) for idx in range(params['writers'])],
+                                       return_exceptions=True)
+
+    finally:
+        stop.set()
+        await blocker
+
+    monkeypatch.undo()
+
+    async with engine.connect() as conn:
+        stored = (await conn.exec_driver_sql('SELECT count(*) FROM sms_transfers')).scalar()
+
+    await engine.dispose()
+    await other.dispose()
+    return results, stored
+
+
+# ---------------------------------------------------------
+#
+async def test_read_only_keeps_loaded_objects(test_data: dict, db_connection: AsyncConnection):
+    """ Test that a read-only unit of work doesn't expire the objects it returns. """
+    payload = SmsTransferPayload(**test_data['read_only'])
+
+    async with UnitOfWork(SmsTransferCrud) as crud:
+        await crud.create(payload)
+
+    async with UnitOfWork(SmsTransferCrud, read_only=True) as crud:
+        transfer = await crud.read(payload.UBID)
+
+    # The attributes are read after the session is closed.
+    assert (transfer.UBID, transfer.fileName) == (str(payload.UBID), payload.fileName)
+    assert transfer.state is not None
+
+
+# ---------------------------------------------------------
+#
+async def test_read_only_reader_pool(test_data: dict, tmp_path: Path,
+                                     monkeypatch: pytest.MonkeyPatch):
+    """ Test that a read-only unit of work reads while a write transaction holds the writer. """
+    params = test_data['reader_pool']
+    writer, reader = create_engines(f'sqlite+aiosqlite:///{tmp_path / "reader.db"}')
+    monkeypatch.setitem(write_session_maker.kw, 'bind', writer)
+    monkeypatch.setitem(read_session_maker.kw, 'bind', reader)
+    assert reader is not writer
+
+    async with writer.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    stored = SmsTransferPayload(**test_data['read_only'])
+    pending = SmsTransferPayload(**params['payload'])
+    await UnitOfWork(SmsTransferCrud).run(lambda crud: crud.create(stored))
+    holding, release = asyncio.Event(), asyncio.Event()
+
+    async def write():
+        """ Hold the only writer connection in an open write transaction. """
+        async with UnitOfWork(SmsTransferCrud) as crud:
+            await crud.create(pending)
+            holding.set()
+            await release.wait()
+
+    async def read(crud: SmsTransferCrud) -> tuple:
+        """ Read the committed and the pending transfer batch. """
+        return await crud.read(stored.UBID), await crud.read(pending.UBID)
+
+    task = asyncio.create_task(write())
+    await holding.wait()
+
+    try:
+        transfer, uncommitted = await asyncio.wait_for(
+            UnitOfWork(SmsTransferCrud, read_only=True).run(read), params['timeout'])
+        assert transfer.fileName == stored.fileName
+        assert uncommitted is None
+
+        with pytest.raises(OperationalError, match=params['read_only_error']):
+            await UnitOfWork(SmsTransferCrud, read_only=True).run(
+                lambda crud: crud.delete(stored.UBID))
+
+    finally:
+        release.set()
+        await task
+        monkeypatch.undo()
+        await writer.dispose()
+        await reader.dispose()
+
+
+# ---------------------------------------------------------
+#
+async def test_busy_error_detection(test_data: dict):
+    """ Test that only busy and locked errors are retryable. """
+    for message, want in test_data['busy_errors']:
+        error = OperationalError('INSERT', {}, sqlite3.OperationalError(message))
+        assert is_busy_error(error) is want
+
+    assert not is_busy_error(IntegrityError('INSERT', {}, sqlite3.IntegrityError(
+        test_data['busy_errors'][0][0])))
+
+
+# ---------------------------------------------------------
+#
+async def test_concurrent_writers_retry(test_data: dict, tmp_path: Path,
+                                        monkeypatch: pytest.MonkeyPatch):
+    """ Test that concurrent writers fail without retries, and all succeed with retries.
+
+    Another process (connection) repeatedly holds the write lock for
+    longer than the busy timeout of the writers.
+    """
+    params = test_data['stress']
+    unit = ('SmsTransferCrud',)
+    retries, failures = (DB_BUSY_RETRIES.values.get(unit, 0),
+                         DB_BUSY_FAILURES.values.get(unit, 0))
+
+    results, stored = await run_writers(test_data, tmp_path, monkeypatch, None)
+    failed = [result for result in results if isinstance(result, Exception)]
+    assert failed and all(is_busy_error(result) for result in failed)
+    assert stored == len(results) - len(failed)
+
+    (tmp_path / 'busy.db').unlink()
+    results, stored = await run_writers(test_data, tmp_path, monkeypatch,
+                                        RetryPolicy(**params['retry']))
+    assert results == [1] * params['writers']
+    assert stored == params['writers']
+    assert DB_BUSY_RETRIES.values[unit] > retries
+    assert DB_BUSY_FAILURES.values.get(unit, 0) == failures
+
+
+# ---------------------------------------------------------
+#
+async def test_busy_route_response(test_data: dict, test_app: AsyncClient,
+                                   monkeypatch: pytest.MonkeyPatch):
+    """ Test that a request that is still busy after the last retry gets a 503. """
+    params = test_data['exhausted']
+    unit = ('SmsTransferCrud',)
+    retries, failures = (DB_BUSY_RETRIES.values.get(unit, 0),
+                         DB_BUSY_FAILURES.values.get(unit, 0))
+
+    async def busy_delete(*_) -> int:
+        """ Fail like a DB that another process keeps locked. """
+        raise OperationalError('DELETE', {}, sqlite3.OperationalError(params['error']))
+
+    monkeypatch.setattr(SmsTransferCrud, 'delete', busy_delete)
+    monkeypatch.setattr(sms_transfer_routes, 'config',
+                        replace(config, write_retry=RetryPolicy(**params['retry'])))
+
+    response = await test_app.delete(f"/sms_transfers/{params['ubid']}/")
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == params['retry_after']
+    assert DB_BUSY_RETRIES.values[unit] == retries + params['retry']['attempts'] - 1
+    assert DB_BUSY_FAILURES.values[unit] == failures + 1
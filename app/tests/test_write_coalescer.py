@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# BUILTIN modules
+import asyncio
+
+# Third party modules
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+# Local modules
+from ..core.unit_of_work import UnitOfWork
+from ..core.database import async_engine
+from ..core.write_coalescer import WriteCoalescer
+from ..sms_document.models import SmsDocumentPayload
+from ..sms_transfer.models import SmsTransferPayload
+from ..sms_document.sms_document_crud import SmsDocumentCrud
+from ..sms_transfer.sms_transfer_crud import SmsTransferCrud
+
+pytestmark = pytest.mark.test_data(__name__.rsplit('.')[-1])
+""" Add the test_data fixture to all test functions in the module. """
+
+
+# ---------------------------------------------------------
+#
+async def test_group_commit_isolation(test_data: dict, db_schema: None):
+    """ Test that a failing operation doesn't affect the rest of the group.
+
+    The orphan documents violate the foreign key constraint, so only that
+    operation is rolled back (to its savepoint), and the IntegrityError is
+    returned to its caller. Both transfers are committed in one transaction.
+    """
+    commits = []
+    coalescer = WriteCoalescer(window=0.05, max_batch=10)
+    listener = (lambda *_: commits.append(1))
+    event.listen(async_engine.sync_engine, "commit", listener)
+    first, second = [SmsTransferPayload(**item) for item in test_data['transfers']]
+    orphans = SmsDocumentPayload(**test_data['orphan_documents'])
+
+    try:
+        results = await asyncio.gather(
+            coalescer.submit(SmsTransferCrud, lambda crud: crud.create(first)),
+            coalescer.submit(SmsDocumentCrud, lambda crud: crud.create(orphans)),
+            coalescer.submit(SmsTransferCrud, lambda crud: crud.create(second)),
+            return_exceptions=True
+        )
+        await coalescer.stop()
+
+    finally:
+        event.remove(async_engine.sync_engine, "commit", listener)
+
+    assert results[0] == 1
+    assert isinstance(results[1], IntegrityError)
+    assert results[2] == 1
+    assert len(commits) == 1
+
+    async with UnitOfWork(SmsTransferCrud) as crud:
+        for payload in (first, second):
+            assert await crud.read(payload.UBID) is not None
+            assert await crud.delete(payload.UBID) == 1
+
+
+# ---------------------------------------------------------
+#
+async def test_group_commit_max_batch(test_data: dict, db_schema: None):
+    """ Test that a full group is committed without waiting for the window. """
+    coalescer = WriteCoalescer(window=60, max_batch=2)
+    payloads = [SmsTransferPayload(**item) for item in test_data['transfers']]
+
+    results = await asyncio.wait_for(asyncio.gather(
+        *[coalescer.submit(SmsTransferCrud, lambda crud, item=item: crud.create(item))
+          for item in payloads]), timeout=5)
+    await coalescer.stop()
+    assert results == [1, 1]
+
+    async with UnitOfWork(SmsTransferCrud) as crud:
+        for payload in payloads:
+            assert await crud.delete(payload.UBID) == 1
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+
+Load test of the bulk document upsert admission control (see
+``AdmissionMiddleware``), with an ingestion spike against a running
+service:
+
+  - *readers*: Count the documents of a batch, one request at a time.
+  - *loaders*: Upsert a big sub-batch of documents, one request at a
+    time, and retry after the Retry-After seconds when rejected.
+
+The service is started as a separate program for every admission limit,
+and the read latency, the upserted documents and the rejected upserts are
+compared. An unlimited run uses a limit above the number of loaders.
+
+Run it from the repository root:
+
+    python -m benchmarks.bench_admission --limits 1000 2 --loaders 16
+"""
+
+# BUILTIN modules
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from uuid import uuid4
+from typing import Dict, List
+
+# Third party modules
+import httpx
+from pydantic_core import to_json
+
+# Local modules
+from benchmarks.bench_workers import ROOT, wait_until_ready
+from benchmarks.common import sqlite_url, make_documents, percentile
+
+
+# ---------------------------------------------------------
+#
+def start_service(limit: int, port: int, db_path: Path) -> subprocess.Popen:
+    """ Start the service program with the specified bulk upsert limit.
+
+    Args:
+        limit: Max number of concurrent bulk upserts.
+        port: Server port.
+        db_path: DB file path.
+
+    Returns:
+        The service program process.
+    """
+    env = dict(os.environ, TRACKING_BULK_MAX_CONCURRENT=str(limit),
+               TRACKING_PORT=str(port), TRACKING_WORKERS='1',
+               TRACKING_DB_URL=sqlite_url(db_path), TRACKING_LOG_PROFILE='production')
+    return subprocess.Popen([sys.executable, str(ROOT / 'run.py')], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+# ---------------------------------------------------------
+#
+async def spike(base_url: str, args: argparse.Namespace) -> Dict[str, list]:
+    """ Run the readers and loaders for the specified duration.
+
+    Args:
+        base_url: Service base URL.
+        args: Namespace object containing command line arguments.
+
+    Returns:
+        Read latencies in seconds, and the upserted and rejected counts.
+    """
+    result = {'read': [], 'documents': [0], 'rejected': [0], 'errors': [0]}
+    connections = args.readers + args.loaders
+    limits = httpx.Limits(max_connections=connections,
+                          max_keepalive_connections=connections)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        ubids = []
+
+        for loader in range(args.loaders):
+            ubid = str(uuid4())
+            transfer = {'UBID': ubid, 'SMScount': args.documents, 'documents': args.documents,
+                        'fileName': f'{ubid}.zip', 'origName': 'benchmark.xml'}
+            (await client.post('/sms_transfers/', json=transfer)).raise_for_status()
+            ubids.append(ubid)
+
+        # Encode the bodies once, so that the client isn't the bottleneck.
+        bodies = [to_json({'UBID': ubid, 'documents': make_documents(ubid, 1, args.documents)})
+                  for ubid in ubids]
+        headers = {'Content-Type': 'application/json'}
+        deadline = time.monotonic() + args.duration
+
+        async def reader(ubid: str):
+            """ Count the documents of a batch until the deadline. """
+            while time.monotonic() < deadline:
+                begin = time.perf_counter()
+                response = await client.get(f'/sms_documents/{ubid}/')
+
+                if response.status_code < 300:
+                    result['read'].append(time.perf_counter() - begin)
+
+                await asyncio.sleep(0.01)
+
+        async def loader(body: bytes):
+            """ Upsert the documents until the deadline. """
+            while time.monotonic() < deadline:
+                try:
+                    response = await client.post('/sms_documents/', content=body,
+                                                 headers=headers)
+
+                except httpx.HTTPError:
+                    result['errors'][0] += 1
+                    continue
+
+                if response.status_code == 503:
+                    result['rejected'][0] += 1
+                    await asyncio.sleep(float(response.headers.get('Retry-After', 1)))
+
+                elif response.status_code < 300:
+                    result['documents'][0] += args.documents
+
+                else:
+                    result['errors'][0] += 1
+
+        await asyncio.gather(*[reader(ubids[item % len(ubids)])
+                               for item in range(args.readers)],
+                             *[loader(body) for body in bodies])
+
+    return result
+
+
+# ---------------------------------------------------------
+#
+def run_load_test(limit: int, args: argparse.Namespace) -> dict:
+    """ Return the read latency and ingestion rate with the specified limit.
+
+    Args:
+        limit: Max number of concurrent bulk upserts.
+        args: Namespace object containing command line arguments.
+
+    Returns:
+        Load test result.
+    """
+    base_url = f'http://127.0.0.1:{args.port}/tracking'
+
+    with tempfile.TemporaryDirectory() as tmp:
+        service = start_service(limit, args.port, Path(tmp) / 'tracking.db')
+
+        try:
+            asyncio.run(wait_until_ready(base_url))
+            result = asyncio.run(spike(base_url, args))
+
+        finally:
+            service.terminate()
+            service.wait(timeout=30)
+
+    reads: List[float] = sorted(result['read'])
+    return {'read_p50_ms': percentile(reads, 50) * 1000,
+            'read_p99_ms': percentile(reads, 99) * 1000,
+            'documents_sec': result['documents'][0] / args.duration,
+            'rejected': result['rejected'][0],
+            'errors': result['errors'][0]}
+
+
+# ---------------------------------------------------------
+#
+def main(args: argparse.Namespace):
+    """ Run the load test for every admission limit and print the result.
+
+    Args:
+        args: Namespace object containing command line arguments.
+    """
+    print(f"{args.readers} readers, {args.loaders} loaders of {args.documents} "
+          f"documents, {args.duration} sec per run:")
+
+    for limit in args.limits:
+        result = run_load_test(limit, args)
+        print(f"limit: {limit:4}  read p50/p99: {result['read_p50_ms']:7.1f}/"
+              f"{result['read_p99_ms']:7.1f} ms  {result['documents_sec']:8,.0f} docs/sec  "
+              f"rejected: {result['rejected']}  errors: {result['errors']}")
+
+
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    Form = argparse.ArgumentDefaultsHelpFormatter
+    description = 'Load test the bulk upsert admission control with an ingestion spike.'
+    parser = argparse.ArgumentParser(description=description, formatter_class=Form)
+    parser.add_argument("--limits", type=int, nargs='+', default=[1000, 2],
+                        help="Max concurrent bulk upserts to compare.")
+    parser.add_argument("--duration", type=float, default=20,
+                        help="Seconds of load per limit.")
+    parser.add_argument("--readers", type=int, default=8,
+                        help="Number of concurrent readers.")
+    parser.add_argument("--loaders", type=int, default=16,
+                        help="Number of concurrent bulk upsert loaders.")
+    parser.add_argument("--documents", type=int, default=5000,
+                        help="Documents per bulk upsert.")
+    parser.add_argument("--port", type=int, default=7011,
+                        help="Service port during the test.")
+    main(parser.parse_args())
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+
+Measure wall time and peak memory per document payload, from the JSON
+request body to the upserted rows, with the previous per-document model
+path compared to the bulk TypedDict path in ``SmsDocumentPayload``.
+
+The previous path validated every document into an ``SmsDocumentItem``
+model, assigned the ``UBID`` to every model, and dumped the payload into
+a second copy of the documents. It's reproduced by the ``Legacy*``
+models in this module.
+
+Run it from the repository root:
+
+    python -m benchmarks.bench_document_validation --documents 5000
+"""
+
+# BUILTIN modules
+import json
+import asyncio
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+from pathlib import Path
+from typing import List, Optional
+
+# Third party modules
+from pydantic import PositiveInt
+from sqlmodel import SQLModel, Field
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Local modules
+from app.core.config import config
+from app.sms_document.models import SmsDocumentPayload
+from app.core.database import create_sqlite_engine
+from app.sms_document.sms_document_crud import SmsDocumentCrud
+from benchmarks.common import sqlite_url, make_documents, create_schema_and_batch, Timer
+
+
+# -----------------------------------------------------------------------------
+#
+class LegacyDocumentItem(SQLModel):
+    """ The previous SMS document payload item model. """
+    data: dict
+    SMScount: PositiveInt
+    UBID: Optional[str] = None
+    uniqueId: str = Field(max_length=10)
+
+
+# -----------------------------------------------------------------------------
+#
+class LegacyDocumentPayload(SQLModel):
+    """ The previous SMS document payload model. """
+    UBID: str = Field(max_length=36)
+    documents: List[LegacyDocumentItem] = Field(max_length=50000)
+
+
+# ---------------------------------------------------------
+#
+def legacy_rows(body: bytes) -> List[dict]:
+    """ Return upsert rows the way the previous create path did.
+
+    Args:
+        body: JSON request body.
+
+    Returns:
+        SMS document rows.
+    """
+    payload = LegacyDocumentPayload.model_validate(json.loads(body))
+
+    for document in payload.documents:
+        document.UBID = payload.UBID
+
+    return payload.model_dump()['documents']
+
+
+# ---------------------------------------------------------
+#
+def bulk_rows(body: bytes) -> List[dict]:
+    """ Return upsert rows the way the current create path does.
+
+    Args:
+        body: JSON request body.
+
+    Returns:
+        SMS document rows (without UBID, it's bound in the statement).
+    """
+    return SmsDocumentPayload.model_validate(json.loads(body)).documents
+
+
+# ---------------------------------------------------------
+#
+async def measure(engine: AsyncEngine, ubid: str, body: bytes, legacy: bool) -> float:
+    """ Return the wall time of one payload, from JSON body to upserted rows.
+
+    Args:
+        engine: Used DB engine.
+        ubid: Unique Batch ID.
+        body: JSON request body.
+        legacy: Use the previous per-document model path when True.
+
+    Returns:
+        Elapsed milliseconds.
+    """
+    with Timer() as timer:
+        async with AsyncSession(engine) as session:
+            crud = SmsDocumentCrud(session)
+
+            if legacy:
+                await crud.upsert_rows(legacy_rows(body))
+
+            else:
+                await crud.upsert_rows(bulk_rows(body), ubid=ubid)
+
+            await session.commit()
+
+    return timer.elapsed * 1000
+
+
+# ---------------------------------------------------------
+#
+def peak_memory(body: bytes, legacy: bool) -> float:
+    """ Return the peak memory of validating one payload into upsert rows.
+
+    Args:
+        body: JSON request body.
+        legacy: Use the previous per-document model path when True.
+
+    Returns:
+        Peak allocated MiB.
+    """
+    tracemalloc.start()
+    rows = legacy_rows(body) if legacy else bulk_rows(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del rows
+    return peak / 2**20
+
+
+# ---------------------------------------------------------
+#
+async def main(args: argparse.Namespace):
+    """ Run the benchmark for both paths and print the result.
+
+    Args:
+        args: Namespace object containing command line arguments.
+    """
+    path = Path(tempfile.mkdtemp()) / 'document_validation.db'
+    engine = create_sqlite_engine(sqlite_url(path), config.sqlite)
+    ubid = await create_schema_and_batch(engine, args.documents)
+    body = json.dumps({'UBID': ubid, 'documents': make_documents(
+        ubid, 1, args.documents)}).encode()
+    print(f"{args.documents} documents per payload ({len(body) / 2**20:.1f} MiB body):")
+
+    for name, legacy in (('per-document models', True), ('bulk TypedDict', False)):
+        times = [await measure(engine, ubid, body, legacy) for _ in range(args.repeat)]
+        print(f"  {name:<20} wall={statistics.median(times):7.1f} ms "
+              f"peak={peak_memory(body, legacy):6.1f} MiB")
+
+    await engine.dispose()
+
+
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    Form = argparse.ArgumentDefaultsHelpFormatter
+    description = 'Measure wall time and peak memory per document payload.'
+    parser = argparse.ArgumentParser(description=description, formatter_class=Form)
+    parser.add_argument("--documents", type=int, default=5000,
+                        help="Number of documents in the payload.")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Measurements per path (the median is used).")
+    asyncio.run(main(parser.parse_args()))
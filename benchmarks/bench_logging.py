@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+
+Measure the log call cost of the logging profiles (see
+``app.core.unified_logging``), written to /dev/null:
+
+  - A debug call when the debug level is disabled.
+  - A ``sampled`` debug call (1/100 logged), disabled and enabled.
+  - An info call in the *development* profile (written by the caller).
+  - An info call in the *production* profile (JSON encoded and written
+    by the writer thread), for the caller, and for the whole run
+    including the writer thread.
+  - A Python logging module record in the *production* profile.
+
+Run it from the repository root:
+
+    python -m benchmarks.bench_logging --calls 50000
+"""
+
+# BUILTIN modules
+import os
+import logging
+import argparse
+from typing import Callable
+
+# Third party modules
+from loguru import logger
+
+# Local modules
+from app.core.unified_logging import create_unified_logger, sampled
+from benchmarks.common import Timer
+
+
+# ---------------------------------------------------------
+#
+def measure(profile: str, level: str, log_call: Callable, calls: int) -> tuple:
+    """ Return the caller and total microseconds per log call.
+
+    The total includes stopping the logging, which waits for the
+    writer thread to write the queued records (production profile).
+
+    Args:
+        profile: Logging profile.
+        level: Log level.
+        log_call: Called with the call number.
+        calls: Number of log calls.
+
+    Returns:
+        Caller us/call, total us/call.
+    """
+    with open(os.devnull, 'w') as sink:
+        create_unified_logger(level, profile, sink)
+
+        with Timer() as total:
+            with Timer() as caller:
+                for idx in range(calls):
+                    log_call(idx)
+
+            logger.remove()
+
+    return caller.elapsed / calls * 1e6, total.elapsed / calls * 1e6
+
+
+# ---------------------------------------------------------
+#
+def main(args: argparse.Namespace):
+    """ Run the benchmarks and print the result.
+
+    Args:
+        args: Namespace object containing command line arguments.
+    """
+    stdlib = logging.getLogger('bench.stdlib')
+    bound = logger.bind(request_id='0b6f8f3e', method='PUT')
+    sampled_log = sampled(100)
+    cases = (
+        ('disabled debug', 'development', 'info',
+         lambda idx: logger.debug('Unit of work ended with {}', 'commit')),
+        ('disabled sampled debug', 'development', 'info',
+         lambda idx: sampled_log.debug('Unit of work ended with {}', 'commit')),
+        ('enabled sampled debug', 'production', 'debug',
+         lambda idx: sampled_log.debug('Unit of work ended with {}', 'commit')),
+        ('development info', 'development', 'info',
+         lambda idx: bound.info('Request {} handled', idx)),
+        ('production info', 'production', 'info',
+         lambda idx: bound.info('Request {} handled', idx)),
+        ('production stdlib', 'production', 'info',
+         lambda idx: stdlib.info('Request %d handled', idx)),
+    )
+    print(f"{args.calls} log calls per case:")
+
+    for name, profile, level, log_call in cases:
+        caller, total = min(measure(profile, level, log_call, args.calls)
+                            for _ in range(args.repeat))
+        print(f"{name:<24} caller: {caller:7.2f} us/call  total: {total:7.2f} us/call")
+
+
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    Form = argparse.ArgumentDefaultsHelpFormatter
+    description = 'Measure the log call cost of the logging profiles.'
+    parser = argparse.ArgumentParser(description=description, formatter_class=Form)
+    parser.add_argument("--calls", type=int, default=50000,
+                        help="Number of log calls per case.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Number of measurements per case (the best is reported).")
+    main(parser.parse_args())
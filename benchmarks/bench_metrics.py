@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+
+Measure the hot-path overhead of the service metrics (see
+``app.core.metrics``):
+
+  - The cost of one counter increment and one histogram observation.
+  - Requests/sec of a trivial route, with and without ``MetricsMiddleware``.
+  - Statements/sec of a small UPDATE, with and without the row counting
+    cursor event.
+
+The variants are measured alternately, and the best of ``--repeat``
+rounds is reported, since the differences are small compared to the
+run-to-run noise.
+
+Run it from the repository root:
+
+    python -m benchmarks.bench_metrics --requests 2000 --statements 2000
+"""
+
+# BUILTIN modules
+import timeit
+import asyncio
+import argparse
+
+# Third party modules
+from fastapi import FastAPI
+from sqlmodel import update
+from httpx import AsyncClient, ASGITransport
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Local modules
+from app.core.config import config
+from app.core.database import create_sqlite_engine
+from app.core.metrics import Counter, Histogram, MetricsMiddleware, instrument_engine
+from app.sms_transfer.models import SmsTransferModel
+from benchmarks.common import create_schema_and_batch, Timer
+
+
+# ---------------------------------------------------------
+#
+def measure_operations() -> tuple:
+    """ Return the nanoseconds per counter increment and histogram observation.
+
+    Returns:
+        Counter ns/op, histogram ns/op.
+    """
+    registry = []
+    counter = Counter('bench_total', 'Benchmark counter.', ('route',), registry=registry)
+    histogram = Histogram('bench_seconds', 'Benchmark histogram.', ('route',),
+                          registry=registry)
+    number = 200000
+    inc = min(timeit.repeat(lambda: counter.inc('/route'), number=number, repeat=5))
+    observe = min(timeit.repeat(lambda: histogram.observe(0.003, '/route'),
+                                number=number, repeat=5))
+    return inc / number * 1e9, observe / number * 1e9
+
+
+# ---------------------------------------------------------
+#
+def create_app(with_metrics: bool) -> FastAPI:
+    """ Return an application with one trivial route.
+
+    Args:
+        with_metrics: Add the metrics middleware when True.
+
+    Returns:
+        The benchmark application.
+    """
+    app = FastAPI()
+
+    @app.get("/items/{item}")
+    async def item_route(item: int):
+        return {'item': item}
+
+    if with_metrics:
+        app.add_middleware(MetricsMiddleware)
+
+    return app
+
+
+# ---------------------------------------------------------
+#
+async def measure_requests(app: FastAPI, requests: int) -> float:
+    """ Return requests/sec for sequential GET requests to the trivial route.
+
+    Args:
+        app: The benchmark application.
+        requests: Number of measured requests.
+
+    Returns:
+        Requests/sec.
+    """
+    async with AsyncClient(transport=ASGITransport(app=app),
+                           base_url="http://localhost") as client:
+        await client.get("/items/1")
+
+        with Timer() as timer:
+            for _ in range(requests):
+                await client.get("/items/1")
+
+    return requests / timer.elapsed
+
+
+# ---------------------------------------------------------
+#
+async def measure_statements(instrumented: bool, statements: int) -> float:
+    """ Return statements/sec for a one row UPDATE in an in-memory DB.
+
+    Args:
+        instrumented: Count the changed rows when True.
+        statements: Number of measured statements.
+
+    Returns:
+        Statements/sec.
+    """
+    engine = create_sqlite_engine('sqlite+aiosqlite:///:memory:', config.sqlite)
+
+    if instrumented:
+        instrument_engine(engine)
+
+    ubid = await create_schema_and_batch(engine, 1)
+    query = (update(SmsTransferModel)
+             .where(SmsTransferModel.UBID == ubid)
+             .values(SMScount=SmsTransferModel.SMScount + 1))
+
+    async with AsyncSession(engine) as session:
+        await session.exec(query)
+
+        with Timer() as timer:
+            for _ in range(statements):
+                await session.exec(query)
+
+        await session.commit()
+
+    await engine.dispose()
+    return statements / timer.elapsed
+
+
+# ---------------------------------------------------------
+#
+async def main(args: argparse.Namespace):
+    """ Run the benchmarks and print the result.
+
+    Args:
+        args: Namespace object containing command line arguments.
+    """
+    inc, observe = measure_operations()
+    print(f"Counter.inc: {inc:.0f} ns/op, Histogram.observe: {observe:.0f} ns/op")
+
+    requests = {False: 0.0, True: 0.0}
+    statements = {False: 0.0, True: 0.0}
+    apps = {variant: create_app(variant) for variant in requests}
+
+    for _ in range(args.repeat):
+        for variant in requests:
+            requests[variant] = max(requests[variant],
+                                    await measure_requests(apps[variant], args.requests))
+            statements[variant] = max(statements[variant],
+                                      await measure_statements(variant, args.statements))
+
+    for name, result, unit in (('requests', requests, 'req/sec'),
+                               ('statements', statements, 'stmt/sec')):
+        overhead = (1 / result[True] - 1 / result[False]) * 1e6
+        print(f"{name:<10} without: {result[False]:8,.0f} {unit}  "
+              f"with: {result[True]:8,.0f} {unit}  overhead: {overhead:.1f} us/op")
+
+
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    Form = argparse.ArgumentDefaultsHelpFormatter
+    description = 'Measure the hot-path overhead of the service metrics.'
+    parser = argparse.ArgumentParser(description=description, formatter_class=Form)
+    parser.add_argument("--requests", type=int, default=2000,
+                        help="Number of measured requests per round.")
+    parser.add_argument("--statements", type=int, default=2000,
+                        help="Number of measured UPDATE statements per round.")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Number of measurement rounds (the best is reported).")
+    asyncio.run(main(parser.parse_args()))
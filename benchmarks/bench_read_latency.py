@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+
+Measure read latency (p50/p99) while bulk upserts run concurrently,
+with reads on the writer engine compared to the read-only engine.
+
+Run it from the repository root:
+
+    python -m benchmarks.bench_read_latency --seconds 5
+"""
+
+# BUILTIN modules
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+
+# The DB location has to be known before the app modules are imported.
+DB_PATH = Path(tempfile.mkdtemp()) / 'read_latency.db'
+os.environ['TRACKING_DB_URL'] = f'sqlite+aiosqlite:///{DB_PATH}'
+
+# Third party modules
+from loguru import logger
+
+# Local modules
+from app.main import startup, shutdown
+from app.core.database import async_engine
+from app.core.unit_of_work import UnitOfWork
+from app.sms_document.models import SmsDocumentPayload
+from app.sms_document.sms_document_crud import SmsDocumentCrud
+from app.sms_transfer.sms_transfer_crud import SmsTransferCrud
+from benchmarks.common import make_documents, create_schema_and_batch, percentile
+
+
+# ---------------------------------------------------------
+#
+async def ingest(ubid: str, sub_batch: int, stop: asyncio.Event) -> int:
+    """ Upsert sub-batches of documents until stopped.
+
+    Args:
+        ubid: Unique Batch ID.
+        sub_batch: Documents per upsert.
+        stop: Stop signal.
+
+    Returns:
+        Number of upserted documents.
+    """
+    done = 0
+
+    while not stop.is_set():
+        documents = make_documents(ubid, done + 1, sub_batch)
+        payload = SmsDocumentPayload(UBID=ubid, documents=documents)
+
+        async with UnitOfWork(SmsDocumentCrud) as crud:
+            done += await crud.create(payload)
+
+    return done
+
+
+# ---------------------------------------------------------
+#
+async def read(ubid: str, read_only: bool, stop: asyncio.Event) -> list:
+    """ Alternate count and read_all queries until stopped.
+
+    Args:
+        ubid: Unique Batch ID.
+        read_only: Use the read-only engine when True.
+        stop: Stop signal.
+
+    Returns:
+        Measured latencies in milliseconds.
+    """
+    latencies = []
+
+    while not stop.is_set():
+        start = time.perf_counter()
+
+        async with UnitOfWork(SmsDocumentCrud, read_only=read_only) as crud:
+            await crud.count(ubid)
+
+        async with UnitOfWork(SmsTransferCrud, read_only=read_only) as crud:
+            await crud.read_all()
+
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return latencies
+
+
+# ---------------------------------------------------------
+#
+async def run(ubid: str, args: argparse.Namespace, read_only: bool) -> tuple:
+    """ Run ingestion and concurrent readers for the specified time.
+
+    Args:
+        ubid: Unique Batch ID.
+        args: Namespace object containing command line arguments.
+        read_only: Use the read-only engine when True.
+
+    Returns:
+        Read latencies and number of ingested documents.
+    """
+    stop = asyncio.Event()
+    writer = asyncio.create_task(ingest(ubid, args.sub_batch, stop))
+    readers = [asyncio.create_task(read(ubid, read_only, stop))
+               for _ in range(args.readers)]
+    await asyncio.sleep(args.seconds)
+    stop.set()
+
+    latencies = [value for result in await asyncio.gather(*readers)
+                 for value in result]
+    return latencies, await writer
+
+
+# ---------------------------------------------------------
+#
+async def main(args: argparse.Namespace):
+    """ Run the benchmark for both engine setups and print the result.
+
+    Args:
+        args: Namespace object containing command line arguments.
+    """
+    logger.remove()
+    await startup()
+    ubid = await create_schema_and_batch(async_engine, args.sub_batch)
+
+    for name, read_only in (('writer engine', False), ('read-only engine', True)):
+        latencies, ingested = await run(ubid, args, read_only)
+        print(f"{name:<17} reads={len(latencies):>6} "
+              f"p50={percentile(latencies, 50):7.2f} ms "
+              f"p99={percentile(latencies, 99):7.2f} ms "
+              f"ingested={ingested / args.seconds:,.0f} rows/sec")
+
+    await shutdown()
+
+
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    Form = argparse.ArgumentDefaultsHelpFormatter
+    description = 'Measure read latency during concurrent bulk upserts.'
+    parser = argparse.ArgumentParser(description=description, formatter_class=Form)
+    parser.add_argument("--seconds", type=float, default=5.0,
+                        help="Duration of each run.")
+    parser.add_argument("--readers", type=int, default=4,
+                        help="Number of concurrent readers.")
+    parser.add_argument("--sub-batch", type=int, default=5000,
+                        help="Documents per upsert.")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+
+Measure requests/sec per route response type, with FastAPI's default
+``JSONResponse`` compared to ``FastJSONResponse`` as the default response
+class, and to ``FastJSONResponse`` returned directly by the route (which
+also skips the ``response_model`` validation).
+
+The routes return prepared objects, so no DB access is measured, only
+the FastAPI request handling and the response serialization.
+
+Run it from the repository root:
+
+    python -m benchmarks.bench_responses --requests 2000 --rows 100
+"""
+
+# BUILTIN modules
+import asyncio
+import argparse
+from typing import List
+from datetime import datetime
+
+# Third party modules
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+
+# Local modules
+from app.core.responses import FastJSONResponse
+from app.sms_document.models import QueryResponse
+from app.sms_transfer.models import SmsTransfer, SmsTransferModel
+from benchmarks.common import Timer
+
+
+# ---------------------------------------------------------
+#
+def create_app(rows: List[SmsTransferModel], result: QueryResponse,
+               variant: str) -> FastAPI:
+    """ Return an application with one list route and one QueryResponse route.
+
+    Args:
+        rows: ORM rows returned by the list route.
+        result: Returned by the QueryResponse route.
+        variant: One of *default*, *default class* or *direct*.
+
+    Returns:
+        The benchmark application.
+    """
+    if variant == 'default':
+        app = FastAPI()
+
+    else:
+        app = FastAPI(default_response_class=FastJSONResponse)
+
+    direct = variant == 'direct'
+
+    @app.get("/transfers/", response_model=List[SmsTransfer])
+    async def transfers():
+        return FastJSONResponse(rows) if direct else rows
+
+    @app.get("/query/", response_model=QueryResponse)
+    async def query():
+        return FastJSONResponse(result) if direct else result
+
+    return app
+
+
+# ---------------------------------------------------------
+#
+async def measure(app: FastAPI, url: str, requests: int) -> float:
+    """ Return requests/sec for sequential GET requests to the specified route.
+
+    Args:
+        app: The benchmark application.
+        url: Route URL.
+        requests: Number of measured requests.
+
+    Returns:
+        Requests/sec.
+    """
+    async with AsyncClient(transport=ASGITransport(app=app),
+                           base_url="http://localhost") as client:
+        await client.get(url)
+
+        with Timer() as timer:
+            for _ in range(requests):
+                await client.get(url)
+
+    return requests / timer.elapsed
+
+
+# ---------------------------------------------------------
+#
+async def main(args: argparse.Namespace):
+    """ Run the benchmark for all variants and print the result.
+
+    Args:
+        args: Namespace object containing command line arguments.
+    """
+    rows = [SmsTransferModel(UBID=f'{idx:036}', fileName=f'{idx:036}.zip',
+                             origName='benchmark.xml', documents=1000,
+                             SMScount=1000, when=datetime.now())
+            for idx in range(args.rows)]
+    result = QueryResponse(result="Found 3 document(s) for UBID '2a168739-b204-"
+                                  "4abf-aec1-a88069e3cd08' in table tracking.sms_documents")
+    print(f"{args.requests} requests per route, {args.rows} rows in /transfers/:")
+
+    for variant in ('default', 'default class', 'direct'):
+        app = create_app(rows, result, variant)
+        line = [f"{variant:<14}"]
+
+        for url in ('/transfers/', '/query/'):
+            line.append(f"{url} {await measure(app, url, args.requests):8,.0f} req/sec")
+
+        print('  '.join(line))
+
+
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    Form = argparse.ArgumentDefaultsHelpFormatter
+    description = 'Measure requests/sec per response serialization variant.'
+    parser = argparse.ArgumentParser(description=description, formatter_class=Form)
+    parser.add_argument("--requests", type=int, default=2000,
+                        help="Number of measured requests per route.")
+    parser.add_argument("--rows", type=int, default=100,
+                        help="Number of SMS transfer rows in the list response.")
+    asyncio.run(main(parser.parse_args()))
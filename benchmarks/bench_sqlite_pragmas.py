@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+
+Measure bulk upsert throughput (rows/sec) with the SQLite default
+settings compared to the configured pragma profile.
+
+Run it from the repository root:
+
+    python -m benchmarks.bench_sqlite_pragmas --documents 50000
+"""
+
+# BUILTIN modules
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+
+# Third party modules
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Local modules
+from app.core.config import config, SqlitePragmas, SQLITE_DEFAULTS
+from app.core.database import create_sqlite_engine
+from app.sms_document.models import SmsDocumentPayload
+from app.sms_document.sms_document_crud import SmsDocumentCrud
+from benchmarks.common import (sqlite_url, make_documents, iter_chunks,
+                               create_schema_and_batch, Timer)
+
+
+# ---------------------------------------------------------
+#
+async def upsert_rows_per_sec(path: Path, pragmas: SqlitePragmas,
+                              documents: int, sub_batch: int) -> float:
+    """ Upsert all documents in sub-batches, one commit per sub-batch.
+
+    Args:
+        path: DB file path.
+        pragmas: Used SQLite tuning profile.
+        documents: Total number of documents.
+        sub_batch: Documents per transaction (like one API request).
+
+    Returns:
+        Measured rows/sec.
+    """
+    engine = create_sqlite_engine(sqlite_url(path), pragmas)
+    ubid = await create_schema_and_batch(engine, documents)
+    payloads = [SmsDocumentPayload(UBID=ubid, documents=make_documents(ubid, start, count))
+                for start, count in iter_chunks(documents, sub_batch)]
+
+    with Timer() as timer:
+        for payload in payloads:
+            async with AsyncSession(engine, expire_on_commit=False) as session:
+                await SmsDocumentCrud(session).create(payload)
+                await session.commit()
+
+    await engine.dispose()
+    return documents / timer.elapsed
+
+
+# ---------------------------------------------------------
+#
+async def main(args: argparse.Namespace):
+    """ Run the benchmark for both profiles and print the result.
+
+    Args:
+        args: Namespace object containing command line arguments.
+    """
+    profiles = {'sqlite defaults': SQLITE_DEFAULTS, 'config.sqlite': config.sqlite}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+
+        for idx, (name, pragmas) in enumerate(profiles.items()):
+            path = Path(tmp) / f'pragmas_{idx}.db'
+            results[name] = await upsert_rows_per_sec(
+                path, pragmas, args.documents, args.sub_batch)
+
+    base = results['sqlite defaults']
+    print(f"{args.documents} documents in sub-batches of {args.sub_batch}:")
+
+    for name, rate in results.items():
+        print(f"  {name:<16} {rate:>10,.0f} rows/sec  ({rate / base:.2f}x)")
+
+
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    Form = argparse.ArgumentDefaultsHelpFormatter
+    description = 'Compare upsert throughput with and without the SQLite pragma profile.'
+    parser = argparse.ArgumentParser(description=description, formatter_class=Form)
+    parser.add_argument("--documents", type=int, default=50000,
+                        help="Total number of documents to upsert.")
+    parser.add_argument("--sub-batch", type=int, default=1000,
+                        help="Documents per transaction.")
+    asyncio.run(main(parser.parse_args()))
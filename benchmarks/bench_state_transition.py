@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+
+Measure statement count and latency (p50/p99) of one SMS transfer state
+transition, with the previous read + update + refresh sequence compared
+to the single ``UPDATE ... RETURNING`` in ``SmsTransferCrud.update_state``.
+
+Run it from the repository root:
+
+    python -m benchmarks.bench_state_transition --transitions 2000
+"""
+
+# BUILTIN modules
+import time
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+from itertools import cycle
+
+# Third party modules
+from sqlalchemy import event
+from sqlmodel import select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Local modules
+from app.core.config import config
+from app.core.database import create_sqlite_engine
+from app.sms_transfer.sms_transfer_crud import SmsTransferCrud
+from app.sms_transfer.models import SmsTransferModel, SmsTransferState
+from benchmarks.common import sqlite_url, create_schema_and_batch, percentile
+
+
+# ---------------------------------------------------------
+#
+async def read_update_refresh(crud: SmsTransferCrud, ubid: str,
+                              state: SmsTransferState) -> SmsTransferModel:
+    """ The transition as it was done before, in three DB round trips.
+
+    Args:
+        crud: Active CRUD object.
+        ubid: Batch search key.
+        state: Update value.
+
+    Returns:
+        Refreshed SMS transfer row.
+    """
+    query = select(SmsTransferModel).where(SmsTransferModel.UBID == ubid)
+    response = (await crud.session.exec(query)).one_or_none()
+    await crud.session.exec(update(SmsTransferModel)
+                            .where(SmsTransferModel.UBID == ubid)
+                            .values({'state': state}))
+    await crud.session.refresh(response)
+    return response
+
+
+# ---------------------------------------------------------
+#
+async def update_returning(crud: SmsTransferCrud, ubid: str,
+                           state: SmsTransferState) -> SmsTransferModel:
+    """ The transition as it's done now, in one DB round trip.
+
+    Args:
+        crud: Active CRUD object.
+        ubid: Batch search key.
+        state: Update value.
+
+    Returns:
+        Updated SMS transfer row.
+    """
+    return await crud.update_state(ubid, state)
+
+
+# ---------------------------------------------------------
+#
+async def main(args: argparse.Namespace):
+    """ Run the benchmark for both transition variants and print the result.
+
+    Args:
+        args: Namespace object containing command line arguments.
+    """
+    path = Path(tempfile.mkdtemp()) / 'state_transition.db'
+    engine = create_sqlite_engine(sqlite_url(path), config.sqlite)
+    ubid = await create_schema_and_batch(engine, 1)
+    statements = 0
+
+    # ---------------------------------
+
+    def count(*_):
+        """ Count every statement sent to SQLite. """
+        nonlocal statements
+        statements += 1
+
+    # ---------------------------------
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', count)
+
+    for name, transition in (('read+update+refresh', read_update_refresh),
+                             ('update returning', update_returning)):
+        latencies, statements = [], 0
+        states = cycle(SmsTransferState)
+
+        for _ in range(args.transitions):
+            start = time.perf_counter()
+
+            async with AsyncSession(engine, expire_on_commit=False) as session:
+                response = await transition(SmsTransferCrud(session),
+                                            ubid, next(states))
+                await session.commit()
+
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert response is not None
+
+        print(f"{name:<20} statements/transition={statements / args.transitions:.1f} "
+              f"p50={percentile(latencies, 50):6.3f} ms "
+              f"p99={percentile(latencies, 99):6.3f} ms")
+
+    await engine.dispose()
+
+
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    Form = argparse.ArgumentDefaultsHelpFormatter
+    description = 'Measure statement count and latency of a state transition.'
+    parser = argparse.ArgumentParser(description=description, formatter_class=Form)
+    parser.add_argument("--transitions", type=int, default=2000,
+                        help="Number of measured transitions per variant.")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+
+Find the UPSERT chunk size that gives the best rows/sec for
+``SmsDocumentCrud.create`` (see ``UPSERT_CHUNK_SIZE``).
+
+For every chunk size, the same payload is upserted twice in a file DB,
+first as new rows (INSERT) and then as existing rows (the UPDATE path).
+
+Run it from the repository root:
+
+    python -m benchmarks.bench_upsert_chunks --documents 20000
+"""
+
+# BUILTIN modules
+import asyncio
+import statistics
+import argparse
+import tempfile
+from pathlib import Path
+
+# Third party modules
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Local modules
+from app.core.config import config
+from app.core.database import create_sqlite_engine
+from app.sms_document.models import SmsDocumentPayload
+from app.sms_document.sms_document_crud import SmsDocumentCrud, UPSERT_CHUNK_SIZE
+from benchmarks.common import sqlite_url, make_documents, create_schema_and_batch, Timer
+
+CHUNK_SIZES = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 20000)
+""" Benchmarked chunk sizes (documents per executemany call). """
+
+
+# ---------------------------------------------------------
+#
+async def measure(path: Path, documents: int, chunk_size: int, repeat: int) -> tuple:
+    """ Return median insert and update rows/sec for the specified chunk size.
+
+    Args:
+        path: DB file path.
+        documents: Number of documents in the payload.
+        chunk_size: Documents per executemany call.
+        repeat: Number of measurements (a new batch every time).
+
+    Returns:
+        Insert rows/sec, update rows/sec.
+    """
+    inserts, updates = [], []
+    engine = create_sqlite_engine(sqlite_url(path), config.sqlite)
+
+    for _ in range(repeat):
+        ubid = await create_schema_and_batch(engine, documents)
+        items = make_documents(ubid, 1, documents)
+
+        for rates in (inserts, updates):
+            payload = SmsDocumentPayload(UBID=ubid, documents=items)
+
+            with Timer() as timer:
+                async with AsyncSession(engine, expire_on_commit=False) as session:
+                    await SmsDocumentCrud(session).create(payload, chunk_size)
+                    await session.commit()
+
+            rates.append(documents / timer.elapsed)
+
+    await engine.dispose()
+    return statistics.median(inserts), statistics.median(updates)
+
+
+# ---------------------------------------------------------
+#
+async def main(args: argparse.Namespace):
+    """ Run the benchmark for all chunk sizes and print the result.
+
+    Args:
+        args: Namespace object containing command line arguments.
+    """
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for chunk_size in CHUNK_SIZES:
+            path = Path(tmp) / f'chunk_{chunk_size}.db'
+            results[chunk_size] = await measure(path, args.documents,
+                                                chunk_size, args.repeat)
+
+    print(f"{args.documents} documents per payload "
+          f"(current UPSERT_CHUNK_SIZE={UPSERT_CHUNK_SIZE}):")
+
+    for chunk_size, (insert, update) in results.items():
+        print(f"  chunk {chunk_size:>5}: insert {insert:>9,.0f} rows/sec, "
+              f"update {update:>9,.0f} rows/sec")
+
+    best = max(results, key=lambda size: sum(results[size]))
+    print(f"Best chunk size: {best}")
+
+
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    Form = argparse.ArgumentDefaultsHelpFormatter
+    description = 'Find the optimal UPSERT chunk size for bulk document inserts.'
+    parser = argparse.ArgumentParser(description=description, formatter_class=Form)
+    parser.add_argument("--documents", type=int, default=20000,
+                        help="Number of documents in the payload.")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Measurements per chunk size (the median is used).")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+
+Load test of the service with 1 and N worker processes (see ``run.py``),
+with mixed read and write traffic against the same SQLite DB file:
+
+  - *read*: Count the documents of a batch.
+  - *write*: Upsert a few documents of a batch (a WAL write transaction
+    that competes with the other worker processes).
+
+The service is started as a separate program, with the production log
+profile, for every worker count. The load is generated by several client
+processes, so that the client isn't the bottleneck. Failed requests (like
+a *database is locked* error) are counted as errors.
+
+Note that more workers than CPU cores only adds contention.
+
+Run it from the repository root:
+
+    python -m benchmarks.bench_workers --workers 1 4 --duration 20
+"""
+
+# BUILTIN modules
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from pathlib import Path
+from uuid import uuid4
+from typing import Dict, List
+
+# Third party modules
+import httpx
+
+# Local modules
+from benchmarks.common import sqlite_url, make_documents, percentile
+
+# Constants
+ROOT = Path(__file__).parent.parent
+""" Repository root, where run.py is. """
+BATCHES = 20
+""" Number of SMS transfer batches that the traffic is spread over. """
+DOCUMENTS = 1000
+""" Number of documents per batch. """
+WRITE_DOCUMENTS = 10
+""" Number of upserted documents per write request. """
+
+
+# ---------------------------------------------------------
+#
+def start_service(workers: int, port: int, db_path: Path) -> subprocess.Popen:
+    """ Start the service program with the specified number of workers.
+
+    Args:
+        workers: Number of server processes.
+        port: Server port.
+        db_path: DB file path.
+
+    Returns:
+        The service program process.
+    """
+    env = dict(os.environ, TRACKING_WORKERS=str(workers), TRACKING_PORT=str(port),
+               TRACKING_DB_URL=sqlite_url(db_path), TRACKING_LOG_PROFILE='production')
+    return subprocess.Popen([sys.executable, str(ROOT / 'run.py')], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+# ---------------------------------------------------------
+#
+async def wait_until_ready(base_url: str, timeout: float = 60.0):
+    """ Wait until the service responds.
+
+    Args:
+        base_url: Service base URL.
+        timeout: Max seconds to wait.
+
+    Raises:
+        RuntimeError: When the service didn't start in time.
+    """
+    deadline = time.monotonic() + timeout
+
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get('/metrics')).status_code == 200:
+                    return
+
+            except httpx.TransportError:
+                pass
+
+            await asyncio.sleep(0.2)
+
+    raise RuntimeError(f'The service at {base_url} did not start in {timeout} sec')
+
+
+# ---------------------------------------------------------
+#
+async def populate(base_url: str) -> List[str]:
+    """ Create the batches and their documents through the API.
+
+    Args:
+        base_url: Service base URL.
+
+    Returns:
+        Created batch UBIDs.
+    """
+    ubids = [str(uuid4()) for _ in range(BATCHES)]
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        for ubid in ubids:
+            transfer = {'UBID': ubid, 'SMScount': DOCUMENTS, 'documents': DOCUMENTS,
+                        'fileName': f'{ubid}.zip', 'origName': 'benchmark.xml'}
+            (await client.post('/sms_transfers/', json=transfer)).raise_for_status()
+            documents = {'UBID': ubid, 'documents': make_documents(ubid, 1, DOCUMENTS)}
+            (await client.post('/sms_documents/', json=documents)).raise_for_status()
+
+    return ubids
+
+
+# ---------------------------------------------------------
+#
+async def generate_load(base_url: str, ubids: List[str], concurrency: int,
+                        duration: float, write_ratio: float, seed: int) -> Dict[str, list]:
+    """ Send mixed read and write requests until the duration has passed.
+
+    Args:
+        base_url: Service base URL.
+        ubids: Batch UBIDs.
+        concurrency: Number of concurrent requests.
+        duration: Seconds to generate load.
+        write_ratio: Share of write requests (0-1).
+        seed: Random seed.
+
+    Returns:
+        Read and write latencies in seconds, and the error count.
+    """
+    rnd = random.Random(seed)
+    result = {'read': [], 'write': [], 'errors': [0]}
+    limits = httpx.Limits(max_connections=concurrency,
+                          max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        deadline = time.monotonic() + duration
+
+        async def user():
+            """ Send one request at a time until the deadline. """
+            while time.monotonic() < deadline:
+                ubid = rnd.choice(ubids)
+
+                if rnd.random() < write_ratio:
+                    kind = 'write'
+                    start = rnd.randint(1, DOCUMENTS - WRITE_DOCUMENTS)
+                    body = {'UBID': ubid,
+                            'documents': make_documents(ubid, start, WRITE_DOCUMENTS)}
+                    request = client.post('/sms_documents/', json=body)
+
+                else:
+                    kind = 'read'
+                    request = client.get(f'/sms_documents/{ubid}/')
+
+                begin = time.perf_counter()
+
+                try:
+                    response = await request
+                    ok = response.status_code < 300
+
+                except httpx.HTTPError:
+                    ok = False
+
+                if ok:
+                    result[kind].append(time.perf_counter() - begin)
+
+                else:
+                    result['errors'][0] += 1
+
+        await asyncio.gather(*[user() for _ in range(concurrency)])
+
+    return result
+
+
+# ---------------------------------------------------------
+#
+def client_process(options: tuple) -> Dict[str, list]:
+    """ Run one load generating client process.
+
+    Args:
+        options: Arguments of ``generate_load``.
+
+    Returns:
+        Read and write latencies in seconds, and the error count.
+    """
+    return asyncio.run(generate_load(*options))
+
+
+# ---------------------------------------------------------
+#
+def run_load_test(workers: int, args: argparse.Namespace) -> dict:
+    """ Return the throughput and latencies of the service with the specified workers.
+
+    Args:
+        workers: Number of server processes.
+        args: Namespace object containing command line arguments.
+
+    Returns:
+        Load test result.
+    """
+    base_url = f'http://127.0.0.1:{args.port}/tracking'
+
+    with tempfile.TemporaryDirectory() as tmp:
+        service = start_service(workers, args.port, Path(tmp) / 'tracking.db')
+
+        try:
+            asyncio.run(wait_until_ready(base_url))
+            ubids = asyncio.run(populate(base_url))
+            options = [(base_url, ubids, args.concurrency // args.clients,
+                        args.duration, args.write_ratio, seed)
+                       for seed in range(args.clients)]
+
+            with multiprocessing.Pool(args.clients) as pool:
+                results = pool.map(client_process, options)
+
+        finally:
+            service.terminate()
+            service.wait(timeout=30)
+
+    reads = sorted(item for result in results for item in result['read'])
+    writes = sorted(item for result in results for item in result['write'])
+    return {'requests_sec': (len(reads) + len(writes)) / args.duration,
+            'read_p50_ms': percentile(reads, 50) * 1000,
+            'read_p99_ms': percentile(reads, 99) * 1000,
+            'write_p50_ms': percentile(writes, 50) * 1000,
+            'write_p99_ms': percentile(writes, 99) * 1000,
+            'errors': sum(result['errors'][0] for result in results)}
+
+
+# ---------------------------------------------------------
+#
+def main(args: argparse.Namespace):
+    """ Run the load test for every worker count and print the result.
+
+    Args:
+        args: Namespace object containing command line arguments.
+    """
+    print(f"{os.cpu_count()} CPU core(s), {args.concurrency} concurrent requests, "
+          f"{args.write_ratio:.0%} writes, {args.duration} sec per run:")
+
+    for workers in args.workers:
+        result = run_load_test(workers, args)
+        print(f"workers: {workers:2}  {result['requests_sec']:7,.0f} req/sec  "
+              f"read p50/p99: {result['read_p50_ms']:6.1f}/{result['read_p99_ms']:6.1f} ms  "
+              f"write p50/p99: {result['write_p50_ms']:6.1f}/{result['write_p99_ms']:6.1f} ms  "
+              f"errors: {result['errors']}")
+
+
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    Form = argparse.ArgumentDefaultsHelpFormatter
+    description = 'Load test the service with 1 and N worker processes.'
+    parser = argparse.ArgumentParser(description=description, formatter_class=Form)
+    parser.add_argument("--workers", type=int, nargs='+', default=[1, os.cpu_count()],
+                        help="Worker counts to compare.")
+    parser.add_argument("--duration", type=float, default=20,
+                        help="Seconds of load per worker count.")
+    parser.add_argument("--concurrency", type=int, default=32,
+                        help="Total number of concurrent requests.")
+    parser.add_argument("--clients", type=int, default=4,
+                        help="Number of load generating client processes.")
+    parser.add_argument("--write-ratio", type=float, default=0.2,
+                        help="Share of write requests (0-1).")
+    parser.add_argument("--port", type=int, default=7010,
+                        help="Service port during the test.")
+    main(parser.parse_args())
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+"""
+
+# BUILTIN modules
+import time
+import statistics
+from pathlib import Path
+from uuid import uuid4
+from typing import List, Iterator
+
+# Third party modules
+from sqlmodel import SQLModel
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Local modules
+from app.sms_transfer.models import SmsTransferPayload
+from app.sms_transfer.sms_transfer_crud import SmsTransferCrud
+
+
+# ---------------------------------------------------------
+#
+def sqlite_url(path: Path) -> str:
+    """ Return an aiosqlite connection URL for the specified DB file.
+
+    Args:
+        path: DB file path.
+
+    Returns:
+        DB connection URL.
+    """
+    return f'sqlite+aiosqlite:///{path}'
+
+
+# ---------------------------------------------------------
+#
+def make_documents(ubid: str, start: int, count: int) -> List[dict]:
+    """ Return SMS documents in the same format as insert_bigger_batch.py.
+
+    Args:
+        ubid: Unique Batch ID.
+        start: First document number.
+        count: Number of documents.
+
+    Returns:
+        SMS document payload items.
+    """
+    documents = []
+
+    for docid in range(start, start + count):
+        key = f'{docid:010}'
+        documents.append({
+            "SMScount": 1,
+            "uniqueId": key,
+            "data": {
+                "source": "DentalCare",
+                "refId": f"{ubid}.{key}",
+                "destination": f"+01708{key}",
+                "userData": "Welcome to your..."}})
+
+    return documents
+
+
+# ---------------------------------------------------------
+#
+def iter_chunks(total: int, size: int) -> Iterator[tuple]:
+    """ Yield (start, count) pairs that split total into chunks of size.
+
+    Args:
+        total: Total number of items.
+        size: Chunk size.
+    """
+    for start in range(0, total, size):
+        yield start + 1, min(size, total - start)
+
+
+# ---------------------------------------------------------
+#
+async def create_schema_and_batch(engine: AsyncEngine, batch_size: int) -> str:
+    """ Create all tables and one SMS transfer batch.
+
+    Args:
+        engine: Used DB engine.
+        batch_size: Number of documents in the batch.
+
+    Returns:
+        Created batch transfer UBID.
+    """
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    ubid = str(uuid4())
+    payload = SmsTransferPayload(UBID=ubid, SMScount=batch_size,
+                                 documents=batch_size, fileName=f'{ubid}.zip',
+                                 origName="benchmark.xml")
+
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        await SmsTransferCrud(session).create(payload)
+        await session.commit()
+
+    return ubid
+
+
+# ---------------------------------------------------------
+#
+def percentile(samples: List[float], pct: float) -> float:
+    """ Return the specified percentile of the samples.
+
+    Args:
+        samples: Measured values.
+        pct: Wanted percentile (0-100).
+
+    Returns:
+        The percentile value.
+    """
+    if len(samples) < 2:
+        return samples[0] if samples else 0.0
+
+    return statistics.quantiles(samples, n=100, method='inclusive')[round(pct) - 1]
+
+
+# -----------------------------------------------------------------------------
+#
+class Timer:
+    """ A minimal wall-clock timer context manager.
+
+    Attributes:
+        elapsed: Elapsed seconds after the context has exited.
+    """
+
+    def __init__(self):
+        """ The class constructor. """
+        self.elapsed = 0.0
+        self._start = 0.0
+
+    def __enter__(self) -> "Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.elapsed = time.perf_counter() - self._start
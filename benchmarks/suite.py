@@ -0,0 +1,523 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+
+A benchmark suite for the CRUD and route hot paths, with regression gates.
+
+Measured for both an in-memory and a file-backed SQLite DB:
+
+  - ``create.<n>``: ``SmsDocumentCrud.create`` throughput (docs/sec) for
+    payloads with 1, 100, 1000 and 5000 documents.
+  - ``count.<rows>``, ``update_state.<rows>``: ``SmsDocumentCrud`` latency
+    (ms) for a batch with 10k, 100k and 1M documents.
+  - ``read_all.<rows>``: ``SmsTransferCrud.read_all`` latency (ms) with
+    10k, 100k and 1M transfer rows.
+  - ``asgi.*``: full request latency (ms) through ``httpx.ASGITransport``
+    and the application, including the route, the response
+    serialization and the DB access.
+
+Every metric is the median of the repeated measurements, together with
+its spread (the interquartile range relative to the median). The result
+is compared with the stored baseline, and the suite exits with status 1
+when a metric is worse than the baseline median by more than its
+tolerance: the threshold plus twice the baseline spread of the metric.
+Noisy metrics are given more room that way, without loosening the gate
+for the stable ones.
+
+The repeats of one run are measured back to back, so they share the
+state of the host, and a run to run difference can be much bigger than
+their spread. Save the baseline from several runs (``--runs``), their
+samples are pooled, so that the spread includes that difference too.
+
+A busy (or throttled) host makes every metric slower at the same time.
+A calibration workload, that only uses the standard library
+(``sqlite3`` and ``json``), is measured before and after every backend,
+and when it's slower than the baseline calibration, the baseline is
+scaled with that slowdown before it's compared. A faster calibration
+doesn't tighten the gate, since the calibration is noisy as well. Note
+that the baseline is still only comparable on the machine (and with the
+settings) where it was saved.
+
+Run it from the repository root:
+
+    python -m benchmarks.suite --rows 10000 100000   # compare with the baseline
+    python -m benchmarks.suite --save --runs 3       # save a new baseline
+"""
+
+# BUILTIN modules
+import os
+import sys
+import json
+import asyncio
+import sqlite3
+import argparse
+import platform
+import tempfile
+import statistics
+from pathlib import Path
+from typing import Callable, Dict, List
+
+# Third party modules
+from loguru import logger
+from sqlalchemy import StaticPool
+from sqlmodel import insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+from httpx import AsyncClient, ASGITransport
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Local modules
+from app.main import app
+from app.core.config import config
+from app.core.database import create_sqlite_engine
+from app.sms_transfer.models import SmsTransferModel
+from app.sms_document.models import SmsDocumentPayload, SmsDocumentState
+from app.core.unit_of_work import write_session_maker, read_session_maker
+from app.sms_transfer.sms_transfer_crud import SmsTransferCrud
+from app.sms_document.sms_document_crud import SmsDocumentCrud
+from benchmarks.common import (sqlite_url, make_documents, iter_chunks,
+                               create_schema_and_batch, percentile, Timer)
+
+# Remove all loggers, the request log lines would drown the result.
+logger.remove()
+
+# Constants
+BASELINE = Path(__file__).parent / 'baseline.json'
+""" Default baseline results file. """
+PAYLOAD_SIZES = (1, 100, 1000, 5000)
+""" Documents per create payload. """
+ROW_COUNTS = (10000, 100000, 1000000)
+""" Table sizes for the count, update_state and read_all metrics. """
+LOAD_CHUNK = 5000
+""" Rows per statement when the tables are populated. """
+HIGHER_IS_BETTER = {'docs/sec'}
+""" Units where a higher value is better, a lower value is better for all others. """
+SPREAD_FACTOR = 2
+""" Baseline spreads that are added to the threshold of a metric. """
+CALIBRATION_ROWS = 20000
+""" Rows of the calibration workload. """
+
+
+# ---------------------------------------------------------
+#
+def summary(samples: List[float], unit: str) -> dict:
+    """ Return the metric of the measured samples.
+
+    The median (and not the best) sample is used, since the best sample
+    of a few repeats is decided by luck as much as by the code, which
+    makes the gate flap.
+
+    Args:
+        samples: Measured values.
+        unit: Metric unit.
+
+    Returns:
+        Metric with the median value and its relative spread.
+    """
+    median = statistics.median(samples)
+    spread = (percentile(samples, 75) - percentile(samples, 25)) / median
+    return {'value': median, 'unit': unit, 'spread': spread}
+
+
+# ---------------------------------------------------------
+#
+async def sample_ms(operation: Callable, repeat: int) -> dict:
+    """ Return the latency samples of the operation.
+
+    Args:
+        operation: Async function without parameters.
+        repeat: Number of measurements.
+
+    Returns:
+        Elapsed milliseconds of every measurement.
+    """
+    samples = []
+
+    for _ in range(repeat):
+        with Timer() as timer:
+            await operation()
+
+        samples.append(timer.elapsed * 1000)
+
+    return {'samples': samples, 'unit': 'ms'}
+
+
+# ---------------------------------------------------------
+#
+def calibrate(repeat: int) -> List[float]:
+    """ Return the latency samples of the calibration workload.
+
+    The workload inserts, aggregates and JSON encodes rows in an
+    in-memory SQLite DB, without any application code, so it measures
+    the speed of the host and not of the code under test.
+
+    Args:
+        repeat: Number of measurements.
+
+    Returns:
+        Elapsed milliseconds of every measurement.
+    """
+    rows = [(idx, f'{idx:010}', 'Welcome to your...') for idx in range(CALIBRATION_ROWS)]
+    samples = []
+
+    for _ in range(repeat):
+        with Timer() as timer:
+            with sqlite3.connect(':memory:') as conn:
+                conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, key TEXT, data TEXT)')
+                conn.executemany('INSERT INTO t VALUES (?, ?, ?)', rows)
+                conn.execute('SELECT count(*), max(key) FROM t GROUP BY data').fetchall()
+                json.dumps(conn.execute('SELECT * FROM t').fetchall())
+
+            conn.close()
+
+        samples.append(timer.elapsed * 1000)
+
+    return samples
+
+
+# ---------------------------------------------------------
+#
+async def bench_create(engine: AsyncEngine, ubid: str, repeat: int) -> Dict[str, dict]:
+    """ Return the create throughput samples per payload size.
+
+    Every payload contains new documents, so it's always an INSERT.
+
+    Args:
+        engine: Used DB engine.
+        ubid: Batch UBID for the created documents.
+        repeat: Measurements per payload size.
+
+    Returns:
+        Metric samples.
+    """
+    metrics, start = {}, 1
+
+    for size in PAYLOAD_SIZES:
+        samples = []
+
+        for _ in range(repeat):
+            payload = SmsDocumentPayload(UBID=ubid,
+                                         documents=make_documents(ubid, start, size))
+            start += size
+
+            with Timer() as timer:
+                async with AsyncSession(engine, expire_on_commit=False) as session:
+                    await SmsDocumentCrud(session).create(payload)
+                    await session.commit()
+
+            samples.append(size / timer.elapsed)
+
+        metrics[f'create.{size}'] = {'samples': samples, 'unit': 'docs/sec'}
+
+    return metrics
+
+
+# ---------------------------------------------------------
+#
+async def populate(engine: AsyncEngine, ubid: str, have: int, want: int):
+    """ Add documents to the batch, and transfer rows, up to the wanted number.
+
+    Args:
+        engine: Used DB engine.
+        ubid: Batch UBID for the added documents.
+        have: Current number of documents and extra transfer rows.
+        want: Wanted number of documents and extra transfer rows.
+    """
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        crud = SmsDocumentCrud(session)
+
+        for start, count in iter_chunks(want - have, LOAD_CHUNK):
+            first = have + start
+            await crud.upsert_rows(make_documents(ubid, first, count), LOAD_CHUNK, ubid)
+            await session.exec(insert(SmsTransferModel), params=[
+                {'UBID': f'{idx:036}', 'SMScount': 1, 'documents': 1,
+                 'fileName': f'{idx:036}.zip', 'origName': 'benchmark.xml'}
+                for idx in range(first, first + count)])
+
+        await session.commit()
+
+
+# ---------------------------------------------------------
+#
+async def bench_rows(engine: AsyncEngine, rows: int, ubid: str, repeat: int) -> Dict[str, dict]:
+    """ Return the count, update_state and read_all latency samples at the table size.
+
+    Args:
+        engine: Used DB engine.
+        rows: Number of documents in the batch, and transfer rows.
+        ubid: Batch UBID with the documents.
+        repeat: Measurements per metric.
+
+    Returns:
+        Metric samples.
+    """
+    states = iter([SmsDocumentState.SENT, SmsDocumentState.DONE] * repeat)
+
+    # ---------------------------------
+
+    async def count():
+        """ Count the documents in the batch. """
+        async with AsyncSession(engine) as session:
+            await SmsDocumentCrud(session).count(ubid)
+
+    async def update_state():
+        """ Update the state of all documents in the batch. """
+        async with AsyncSession(engine) as session:
+            await SmsDocumentCrud(session).update_state(ubid, next(states))
+            await session.commit()
+
+    async def read_all():
+        """ Read all transfer rows. """
+        async with AsyncSession(engine) as session:
+            await SmsTransferCrud(session).read_all()
+
+    # ---------------------------------
+
+    return {f'{operation.__name__}.{rows}': await sample_ms(operation, repeat)
+            for operation in (count, update_state, read_all)}
+
+
+# ---------------------------------------------------------
+#
+async def bench_asgi(engine: AsyncEngine, ubid: str, repeat: int) -> Dict[str, dict]:
+    """ Return the full request latency samples through the application.
+
+    The application session factories are bound to the benchmark
+    engine while the requests are sent.
+
+    Args:
+        engine: Used DB engine.
+        ubid: Batch UBID for the created documents.
+        repeat: Measurements per metric.
+
+    Returns:
+        Metric samples.
+    """
+    starts = iter(range(10**7, 10**8, 1000))
+    write_session_maker.configure(bind=engine)
+    read_session_maker.configure(bind=engine)
+
+    async with AsyncClient(transport=ASGITransport(app=app),
+                           base_url="http://localhost/tracking") as client:
+
+        # ---------------------------------
+
+        async def create_1000():
+            """ Create 1000 new documents. """
+            payload = {'UBID': ubid, 'documents': make_documents(ubid, next(starts), 1000)}
+            response = await client.post('/sms_documents/', json=payload)
+            assert response.status_code == 201, response.text
+
+        async def count():
+            """ Count the batch documents. """
+            response = await client.get(f'/sms_documents/{ubid}/')
+            assert response.status_code == 200, response.text
+
+        async def stats():
+            """ Read the batch document counters. """
+            response = await client.get(f'/sms_documents/{ubid}/stats/')
+            assert response.status_code == 200, response.text
+
+        async def read_page():
+            """ Read the first page of transfers. """
+            response = await client.get('/sms_transfers/?limit=100')
+            assert response.status_code == 200, response.text
+
+        # ---------------------------------
+
+        return {f'asgi.{operation.__name__}': await sample_ms(operation, repeat)
+                for operation in (create_1000, count, stats, read_page)}
+
+
+# ---------------------------------------------------------
+#
+async def run_backend(backend: str, args: argparse.Namespace) -> Dict[str, dict]:
+    """ Return the samples of all metrics for one DB backend.
+
+    Every call uses a new DB.
+
+    Args:
+        backend: *memory* or *file*.
+        args: Namespace object containing command line arguments.
+
+    Returns:
+        Metric samples.
+    """
+    if backend == 'memory':
+        engine = create_sqlite_engine('sqlite+aiosqlite:///:memory:',
+                                      config.sqlite, poolclass=StaticPool)
+
+    else:
+        path = Path(tempfile.mkdtemp()) / 'suite.db'
+        engine = create_sqlite_engine(sqlite_url(path), config.sqlite)
+
+    create_ubid = await create_schema_and_batch(engine, 1)
+    rows_ubid = await create_schema_and_batch(engine, 1)
+    metrics = await bench_create(engine, create_ubid, args.repeat)
+    have = 0
+
+    for rows in args.rows:
+        await populate(engine, rows_ubid, have, rows)
+        metrics |= await bench_rows(engine, rows, rows_ubid, args.repeat)
+        have = rows
+
+    metrics |= await bench_asgi(engine, create_ubid, args.repeat)
+    await engine.dispose()
+    return metrics
+
+
+# ---------------------------------------------------------
+#
+def regressions(results: dict, baseline: dict, threshold: float,
+                noise_ms: float, slowdown: float = 1.0) -> List[str]:
+    """ Return a description of every metric that is worse than the baseline.
+
+    Metrics that are missing in the baseline are not compared. The
+    tolerance of a metric is the threshold plus ``SPREAD_FACTOR`` times
+    its baseline spread. A latency metric also has to be worse by more
+    than ``noise_ms``, since a few milliseconds of scheduling jitter is a
+    big relative change for the fastest operations.
+
+    The baseline values are first scaled with the host slowdown, a
+    latency is multiplied and a throughput is divided by it.
+
+    Args:
+        results: Measured metrics per backend.
+        baseline: Baseline metrics per backend.
+        threshold: Allowed relative deterioration of a stable metric, 0.25 is 25%.
+        noise_ms: Allowed absolute deterioration of a latency metric.
+        slowdown: Calibration time relative to the baseline calibration time (>= 1).
+
+    Returns:
+        Regression descriptions.
+    """
+    found = []
+
+    for backend, metrics in results.items():
+        for name, metric in metrics.items():
+            base = baseline.get(backend, {}).get(name)
+
+            if base is None:
+                continue
+
+            if metric['unit'] in HIGHER_IS_BETTER:
+                expected = base['value'] / slowdown
+                change = expected / metric['value'] - 1
+
+            else:
+                expected = base['value'] * slowdown
+                change = metric['value'] / expected - 1
+
+                if metric['value'] - expected <= noise_ms:
+                    continue
+
+            tolerance = threshold + SPREAD_FACTOR * base.get('spread', 0.0)
+
+            if change > tolerance:
+                found.append(f"{backend} {name}: {metric['value']:,.2f} {metric['unit']} "
+                             f"vs scaled baseline {expected:,.2f} ({change:.0%} worse, "
+                             f"tolerance {tolerance:.0%})")
+
+    return found
+
+
+# ---------------------------------------------------------
+#
+async def main(args: argparse.Namespace) -> int:
+    """ Run the suite and compare the result with the baseline (or save it).
+
+    Args:
+        args: Namespace object containing command line arguments.
+
+    Returns:
+        Process exit status, 1 when a regression is found.
+    """
+    samples = {backend: {} for backend in args.backend}
+    reference = []
+
+    for _ in range(args.runs):
+        for backend in args.backend:
+            reference += calibrate(args.repeat)
+
+            for name, metric in (await run_backend(backend, args)).items():
+                samples[backend].setdefault(name, {'samples': [], 'unit': metric['unit']})
+                samples[backend][name]['samples'] += metric['samples']
+
+            reference += calibrate(args.repeat)
+
+    calibration = statistics.median(reference)
+
+    results = {backend: {name: summary(metric['samples'], metric['unit'])
+                         for name, metric in metrics.items()}
+               for backend, metrics in samples.items()}
+
+    for backend, metrics in results.items():
+        for name, metric in metrics.items():
+            print(f"  {backend:<6} {name:<22} {metric['value']:12,.2f} {metric['unit']:<8} "
+                  f"(spread {metric['spread']:.0%})")
+
+    print(f"  calibration {calibration:,.2f} ms")
+
+    if args.save:
+        report = {'environment': {'python': platform.python_version(),
+                                  'machine': platform.machine(),
+                                  'processor': platform.processor(),
+                                  'cpus': os.cpu_count(),
+                                  'rows': args.rows,
+                                  'repeat': args.repeat,
+                                  'runs': args.runs,
+                                  'calibration_ms': calibration,
+                                  'note': args.note}, **results}
+        args.baseline.write_text(json.dumps(report, indent=2) + '\n')
+        print(f"Saved baseline in {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline in {args.baseline}, run with --save first.")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())
+    slowdown = max(1.0, calibration / baseline['environment'].get('calibration_ms',
+                                                                  calibration))
+    print(f"Host slowdown vs the baseline: {slowdown:.2f}x")
+    found = regressions(results, baseline, args.threshold, args.noise_ms, slowdown)
+
+    for item in found:
+        print(f"REGRESSION: {item}")
+
+    print(f"{len(found)} regression(s) beyond the tolerance of the baseline.")
+    return 1 if found else 0
+
+
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    Form = argparse.ArgumentDefaultsHelpFormatter
+    description = 'Benchmark the CRUD and route hot paths against a baseline.'
+    parser = argparse.ArgumentParser(description=description, formatter_class=Form)
+    parser.add_argument("--backend", nargs='+', choices=('memory', 'file'),
+                        default=['memory', 'file'], help="SQLite backends to measure.")
+    parser.add_argument("--rows", nargs='+', type=int, default=list(ROW_COUNTS),
+                        help="Table sizes for the count, update_state and read_all metrics.")
+    parser.add_argument("--repeat", type=int, default=7,
+                        help="Measurements per metric (the median is used).")
+    parser.add_argument("--runs", type=int, default=1,
+                        help="Runs with a new DB, their measurements are pooled.")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed relative deterioration of a stable metric.")
+    parser.add_argument("--noise-ms", type=float, default=1.0,
+                        help="Allowed absolute deterioration of a latency metric.")
+    parser.add_argument("--baseline", type=Path, default=BASELINE,
+                        help="Baseline results file.")
+    parser.add_argument("--save", action="store_true",
+                        help="Save the result as the new baseline instead of comparing.")
+    parser.add_argument("--note", default='',
+                        help="Description of the host and load, stored with a saved baseline.")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+```
+License: Apache 2.0
+
+VERSION INFO:
+    $Repo: fastapi_pytest
+  $Author: Anders Wiklund
+    $Date: 2024-12-11 19:51:22
+     $Rev: 20
+```
+
+An offline bulk loader that writes an SMS transfer batch (with documents)
+directly to the DB, without the HTTP and JSON round trips of the API.
+It's intended for backfills and migrations, when the API isn't running.
+
+The documents are read from an NDJSON file (memory-mapped), a CSV file
+(streamed), or they are generated the same way as insert_bigger_batch.py
+does it. They are written through ``SmsTransferCrud`` and
+``SmsDocumentCrud`` in large transactions, with a tunable SQLite pragma
+profile. An existing batch is only replaced (with all its documents)
+when ``--replace`` is specified.
+
+Examples:
+
+    python bulk_load.py --generate 412343 --synchronous OFF
+    python bulk_load.py --ndjson documents.ndjson --ubid 2a168739-...
+"""
+
+# BUILTIN modules
+import csv
+import sys
+import mmap
+import time
+import asyncio
+import argparse
+from uuid import uuid4
+from pathlib import Path
+from typing import Iterator
+from dataclasses import replace
+
+# Third party modules
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Local modules
+from app.core.config import config
+from insert_bigger_batch import generate_documents
+from app.sms_transfer.models import SmsTransferPayload
+from app.sms_document.models import document_item_adapter
+from app.sms_transfer.sms_transfer_crud import SmsTransferCrud
+from app.core.database import create_sqlite_engine, create_async_db_tables
+from app.sms_document.sms_document_crud import SmsDocumentCrud, UPSERT_CHUNK_SIZE
+
+# Constants
+TRANSACTION_SIZE = 100000
+""" Default number of documents per DB transaction. """
+
+
+# ---------------------------------------------------------
+#
+def read_ndjson(path: Path) -> Iterator[dict]:
+    """ Yield validated documents from a memory-mapped NDJSON file.
+
+    Args:
+        path: NDJSON file path, one document per line.
+
+    Yields:
+        Validated SMS document.
+    """
+    # An empty file can't be memory-mapped.
+    if path.stat().st_size == 0:
+        return
+
+    with open(path, 'rb') as hdl, mmap.mmap(hdl.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for line in iter(data.readline, b''):
+            if line.strip():
+                yield document_item_adapter.validate_json(line)
+
+
+# ---------------------------------------------------------
+#
+def read_csv(path: Path) -> Iterator[dict]:
+    """ Yield validated documents from a streamed CSV file.
+
+    The file needs a header row with the ``uniqueId`` and ``SMScount``
+    columns, all other columns are stored in the document ``data``.
+
+    Args:
+        path: CSV file path.
+
+    Yields:
+        Validated SMS document.
+    """
+    with open(path, newline='', encoding='utf-8') as hdl:
+        for row in csv.DictReader(hdl):
+            unique_id, sms_count = row.pop('uniqueId'), row.pop('SMScount')
+            yield document_item_adapter.validate_python(
+                {'uniqueId': unique_id, 'SMScount': sms_count, 'data': row})
+
+
+# ---------------------------------------------------------
+#
+def generate(count: int, ubid: str) -> Iterator[dict]:
+    """ Yield generated documents, the same ones as insert_bigger_batch.py sends.
+
+    Args:
+        count: Number of documents.
+        ubid: Unique Batch ID.
+
+    Yields:
+        SMS document.
+    """
+    for _, documents in generate_documents(count, ubid):
+        yield from documents
+
+
+# ---------------------------------------------------------
+#
+async def load(engine: AsyncEngine, args: argparse.Namespace) -> tuple:
+    """ Load the SMS transfer batch and its documents into the DB.
+
+    The transfer row is created in the first transaction, and its
+    totals are updated in the last one, since they are only known when
+    the whole input is read. Every transaction upserts up to
+    ``args.transaction_size`` documents. An existing batch is deleted
+    first (its documents are deleted by the DB cascade) when
+    ``args.replace`` is set.
+
+    Args:
+        engine: Used DB engine.
+        args: Namespace object containing command line arguments.
+
+    Returns:
+        Number of loaded documents, number of transactions.
+
+    Raises:
+        ValueError: When the batch exists and ``args.replace`` isn't set.
+    """
+    if args.ndjson:
+        documents, orig_name = read_ndjson(args.ndjson), args.ndjson.name
+
+    elif args.csv:
+        documents, orig_name = read_csv(args.csv), args.csv.name
+
+    else:
+        documents, orig_name = generate(args.generate, args.ubid), 'generated'
+
+    payload = SmsTransferPayload(UBID=args.ubid, SMScount=1, documents=1,
+                                 fileName=f'{args.ubid}.zip', origName=orig_name[:50])
+    count, sms_count, transactions, start = 0, 0, 0, time.perf_counter()
+
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        transfer_crud = SmsTransferCrud(session)
+        document_crud = SmsDocumentCrud(session)
+
+        if await transfer_crud.read(args.ubid):
+            if not args.replace:
+                raise ValueError(f"SMS transfer batch UBID '{args.ubid}' already "
+                                 f"exists, use --replace to replace it")
+
+            await transfer_crud.delete(args.ubid)
+
+        await transfer_crud.create(payload)
+        rows = []
+
+        for document in documents:
+            rows.append(document)
+
+            if len(rows) < args.transaction_size:
+                continue
+
+            await document_crud.upsert_rows(rows, args.chunk_size, args.ubid)
+            await session.commit()
+            count += len(rows)
+            sms_count += sum(row['SMScount'] for row in rows)
+            transactions += 1
+            rows = []
+            rate = count / (time.perf_counter() - start)
+            print(f"Loaded {count} documents ({rate:,.0f} rows/sec)...")
+
+        if rows:
+            await document_crud.upsert_rows(rows, args.chunk_size, args.ubid)
+            count += len(rows)
+            sms_count += sum(row['SMScount'] for row in rows)
+
+        await transfer_crud.update_totals(args.ubid, count, sms_count)
+        await session.commit()
+        transactions += 1
+
+    return count, transactions
+
+
+# ---------------------------------------------------------
+#
+async def main(args: argparse.Namespace) -> int:
+    """ Run the bulk load and print the throughput.
+
+    Args:
+        args: Namespace object containing command line arguments.
+
+    Returns:
+        Process exit status, 1 when the batch wasn't loaded.
+    """
+    pragmas = replace(config.sqlite, synchronous=args.synchronous,
+                      journal_mode=args.journal_mode, cache_size=args.cache_size)
+    engine = create_sqlite_engine(args.db_url, pragmas)
+    await create_async_db_tables(engine)
+
+    start = time.perf_counter()
+
+    try:
+        count, transactions = await load(engine, args)
+
+    except ValueError as why:
+        print(f"ERROR: {why}")
+        return 1
+
+    finally:
+        await engine.dispose()
+
+    elapsed = time.perf_counter() - start
+    print(f"Loaded {count} documents for UBID '{args.ubid}' in {transactions} "
+          f"transaction(s) in {elapsed:.2f} sec ({count / elapsed:,.0f} rows/sec).")
+    return 0
+
+
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    Form = argparse.ArgumentDefaultsHelpFormatter
+    description = 'Load an SMS transfer batch (with documents) directly into the DB.'
+    parser = argparse.ArgumentParser(description=description, formatter_class=Form)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--ndjson", type=Path, help="NDJSON document file.")
+    source.add_argument("--csv", type=Path, help="CSV document file.")
+    source.add_argument("--generate", type=int, metavar="COUNT",
+                        help="Number of documents to generate.")
+    parser.add_argument("--ubid", default=str(uuid4()), help="Unique Batch ID.")
+    parser.add_argument("--replace", action="store_true",
+                        help="Replace the batch (with all its documents) when it exists.")
+    parser.add_argument("--db-url", default=config.db_url, help="DB connection URL.")
+    parser.add_argument("--transaction-size", type=int, default=TRANSACTION_SIZE,
+                        help="Documents per DB transaction.")
+    parser.add_argument("--chunk-size", type=int, default=UPSERT_CHUNK_SIZE,
+                        help="Documents per UPSERT statement.")
+    parser.add_argument("--synchronous", default=config.sqlite.synchronous,
+                        choices=('OFF', 'NORMAL', 'FULL'), help="PRAGMA synchronous.")
+    parser.add_argument("--journal-mode", default=config.sqlite.journal_mode,
+                        choices=('WAL', 'DELETE', 'TRUNCATE', 'MEMORY', 'OFF'),
+                        help="PRAGMA journal_mode.")
+    parser.add_argument("--cache-size", type=int, default=config.sqlite.cache_size,
+                        help="PRAGMA cache_size (negative values are in KiB).")
+    sys.exit(asyncio.run(main(parser.parse_args())))
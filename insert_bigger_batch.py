@@ -12,13 +12,20 @@ VERSION INFO:
 """
 
 # BUILTIN modules
+import gzip
 import json
+import time
 import asyncio
+import random
 import argparse
+import statistics
 from uuid import uuid4
+from pathlib import Path
+from typing import List, NamedTuple, Set
 
 # Third party modules
-from httpx import AsyncClient
+import zstandard
+from httpx import AsyncClient, Limits, Timeout, TransportError
 
 # Local modules
 from app.sms_transfer.models import SmsTransferPayload
@@ -28,6 +35,101 @@ API_BATCH_LIMIT = 5000
 """ API request batch limit. """
 HDR_DATA = {"Content-Type": "application/json"}
 """ header data used for httpx requests. """
+RETRY_BACKOFF = 0.5
+""" Initial retry delay in seconds, it's doubled for every retry. """
+MAX_RETRY_AFTER = 60.0
+""" Max seconds to wait for a server Retry-After header. """
+CHECKPOINT_FILE = Path('insert_bigger_batch.checkpoint.json')
+""" Default checkpoint file with the acknowledged sub-batches per UBID. """
+
+
+# -----------------------------------------------------------------------------
+#
+class SubBatchResult(NamedTuple):
+    """ The outcome of one sub-batch upload. """
+    documents: int
+    raw_bytes: int
+    sent_bytes: int
+    latency: float
+    attempts: int
+    ok: bool
+
+
+# -----------------------------------------------------------------------------
+#
+class Checkpoint:
+    """ A local file with the acknowledged sub-batch IDs per UBID.
+
+    The file is rewritten (atomically) every time a sub-batch is
+    acknowledged, so it survives a crash of the script. A UBID is
+    removed from the file when all its sub-batches are acknowledged.
+
+    Attributes:
+        path: Checkpoint file path.
+        batches: Batch size and acknowledged sub-batch IDs per UBID.
+    """
+
+    def __init__(self, path: Path):
+        """ The class constructor.
+
+        Args:
+            path: Checkpoint file path.
+        """
+        self.path = path
+        self.batches = json.loads(path.read_text()) if path.exists() else {}
+
+    # ---------------------------------------------------------
+    #
+    def batch_size(self, ubid: str) -> int | None:
+        """ Return the checkpointed batch size of the UBID, or None when unknown.
+
+        Args:
+            ubid: Unique Batch ID.
+        """
+        return self.batches.get(ubid, {}).get('batch_size')
+
+    # ---------------------------------------------------------
+    #
+    def acked(self, ubid: str) -> Set[int]:
+        """ Return the acknowledged sub-batch IDs of the UBID.
+
+        Args:
+            ubid: Unique Batch ID.
+        """
+        return set(self.batches.get(ubid, {}).get('acked', []))
+
+    # ---------------------------------------------------------
+    #
+    def ack(self, ubid: str, batch_size: int, batch_id: int):
+        """ Save the acknowledged sub-batch ID.
+
+        Args:
+            ubid: Unique Batch ID.
+            batch_size: Size of the batch.
+            batch_id: Acknowledged sub-batch ID.
+        """
+        batch = self.batches.setdefault(ubid, {'batch_size': batch_size, 'acked': []})
+        batch['acked'] = sorted(set(batch['acked']) | {batch_id})
+        self._save()
+
+    # ---------------------------------------------------------
+    #
+    def done(self, ubid: str):
+        """ Remove the completed UBID from the checkpoint file.
+
+        Args:
+            ubid: Unique Batch ID.
+        """
+        if self.batches.pop(ubid, None) is not None:
+            self._save()
+
+    # ---------------------------------------------------------
+    #
+    def _save(self):
+        """ Write the checkpoint file atomically. """
+        tmp = self.path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(self.batches, indent=2))
+        tmp.replace(self.path)
 
 
 # ---------------------------------------------------------
@@ -66,7 +168,62 @@ async def create_and_insert_batch_transfer(batch_size: int) -> str:
 
 # ---------------------------------------------------------
 #
-def generate_documents(batch_size: int, ubid: str) -> tuple:
+async def read_stored_batches(client: AsyncClient, ubid: str, batch_size: int) -> Set[int]:
+    """ Return the sub-batch IDs that are already completely stored in the DB.
+
+    The stored uniqueId ranges of the batch are read from the server,
+    which covers sub-batches that were stored, but not checkpointed,
+    before the script died.
+
+    Args:
+        client: Request client.
+        ubid: Unique Batch ID.
+        batch_size: Size of the batch.
+
+    Returns:
+        Completely stored sub-batch IDs.
+    """
+    url = f'http://localhost:7000/tracking/sms_documents/{ubid}/ranges/'
+    response = await client.get(url=url)
+
+    if response.status_code == 404:
+        return set()
+
+    response.raise_for_status()
+    stored = set()
+
+    for item in response.json()['ranges']:
+        first_batch = (item['first'] - 1) // API_BATCH_LIMIT + 1
+        last_batch = (item['last'] - 1) // API_BATCH_LIMIT + 1
+
+        for batch in range(first_batch, last_batch + 1):
+            first, last = sub_batch_limits(batch, batch_size)
+
+            if item['first'] <= first and last <= item['last']:
+                stored.add(batch)
+
+    return stored
+
+
+# ---------------------------------------------------------
+#
+def sub_batch_limits(batch: int, batch_size: int) -> tuple:
+    """ Return the first and last document ID of the sub-batch.
+
+    Args:
+        batch: Sub-batch ID.
+        batch_size: Size of the batch.
+
+    Returns:
+        First document ID, last document ID.
+    """
+    first = (batch - 1) * API_BATCH_LIMIT + 1
+    return first, min(batch * API_BATCH_LIMIT, batch_size)
+
+
+# ---------------------------------------------------------
+#
+def generate_documents(batch_size: int, ubid: str, skip: Set[int] = frozenset()) -> tuple:
     """ Generate sub-batches that adhere to the API batch limit.
 
     Note that this is a generator, which reduces memory footprint
@@ -75,61 +232,233 @@ def generate_documents(batch_size: int, ubid: str) -> tuple:
     Args:
         batch_size: Requested batch size
         ubid: Unique Batch ID.
+        skip: Sub-batch IDs that are not generated (already stored).
 
     Returns:
         SMS documents assigned to sub-batches
         that match the API batch limit.
     """
-    batch = 1
-    documents = []
+    batches = (batch_size + API_BATCH_LIMIT - 1) // API_BATCH_LIMIT
+
+    for batch in range(1, batches + 1):
+        if batch in skip:
+            continue
+
+        documents = []
+        first, last = sub_batch_limits(batch, batch_size)
+
+        for docid in range(first, last + 1):
+            key = f'{docid:010}'
+            document = {
+                "SMScount": 1,
+                "uniqueId": key,
+                "data": {
+                    "source": "DentalCare",
+                    "refId": f"{ubid}.{key}",
+                    "destination": f"+01708{key}",
+                    "userData": "Welcome to your..."}}
+            documents.append(document)
+
+        yield batch, documents
+
+
+# ---------------------------------------------------------
+#
+def encode_body(body: bytes, compress: str) -> tuple:
+    """ Return the request body and headers for the specified compression.
+
+    Args:
+        body: JSON encoded SMS message data.
+        compress: Content-Encoding to use (none, gzip or zstd).
+
+    Returns:
+        Request body, request headers.
+    """
+    if compress == 'gzip':
+        return gzip.compress(body, compresslevel=6), {**HDR_DATA, "Content-Encoding": "gzip"}
+
+    if compress == 'zstd':
+        body = zstandard.ZstdCompressor(level=3).compress(body)
+        return body, {**HDR_DATA, "Content-Encoding": "zstd"}
+
+    return body, HDR_DATA
+
+
+# ---------------------------------------------------------
+#
+def non_negative_int(value: str) -> int:
+    """ Return the command line argument as an int that is >= 0.
+
+    Args:
+        value: Command line argument value.
+
+    Raises:
+        argparse.ArgumentTypeError: When the value isn't an int >= 0.
+    """
+    try:
+        number = int(value)
+
+    except ValueError:
+        number = -1
+
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"{value!r} is not an integer >= 0")
+
+    return number
+
+
+# ---------------------------------------------------------
+#
+def positive_int(value: str) -> int:
+    """ Return the command line argument as an int that is > 0.
+
+    Args:
+        value: Command line argument value.
+
+    Raises:
+        argparse.ArgumentTypeError: When the value isn't an int > 0.
+    """
+    try:
+        number = int(value)
+
+    except ValueError:
+        number = 0
+
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value!r} is not an integer > 0")
+
+    return number
+
+
+# ---------------------------------------------------------
+#
+def retry_delay(attempt: int, retry_after: str | None = None) -> float:
+    """ Return the seconds to wait before the next attempt.
+
+    A numeric Retry-After header (sent with a 503 by the server admission
+    control) is used when it's available, otherwise an exponential
+    backoff (with some jitter).
+
+    Args:
+        attempt: Number of the failed attempt (1 for the first).
+        retry_after: Retry-After header value of the failed response.
 
-    for idx in range(batch_size):
-        docid = idx + 1
-        key = f'{docid:010}'
+    Returns:
+        Delay in seconds.
+    """
+    try:
+        seconds = float(retry_after)
 
-        if idx > 0 and idx % API_BATCH_LIMIT == 0:
-            yield batch, documents
-            documents = []
-            batch += 1
+    except (TypeError, ValueError):
+        seconds = -1.0
 
-        document = {
-            "SMScount": 1,
-            "uniqueId": key,
-            "data": {
-                "source": "DentalCare",
-                "refId": f"{ubid}.{key}",
-                "destination": f"+01708{key}",
-                "userData": "Welcome to your..."}}
-        documents.append(document)
+    if 0 <= seconds:
+        return min(seconds, MAX_RETRY_AFTER)
 
-    # Return remaining documents that are
-    # left after the last iteration.
-    yield batch, documents
+    return RETRY_BACKOFF * 2 ** (attempt - 1) * random.uniform(0.8, 1.2)
 
 
 # ---------------------------------------------------------
 #
-async def send_sms_batch_documents(client: AsyncClient, batch_id: int, payload: dict):
+async def send_sms_batch_documents(client: AsyncClient, batch_id: int,
+                                   payload: dict, args: argparse.Namespace) -> SubBatchResult:
     """
     Insert an SMS sub-batch of documents in DB table
     tracking.sms_documents.
 
+    Transient failures (a 5xx status, a timeout or a connection error)
+    are retried after the Retry-After seconds of the response, or with an
+    exponential backoff (and some jitter), other failures are reported
+    immediately.
+
     Args:
         client: Request response.
         batch_id: Sub-batch ID.
         payload: SMS message data.
+        args: Namespace object containing command line arguments.
+
+    Returns:
+        The sub-batch upload outcome.
     """
     url = 'http://localhost:7000/tracking/sms_documents/'
-    response = await client.post(url=url, json=payload, headers=HDR_DATA)
+    raw_body = json.dumps(payload).encode()
+    body, headers = encode_body(raw_body, args.compress)
+    start = time.perf_counter()
+    attempt, ok, errmsg = 0, False, ''
+
+    while attempt <= args.retries:
+        attempt += 1
+        retry_after = None
+
+        try:
+            response = await client.post(url=url, content=body, headers=headers)
+
+        except TransportError as why:
+            errmsg = f"{type(why).__name__} {why}"
+
+        else:
+            if response.status_code == 201:
+                ok = True
+                print(f"Sent sub-batch {batch_id:02} of documents "
+                      f"with response: {response.json()['result']}")
+                break
+
+            errmsg = f"status code {response.status_code} => {response.text}"
+
+            if response.status_code < 500:
+                break
+
+            retry_after = response.headers.get('Retry-After')
+
+        if attempt <= args.retries:
+            delay = retry_delay(attempt, retry_after)
+            print(f"WARNING: Retrying sub-batch {batch_id:02} in {delay:.2f} sec "
+                  f"after {errmsg}.")
+            await asyncio.sleep(delay)
+
+    if not ok:
+        print(f"ERROR: Failed to create sub-batch {batch_id:02} of documents "
+              f"after {attempt} attempt(s) with {errmsg}.")
 
-    if response.status_code == 201:
-        print(f"Sent sub-batch {batch_id:02} of documents "
-              f"with response: {response.json()['result']}")
+    return SubBatchResult(documents=len(payload['documents']), raw_bytes=len(raw_body),
+                          sent_bytes=len(body), latency=time.perf_counter() - start,
+                          attempts=attempt, ok=ok)
+
+
+# ---------------------------------------------------------
+#
+def report(results: List[SubBatchResult], elapsed: float, compress: str):
+    """ Print the throughput, latency and bandwidth of the document upload.
+
+    Args:
+        results: Sub-batch upload outcomes.
+        elapsed: Wall time of the document upload in seconds.
+        compress: Content-Encoding that was used.
+    """
+    if not results:
+        print("Nothing to upload, all sub-batches are already stored.")
+        return
+
+    sent = sum(item.documents for item in results if item.ok)
+    failed = sum(item.documents for item in results if not item.ok)
+    retries = sum(item.attempts - 1 for item in results)
+    raw_bytes = sum(item.raw_bytes for item in results)
+    sent_bytes = sum(item.sent_bytes for item in results)
+    latencies = [item.latency * 1000 for item in results]
+
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
 
     else:
-        print(f"ERROR: Failed to create sub-batch {batch_id:02} of "
-              f"documents with status code {response.status_code} => "
-              f"{response.json()['detail']}.")
+        p50 = p95 = p99 = latencies[0]
+
+    print(f"Uploaded {sent} documents in {len(results)} sub-batches in "
+          f"{elapsed:.2f} sec ({sent / elapsed:,.0f} docs/sec), "
+          f"{failed} failed documents, {retries} retries.")
+    print(f"Sub-batch latency: p50={p50:.0f} ms, p95={p95:.0f} ms, p99={p99:.0f} ms.")
+    print(f"Compression={compress}: sent {sent_bytes / 2**20:.2f} MiB of "
+          f"{raw_bytes / 2**20:.2f} MiB ({sent_bytes / raw_bytes:.1%}).")
 
 
 # ---------------------------------------------------------
@@ -140,17 +469,86 @@ async def creator(args: argparse.Namespace):
     This method can handle any specified batch size since it will
     create sub-batches to adhere to the API batch limit.
 
+    Up to ``args.concurrency`` sub-batches are in flight at the same
+    time over a shared keep-alive client. The semaphore is acquired
+    before the next sub-batch is generated, so the memory footprint
+    is also bounded to that number of sub-batches.
+
+    Every acknowledged sub-batch is saved in the checkpoint file. An
+    interrupted upload is resumed with ``args.resume`` set to its UBID,
+    then only the sub-batches that are neither checkpointed nor
+    completely stored in the DB are sent. Re-sending stored documents
+    would reset their ``state`` and ``when`` values.
+
+    The throughput, sub-batch latency percentiles and the uploaded
+    (and uncompressed) bytes are reported at the end.
+
     Args:
         args: Namespace object containing command line arguments.
+
+    Raises:
+        RuntimeError: When the resumed batch size differs from the checkpoint.
     """
-    ubid = await create_and_insert_batch_transfer(args.batch_size)
+    checkpoint = Checkpoint(args.checkpoint)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    limits = Limits(max_connections=args.concurrency,
+                    max_keepalive_connections=args.concurrency)
+    tasks = []
 
-    async with AsyncClient() as client:
-        for batch_id, documents in generate_documents(args.batch_size, ubid):
+    # ---------------------------------
+
+    async def send(batch_id: int, documents: list) -> SubBatchResult:
+        """ Send the sub-batch and release its semaphore slot. """
+        try:
             payload = {"UBID": ubid, "documents": documents}
-            await asyncio.create_task(
-                send_sms_batch_documents(client, batch_id, payload)
-            )
+            result = await send_sms_batch_documents(client, batch_id, payload, args)
+
+            if result.ok:
+                checkpoint.ack(ubid, args.batch_size, batch_id)
+
+            return result
+
+        finally:
+            semaphore.release()
+
+    # ---------------------------------
+
+    async with AsyncClient(limits=limits, timeout=Timeout(args.timeout)) as client:
+        if args.resume:
+            ubid = args.resume
+            checkpointed = checkpoint.batch_size(ubid)
+
+            if checkpointed not in (None, args.batch_size):
+                raise RuntimeError(f"UBID '{ubid}' was checkpointed with batch "
+                                   f"size {checkpointed}, not {args.batch_size}")
+
+            skip = checkpoint.acked(ubid)
+            skip |= await read_stored_batches(client, ubid, args.batch_size)
+            print(f"Resuming UBID '{ubid}', skipping {len(skip)} stored sub-batch(es).")
+
+        else:
+            ubid = await create_and_insert_batch_transfer(args.batch_size)
+            skip = set()
+
+        start = time.perf_counter()
+        batches = generate_documents(args.batch_size, ubid, skip)
+
+        while True:
+            await semaphore.acquire()
+            batch = next(batches, None)
+
+            if batch is None:
+                semaphore.release()
+                break
+
+            tasks.append(asyncio.create_task(send(*batch)))
+
+        results = await asyncio.gather(*tasks)
+
+    if all(item.ok for item in results):
+        checkpoint.done(ubid)
+
+    report(results, time.perf_counter() - start, args.compress)
 
 
 # ---------------------------------------------------------
@@ -160,5 +558,17 @@ if __name__ == "__main__":
     description = 'A utility script that let you create bigger SMS transfer batches.'
     parser = argparse.ArgumentParser(description=description, formatter_class=Form)
     parser.add_argument("batch_size", type=int, help="Specify batch size to create.")
+    parser.add_argument("--compress", choices=('none', 'gzip', 'zstd'), default='none',
+                        help="Content-Encoding of the document uploads.")
+    parser.add_argument("--concurrency", type=positive_int, default=4,
+                        help="Max number of sub-batches in flight.")
+    parser.add_argument("--retries", type=non_negative_int, default=3,
+                        help="Max retries of a sub-batch after a transient failure.")
+    parser.add_argument("--timeout", type=float, default=60.0,
+                        help="Request timeout in seconds.")
+    parser.add_argument("--resume", metavar="UBID",
+                        help="Resume an interrupted upload of this batch.")
+    parser.add_argument("--checkpoint", type=Path, default=CHECKPOINT_FILE,
+                        help="Checkpoint file with the acknowledged sub-batches.")
     arguments = parser.parse_args()
     asyncio.run(creator(arguments))
@@ -9,13 +9,42 @@ VERSION INFO:
     $Date: 2024-04-22 16:14:44
      $Rev: 1
 ```
+
+Start the service, with one or more server processes (see the server
+parameters in ``config``), like this:
+
+    TRACKING_WORKERS=4 python run.py
+
+Every worker process has its own DB connection pools, write coalescer and
+ingestion job workers. They share the SQLite DB file, where WAL mode lets
+the readers run concurrently with the writer, and the writers wait for
+each other (up to ``busy_timeout``) instead of failing. Ingestion jobs are
+claimed atomically, so a job is only run by one process.
+
+Note that the service metrics and query statistics are per process.
 """
 
+# BUILTIN modules
+import asyncio
+
 # Third party modules
 import uvicorn
 
 # Local modules
 from app.main import app, config
+from app.core.database import create_async_db_tables, close_async_db
+
+
+# ---------------------------------------------------------
+#
+async def prepare_db():
+    """ Create the DB (in WAL mode), tables and indexes before the workers start.
+
+    Otherwise, all the worker processes would try to create them at the
+    same time.
+    """
+    await create_async_db_tables()
+    await close_async_db()
 
 
 # ---------------------------------------------------------
@@ -23,9 +52,18 @@ from app.main import app, config
 def main():
     """ Start uvicorn program. """
     uv_config = {'log_level': config.log_level,
-                 'app': 'app.main:app', 'port': 7000, 'reload': False,
+                 'app': 'app.main:app', 'reload': False,
+                 'host': config.host, 'port': config.port,
+                 'workers': config.workers, 'loop': config.loop,
+                 'http': config.http, 'backlog': config.backlog,
+                 'timeout_keep_alive': config.keep_alive,
                  'log_config': {"disable_existing_loggers": False, "version": 1}}
-    app.logger.info(f'{config.name} v{config.version} is initializing...')
+    app.logger.info(f'{config.name} v{config.version} is initializing '
+                    f'({config.workers} worker process(es))...')
+
+    if config.workers > 1:
+        asyncio.run(prepare_db())
+
     uvicorn.run(**uv_config)
 
 